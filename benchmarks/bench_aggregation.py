@@ -0,0 +1,65 @@
+"""
+Time to fold N encoded registries into one with a L{RegistryAggregator}.
+
+Each worker registry has 200 counters, 50 meters, 50 biased timers and 20
+uniform histograms with full reservoirs. "decode (ms)" only decodes the
+inputs, as a baseline; "aggregate (ms)" decodes and merges them, and
+"per input (ms)" is the cost of one more input.
+
+    $ PYTHONPATH=. python benchmarks/bench_aggregation.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from random import random
+from timeit import default_timer
+
+from yunomi.core.aggregator import RegistryAggregator
+from yunomi.core.metrics_registry import MetricsRegistry
+
+
+def worker():
+    registry = MetricsRegistry()
+    for i in range(200):
+        registry.counter("service.jobs.%d" % i).inc(i)
+    for i in range(50):
+        registry.meter("service.requests.%d" % i).mark(i)
+        registry.timer("service.latency.%d" % i).update_many(
+            [int(random() * 1e8) for _ in range(2000)])
+    for i in range(20):
+        registry.histogram("service.sizes.%d" % i).update_many(
+            [random() * 1e4 for _ in range(2000)])
+    return registry.serialize()
+
+
+def timed(function):
+    start = default_timer()
+    function()
+    return default_timer() - start
+
+
+def decode(inputs):
+    for data in inputs:
+        MetricsRegistry.deserialize(data)
+
+
+def aggregate(inputs):
+    aggregator = RegistryAggregator()
+    for data in inputs:
+        aggregator.add(data)
+    return aggregator.flush()
+
+
+def main():
+    workers = [worker() for _ in range(10)]
+    print("{0:>8} {1:>14} {2:>16} {3:>16}".format(
+        "inputs", "decode (ms)", "aggregate (ms)", "per input (ms)"))
+    for n in (10, 100, 500):
+        inputs = [workers[i % len(workers)] for i in range(n)]
+        decoded = timed(lambda: decode(inputs))
+        aggregated = timed(lambda: aggregate(inputs))
+        print("{0:>8} {1:>14.1f} {2:>16.1f} {3:>16.2f}".format(
+            n, decoded * 1e3, aggregated * 1e3, aggregated * 1e3 / n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Counter throughput under contention from 1 to 32 threads.
+
+"locked" is a plain L{Counter} guarded by one shared lock, which is what
+callers had to do to avoid losing increments; "striped" is a
+L{StripedCounter}.
+
+    $ PYTHONPATH=. python benchmarks/bench_counter_contention.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from threading import Lock, Thread
+from timeit import default_timer
+
+from yunomi.core.counter import Counter, StripedCounter
+
+INCREMENTS = 200000
+
+
+def locked_inc(counter, lock, n):
+    for _ in range(n):
+        with lock:
+            counter.inc()
+
+
+def striped_inc(counter, n):
+    for _ in range(n):
+        counter.inc()
+
+
+def run(threads, target, *args):
+    per_thread = INCREMENTS // threads
+    workers = [Thread(target=target, args=args + (per_thread,))
+               for _ in range(threads)]
+    start = default_timer()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = default_timer() - start
+    return per_thread * threads / elapsed
+
+
+def main():
+    print("{0:>8} {1:>16} {2:>16} {3:>10}".format(
+        "threads", "locked (ops/s)", "striped (ops/s)", "lost"))
+    for threads in (1, 2, 4, 8, 16, 32):
+        locked = run(threads, locked_inc, Counter(), Lock())
+        striped_counter = StripedCounter()
+        striped = run(threads, striped_inc, striped_counter)
+        expected = (INCREMENTS // threads) * threads
+        print("{0:>8} {1:>16,.0f} {2:>16,.0f} {3:>10}".format(
+            threads, locked, striped,
+            expected - striped_counter.get_count()))
+
+
+if __name__ == "__main__":
+    main()
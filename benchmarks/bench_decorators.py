@@ -0,0 +1,55 @@
+"""
+Per-call overhead of the call-tracking decorators over an undecorated
+function, and of looking the metric up on every call, as they used to.
+
+    $ PYTHONPATH=. python benchmarks/bench_decorators.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from functools import wraps
+from timeit import default_timer
+
+from yunomi.core.metrics_registry import MetricsRegistry
+
+CALLS = 200000
+
+
+def per_call(fn):
+    start = default_timer()
+    for i in range(CALLS):
+        fn(i)
+    return (default_timer() - start) / CALLS * 1e9
+
+
+def lookup_every_call(registry, fn):
+    @wraps(fn)
+    def wrapper(*args):
+        registry.counter("%s_calls" % fn.__name__).inc()
+        try:
+            return fn(*args)
+        except:
+            raise
+    return wrapper
+
+
+def main():
+    registry = MetricsRegistry()
+
+    def body(i):
+        return i
+
+    baseline = per_call(body)
+    print("{0:<28} {1:8.0f} ns/call".format("undecorated", baseline))
+    for name, decorated in (
+            ("count_calls, old lookup", lookup_every_call(registry, body)),
+            ("count_calls", registry.count_calls(body)),
+            ("meter_calls", registry.meter_calls(body)),
+            ("hist_calls", registry.hist_calls(body)),
+            ("time_calls", registry.time_calls(body))):
+        cost = per_call(decorated)
+        print("{0:<28} {1:8.0f} ns/call  (+{2:.0f} ns)".format(
+            name, cost, cost - baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Scraping a registry of 20k timers: L{MetricsRegistry.dump_metrics} against
+streaming L{MetricsRegistry.iter_metrics}, with every stat and with only two.
+
+    $ PYTHONPATH=. python benchmarks/bench_dump_metrics.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from timeit import default_timer
+
+from yunomi.core.metrics_registry import MetricsRegistry
+
+TIMERS = 20000
+
+
+def timed(fn):
+    start = default_timer()
+    fn()
+    return (default_timer() - start) * 1e3
+
+
+def consume(iterator):
+    for _ in iterator:
+        pass
+
+
+def main():
+    registry = MetricsRegistry()
+    for i in range(TIMERS):
+        timer = registry.timer("timer.{0}".format(i))
+        for j in range(10):
+            timer.update(j)
+
+    print("dump_metrics():            {0:8.1f} ms".format(
+        timed(registry.dump_metrics)))
+    print("iter_metrics():            {0:8.1f} ms".format(
+        timed(lambda: consume(registry.iter_metrics()))))
+    print("iter_metrics(two suffixes): {0:7.1f} ms".format(
+        timed(lambda: consume(registry.iter_metrics(
+            set(["99_percentile", "1m_rate"]))))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Cost of MetricsRegistry.evict_idle(), which PrometheusExporter runs on every
+scrape, against the size of the registry.
+
+Each registry has as many counters, meters and timers, of which one in ten
+is updated between passes. "pass (ms)" finds nothing to evict; "evict (ms)"
+is the pass evicting the other nine in ten.
+
+    $ PYTHONPATH=. python benchmarks/bench_eviction.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from timeit import default_timer
+
+from yunomi.core.metrics_registry import MetricsRegistry
+
+
+class Clock(object):
+    now = 0.0
+
+    def seconds(self):
+        return self.now
+
+    def nanoseconds(self):
+        return int(self.now * 1e9)
+
+
+def registry(clock, n):
+    registry = MetricsRegistry(clock=clock, idle_timeout=60)
+    for i in range(n // 3):
+        registry.counter("jobs.%d" % i)
+        registry.meter("requests.%d" % i)
+        registry.timer("latency.%d" % i)
+    return registry
+
+
+def touch(registry, n):
+    for i in range(0, n // 3, 10):
+        registry.counter("jobs.%d" % i).inc()
+        registry.meter("requests.%d" % i).mark()
+        registry.timer("latency.%d" % i).update(1000)
+
+
+def timed(function):
+    start = default_timer()
+    function()
+    return default_timer() - start
+
+
+def main():
+    print("{0:>8} {1:>10} {2:>10}".format("metrics", "pass (ms)",
+                                          "evict (ms)"))
+    for n in (3000, 30000, 300000):
+        clock = Clock()
+        metrics = registry(clock, n)
+        metrics.evict_idle()
+        clock.now += 30
+        touch(metrics, n)
+        passed = timed(metrics.evict_idle)
+        clock.now += 30
+        evicted = timed(metrics.evict_idle)
+        print("{0:>8} {1:>10.1f} {2:>10.1f}".format(
+            n, passed * 1e3, evicted * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Worst-case L{ExponentiallyDecayingSample.update} latency, i.e. the update
+which happens to trigger an hourly rescale.
+
+"sorted dict" is the rescale as it used to be: sort every key, delete it and
+reinsert it with its new priority. "single pass" multiplies every priority by
+one factor. "background" calls L{ExponentiallyDecayingSample.rescale} before
+the threshold, so the update itself never rescales.
+
+    $ PYTHONPATH=. python benchmarks/bench_exp_decay_rescale.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from math import exp
+from timeit import default_timer
+
+from yunomi.stats.exp_decay_sample import ExponentiallyDecayingSample
+
+
+class Clock(object):
+    now = 0.0
+
+    def seconds(self):
+        return self.now
+
+
+class SortedDictRescaleSample(ExponentiallyDecayingSample):
+    """
+    A sample which rescales by rebuilding a dict, like it used to.
+    """
+    def _rescale(self, now, next_):
+        if self.next_scale_time == next_:
+            self.next_scale_time = now + self.RESCALE_THRESHOLD
+            old_start_time = self.start_time
+            self.start_time = self.clock.seconds()
+            values = dict(self.values)
+            for key in sorted(values.keys()):
+                value = values[key]
+                del values[key]
+                values[key * exp(-self.alpha * (self.start_time - old_start_time))] = value
+            self.values = list(values.items())
+            self.count = len(self.values)
+
+
+def worst_update(klass, size, background=False, rounds=20):
+    clock = Clock()
+    sample = klass(size, 0.015, clock.seconds)
+    for i in range(size):
+        sample.update(i)
+
+    worst = 0.0
+    for _ in range(rounds):
+        clock.now += sample.RESCALE_THRESHOLD
+        if background:
+            sample.rescale()
+        start = default_timer()
+        sample.update(1)
+        worst = max(worst, default_timer() - start)
+    return worst
+
+
+def main():
+    print("{0:>8} {1:>17} {2:>17} {3:>17}".format(
+        "size", "sorted dict (us)", "single pass (us)", "background (us)"))
+    for size in (1028, 4096, 16384, 65536):
+        print("{0:>8} {1:>17.1f} {2:>17.1f} {3:>17.1f}".format(
+            size,
+            worst_update(SortedDictRescaleSample, size) * 1e6,
+            worst_update(ExponentiallyDecayingSample, size) * 1e6,
+            worst_update(ExponentiallyDecayingSample, size, True) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
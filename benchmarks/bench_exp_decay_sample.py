@@ -0,0 +1,67 @@
+"""
+Microbenchmark for updates into a full L{ExponentiallyDecayingSample}.
+
+Compares the heap-backed reservoir against the previous dict-backed one, which
+scanned the whole reservoir with C{min()} on every update.
+
+    $ PYTHONPATH=. python benchmarks/bench_exp_decay_sample.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from math import exp
+from random import random
+from timeit import default_timer
+
+from yunomi.stats.exp_decay_sample import ExponentiallyDecayingSample
+
+
+class DictReservoir(object):
+    """
+    The reservoir update as it was before it became a heap.
+    """
+    def __init__(self, reservoir_size, alpha):
+        self.reservoir_size = reservoir_size
+        self.alpha = alpha
+        self.count = 0
+        self.values = {}
+
+    def update(self, value, timestamp=0):
+        priority = exp(self.alpha * timestamp) / random()
+        self.count += 1
+        if self.count <= self.reservoir_size:
+            self.values[priority] = value
+        else:
+            first = min(self.values)
+            if first < priority:
+                if priority not in self.values:
+                    self.values[priority] = value
+                    while first not in self.values:
+                        first = min(self.values)
+                    del self.values[first]
+
+
+def time_updates(sample, updates):
+    start = default_timer()
+    for i in range(updates):
+        sample.update(i, 1)
+    return (default_timer() - start) / updates
+
+
+def main():
+    print("{0:>8} {1:>14} {2:>14} {3:>9}".format(
+        "size", "dict (us/op)", "heap (us/op)", "speedup"))
+    for size in (1024, 4096, 16384, 65536):
+        old = DictReservoir(size, 0.015)
+        new = ExponentiallyDecayingSample(size, 0.015, clock=lambda: 0)
+        for sample in old, new:
+            for i in range(size):
+                sample.update(i, 1)
+
+        old_time = time_updates(old, max(100, 2000000 // size))
+        new_time = time_updates(new, 100000)
+        print("{0:>8} {1:>14.2f} {2:>14.2f} {3:>8.1f}x".format(
+            size, old_time * 1e6, new_time * 1e6, old_time / new_time))
+
+
+if __name__ == "__main__":
+    main()
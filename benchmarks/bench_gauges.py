@@ -0,0 +1,78 @@
+"""
+Cost on the hot path of tracking the depth of a queue, per change, and the
+cost of reading it when the registry is dumped.
+
+"counter" increments and decrements a counter on every change, as was done
+before gauges existed; "gauge" sets a L{Gauge}; "callback gauge" does
+nothing on changes, and calls its function when dumped, every time or, with
+a TTL, once per interval.
+
+    $ PYTHONPATH=. python benchmarks/bench_gauges.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from collections import deque
+from timeit import default_timer
+
+from yunomi.core.metrics_registry import MetricsRegistry
+
+N = 500000
+DUMPS = 1000
+
+
+def timed(function):
+    start = default_timer()
+    function()
+    return default_timer() - start
+
+
+def with_counter(registry, queue):
+    counter = registry.counter("depth")
+    for i in range(N):
+        queue.append(i)
+        counter.inc()
+        queue.popleft()
+        counter.dec()
+
+
+def with_gauge(registry, queue):
+    gauge = registry.gauge("depth")
+    for i in range(N):
+        queue.append(i)
+        gauge.set(len(queue))
+        queue.popleft()
+        gauge.set(len(queue))
+
+
+def with_callback(registry, queue):
+    for i in range(N):
+        queue.append(i)
+        queue.popleft()
+
+
+def dumps(registry):
+    for _ in range(DUMPS):
+        registry.dump_metrics()
+
+
+def main():
+    print("{0:>22} {1:>12} {2:>12}".format("", "ns/change", "us/dump"))
+    for name, record, options in (
+            ("counter", with_counter, None),
+            ("gauge", with_gauge, None),
+            ("callback gauge", with_callback, {"ttl": None}),
+            ("callback gauge, ttl", with_callback, {"ttl": 60})):
+        registry, queue = MetricsRegistry(), deque()
+        if options is not None:
+            registry.gauge("depth", callback=lambda: len(queue), **options)
+        # The queue operations alone are the baseline subtracted.
+        baseline = timed(lambda: with_callback(MetricsRegistry(), deque()))
+        recorded = timed(lambda: record(registry, queue))
+        dumped = timed(lambda: dumps(registry))
+        print("{0:>22} {1:>12.0f} {2:>12.1f}".format(
+            name, (recorded - baseline) * 1e9 / (2 * N),
+            dumped * 1e6 / DUMPS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Throughput of N threads updating one histogram, and whether the standard
+deviation survives it.
+
+"Histogram" is updated without any synchronization, so concurrent updates
+may interleave and corrupt its running variance; "Histogram + Lock" takes a
+lock around each update; "StripedHistogram" records into a shard per thread.
+The error is the relative difference between the reported standard deviation
+and the one of the values recorded.
+
+    $ PYTHONPATH=. python benchmarks/bench_histogram_threads.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from math import sqrt
+from random import random
+from threading import Lock, Thread
+from timeit import default_timer
+
+from yunomi.core.histogram import Histogram, StripedHistogram
+
+UPDATES = 200000
+
+
+class LockedHistogram(object):
+
+    def __init__(self):
+        self.histogram = Histogram.get_uniform()
+        self.lock = Lock()
+
+    def update(self, value):
+        with self.lock:
+            self.histogram.update(value)
+
+    def get_std_dev(self):
+        return self.histogram.get_std_dev()
+
+
+def std_dev(values):
+    mean = sum(values) / len(values)
+    return sqrt(sum([(value - mean) ** 2 for value in values]) /
+                (len(values) - 1))
+
+
+def run(histogram, batches):
+    def record(batch):
+        update = histogram.update
+        for value in batch:
+            update(value)
+
+    threads = [Thread(target=record, args=(batch,)) for batch in batches]
+    start = default_timer()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return default_timer() - start
+
+
+def main():
+    print("{0:>8} {1:<18} {2:>14} {3:>12}".format(
+        "threads", "histogram", "updates/s", "std_dev err"))
+    for threads in (1, 4, 16):
+        per_thread = UPDATES // threads
+        batches = [[random() * 1000 for _ in range(per_thread)]
+                   for _ in range(threads)]
+        expected = std_dev([value for batch in batches for value in batch])
+        for name, factory in [("Histogram", Histogram.get_uniform),
+                              ("Histogram + Lock", LockedHistogram),
+                              ("StripedHistogram", StripedHistogram)]:
+            histogram = factory()
+            elapsed = run(histogram, batches)
+            error = abs(histogram.get_std_dev() - expected) / expected
+            print("{0:>8} {1:<18} {2:>14,.0f} {3:>12.2e}".format(
+                threads, name, per_thread * threads / elapsed, error))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Cost of finding a labeled timer on the hot path, per lookup and update.
+
+"concatenated key" builds a key string from the label values, as done
+before labels existed; "getter labels" passes them to
+C{MetricsRegistry.timer} as a tuple of pairs, and "getter dict" as a dict;
+"family labels" passes them by position to C{MetricFamily.labels}; "bound
+child" keeps the child at hand.
+
+    $ PYTHONPATH=. python benchmarks/bench_labels.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from timeit import default_timer
+
+from yunomi.core.metrics_registry import MetricsRegistry
+
+N = 200000
+ENDPOINTS = ["/", "/login", "/search", "/cart"]
+STATUSES = [200, 404, 500]
+
+
+def requests():
+    return [(ENDPOINTS[i % len(ENDPOINTS)], STATUSES[i % len(STATUSES)])
+            for i in range(N)]
+
+
+def concatenated(registry, calls):
+    timer = registry.timer
+    for endpoint, status in calls:
+        timer("http.%s.%s" % (endpoint, status)).update(1000)
+
+
+def getter(registry, calls):
+    timer = registry.timer
+    for endpoint, status in calls:
+        timer("http", labels=(("endpoint", endpoint),
+                              ("status", status))).update(1000)
+
+
+def getter_dict(registry, calls):
+    timer = registry.timer
+    for endpoint, status in calls:
+        timer("http", labels={"endpoint": endpoint,
+                              "status": status}).update(1000)
+
+
+def family(registry, calls):
+    labels = registry.family("timer", "http",
+                             ("endpoint", "status")).labels
+    for endpoint, status in calls:
+        labels(endpoint, status).update(1000)
+
+
+def bound(registry, calls):
+    child = registry.family("timer", "http",
+                            ("endpoint", "status")).labels("/", 200)
+    for _ in calls:
+        child.update(1000)
+
+
+def main():
+    calls = requests()
+    print("{0:>18} {1:>12}".format("lookup", "ns/update"))
+    for name, function in (("concatenated key", concatenated),
+                           ("getter labels", getter),
+                           ("getter dict", getter_dict),
+                           ("family labels", family),
+                           ("bound child", bound)):
+        registry = MetricsRegistry()
+        function(registry, calls[:100])
+        start = default_timer()
+        function(registry, calls)
+        elapsed = default_timer() - start
+        print("{0:>18} {1:>12.0f}".format(name, elapsed * 1e9 / N))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Memory used per metric, measured with C{tracemalloc} over many metrics.
+
+"full" metrics have been updated once per slot of their reservoir. A
+L{ColumnarMeter} is a row of a shared L{ColumnarMeterStore}; its share of the
+store's arrays is included.
+
+    $ PYTHONPATH=. python benchmarks/bench_memory.py
+"""
+from __future__ import division, absolute_import, print_function
+
+import gc
+import tracemalloc
+
+from yunomi.core.columnar_meter import ColumnarMeterStore
+from yunomi.core.counter import Counter
+from yunomi.core.histogram import Histogram
+from yunomi.core.meter import Meter
+from yunomi.core.timer import Timer
+
+METRICS = 2000
+
+
+def bytes_per_metric(factory, n=METRICS):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    metrics = [factory() for _ in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del metrics
+    return (after - before) / n
+
+
+def full_uniform_histogram():
+    histogram = Histogram.get_uniform()
+    histogram.update_many([i * 0.5 for i in range(Histogram.DEFAULT_SAMPLE_SIZE)])
+    return histogram
+
+
+def full_list_reservoir():
+    # What a full UniformSample used to hold: a list of boxed floats.
+    return [i * 0.5 for i in range(Histogram.DEFAULT_SAMPLE_SIZE)]
+
+
+def main():
+    store = ColumnarMeterStore()
+    cases = [
+        ("Counter", Counter),
+        ("Meter", Meter),
+        ("ColumnarMeter", store.meter),
+        ("Timer", Timer),
+        ("Histogram (uniform, empty)", Histogram.get_uniform),
+        ("Histogram (uniform, full)", full_uniform_histogram),
+        ("list reservoir (full)", full_list_reservoir),
+    ]
+    print("{0:<28} {1:>16}".format("metric", "bytes/metric"))
+    for name, factory in cases:
+        n = METRICS if "full" not in name else METRICS // 10
+        print("{0:<28} {1:>16,.0f}".format(name, bytes_per_metric(factory, n)))
+
+
+if __name__ == "__main__":
+    main()
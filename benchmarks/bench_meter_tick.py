@@ -0,0 +1,69 @@
+"""
+Time to tick the moving averages of N meters once.
+
+"meters" ticks a L{Meter} per meter, i.e. three L{EWMA}s reading the clock
+and computing their decay factor each; "store (rows)" and "store (numpy)" tick
+a L{ColumnarMeterStore} without NumPy, a column at a time since its rows all
+ticked last together, and vectorized.
+
+    $ PYTHONPATH=. python benchmarks/bench_meter_tick.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from timeit import default_timer
+
+from yunomi.compat import numpy
+from yunomi.core.columnar_meter import ColumnarMeterStore
+from yunomi.core.meter import Meter
+
+
+class Clock(object):
+    now = 0
+
+    def nanoseconds(self):
+        return self.now
+
+    def seconds(self):
+        return self.now / 1e9
+
+
+def timed(tick, clock, rounds=5):
+    best = None
+    for _ in range(rounds):
+        clock.now += 5000000000
+        start = default_timer()
+        tick()
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def tick_meters(meters):
+    for meter in meters:
+        meter._tick()
+
+
+def main():
+    print("{0:>8} {1:>14} {2:>14} {3:>14}".format(
+        "meters", "meters (ms)", "store (rows)", "store (numpy)"))
+    for n in (1000, 10000, 50000):
+        clock = Clock()
+        meters = [Meter(clock=clock) for _ in range(n)]
+        store = ColumnarMeterStore(clock)
+        for meter in meters:
+            meter.mark()
+            store.meter().mark()
+
+        plain = timed(lambda: tick_meters(meters), clock)
+        rows = timed(lambda: store._tick_rows(clock.now), clock)
+        if numpy is not None:
+            vectorized = "{0:>14.2f}".format(
+                timed(lambda: store._tick_vectorized(clock.now), clock) * 1e3)
+        else:
+            vectorized = "{0:>14}".format("n/a")
+        print("{0:>8} {1:>14.2f} {2:>14.2f} {3}".format(
+            n, plain * 1e3, rows * 1e3, vectorized))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Time to render a registry of N series in the Prometheus text format.
+
+The first scrape formats and caches the names of the metrics; later scrapes
+reuse them. "dump_metrics" is the time to build the list of dicts a service
+would otherwise serialize itself.
+
+    $ PYTHONPATH=. python benchmarks/bench_prometheus.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from timeit import default_timer
+
+from yunomi.core.metrics_registry import MetricsRegistry
+from yunomi.core.prometheus import PrometheusExporter
+
+
+def timed(function, rounds=5):
+    best = None
+    for _ in range(rounds):
+        start = default_timer()
+        function()
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    print("{0:>8} {1:>10} {2:>14} {3:>14} {4:>14}".format(
+        "series", "bytes", "first (ms)", "scrape (ms)", "dump (ms)"))
+    for n in (1000, 10000, 50000):
+        registry = MetricsRegistry()
+        # Mostly counters, with a timer per hundred of them; a timer is a
+        # summary of eight series.
+        timers = n // 100
+        for i in range(n - 8 * timers):
+            registry.counter("service.requests.%d" % i).inc(i)
+        for i in range(timers):
+            registry.timer("service.latency.%d" % i).update_many(
+                range(1000, 2000))
+        exporter = PrometheusExporter(registry)
+
+        start = default_timer()
+        size = len(exporter.render())
+        first = default_timer() - start
+        scrape = timed(exporter.render)
+        dump = timed(registry.dump_metrics)
+        print("{0:>8} {1:>10,} {2:>14.2f} {3:>14.2f} {4:>14.2f}".format(
+            n, size, first * 1e3, scrape * 1e3, dump * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Time to update each sample with N values, one at a time and in one batch, and
+to take a snapshot and its 99th percentile after the updates.
+
+The time window is long enough to keep every value, so it ends up holding N
+values where the other samples hold at most their reservoir size.
+
+    $ PYTHONPATH=. python benchmarks/bench_samples.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from random import random
+from timeit import default_timer
+
+from yunomi.core.histogram import Histogram
+from yunomi.stats.exp_decay_sample import ExponentiallyDecayingSample
+from yunomi.stats.hdr_sample import HdrSample
+from yunomi.stats.sliding_time_window_sample import SlidingTimeWindowSample
+from yunomi.stats.sliding_window_sample import SlidingWindowSample
+from yunomi.stats.uniform_sample import UniformSample
+
+VALUES = 100000
+SIZE = Histogram.DEFAULT_SAMPLE_SIZE
+
+SAMPLES = [
+    ("UniformSample", lambda: UniformSample(SIZE)),
+    ("ExponentiallyDecaying", lambda: ExponentiallyDecayingSample(SIZE, 0.015)),
+    ("HdrSample", HdrSample),
+    ("SlidingWindowSample", lambda: SlidingWindowSample(SIZE)),
+    ("SlidingTimeWindowSample", lambda: SlidingTimeWindowSample(3600)),
+]
+
+
+def timed(function, *args):
+    start = default_timer()
+    function(*args)
+    return default_timer() - start
+
+
+def update_each(sample, values):
+    update = sample.update
+    for value in values:
+        update(value)
+
+
+def snapshot(sample):
+    sample.get_snapshot().get_99th_percentile()
+
+
+def main():
+    values = [random() * 1000 for _ in range(VALUES)]
+    print("{0} values, reservoirs of {1}".format(VALUES, SIZE))
+    print("{0:<24} {1:>14} {2:>14} {3:>14}".format(
+        "sample", "update (ns)", "batch (ns)", "snapshot (ms)"))
+    for name, factory in SAMPLES:
+        sample = factory()
+        each = timed(update_each, sample, values)
+        batch = timed(factory().update_many, values)
+        taken = timed(snapshot, sample)
+        print("{0:<24} {1:>14.0f} {2:>14.0f} {3:>14.2f}".format(
+            name, each / VALUES * 1e9, batch / VALUES * 1e9, taken * 1e3))
+
+
+if __name__ == "__main__":
+    main()
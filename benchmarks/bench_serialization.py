@@ -0,0 +1,80 @@
+"""
+Size and time to encode and decode a registry, in the binary format of
+L{MetricsRegistry.serialize} and as JSON.
+
+"json (dump)" is C{dump_metrics()} as JSON, which loses the reservoirs;
+"json (state)" also carries the values of each reservoir, though not the
+priorities of biased ones, which the binary format keeps. Decoding the binary
+format builds the metrics, where decoding JSON only builds dicts.
+
+    $ PYTHONPATH=. python benchmarks/bench_serialization.py
+"""
+from __future__ import division, absolute_import, print_function
+
+import json
+from random import random
+from timeit import default_timer
+
+from yunomi.core.metrics_registry import MetricsRegistry
+from yunomi.stats.uniform_sample import UniformSample
+
+
+def timed(function, rounds=5):
+    best = None
+    for _ in range(rounds):
+        start = default_timer()
+        function()
+        elapsed = default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def build(counters, meters, timers, sample=None):
+    registry = MetricsRegistry()
+    for i in range(counters):
+        registry.counter("service.jobs.%d" % i).inc(i)
+    for i in range(meters):
+        registry.meter("service.requests.%d" % i).mark(i)
+    for i in range(timers):
+        registry.timer("service.latency.%d" % i, sample).update_many(
+            [int(random() * 1e8) for _ in range(2000)])
+    return registry
+
+
+def json_state(registry):
+    return json.dumps({
+        "metrics": registry.dump_metrics(),
+        "reservoirs": dict([(key, metric.get_snapshot().get_values())
+                            for key, kind, metric, _ in registry.metrics()
+                            if kind in ("histogram", "timer")]),
+    })
+
+
+def main():
+    for name, sample in [("biased", None),
+                         ("uniform", lambda: UniformSample(1028))]:
+        registry = build(5000, 1000, 200, sample)
+        data = registry.serialize()
+        dump = json.dumps(registry.dump_metrics())
+        state = json_state(registry)
+
+        print("5000 counters, 1000 meters, 200 {0} timers of 1028 values"
+              .format(name))
+        print("{0:<14} {1:>12} {2:>14} {3:>14}".format(
+            "format", "bytes", "encode (ms)", "decode (ms)"))
+        rows = [
+            ("binary", len(data), timed(registry.serialize),
+             timed(lambda: MetricsRegistry.deserialize(data))),
+            ("json (dump)", len(dump),
+             timed(lambda: json.dumps(registry.dump_metrics())),
+             timed(lambda: json.loads(dump))),
+            ("json (state)", len(state), timed(lambda: json_state(registry)),
+             timed(lambda: json.loads(state))),
+        ]
+        for format_name, size, encode, decode in rows:
+            print("{0:<14} {1:>12,} {2:>14.2f} {3:>14.2f}".format(
+                format_name, size, encode * 1e3, decode * 1e3))
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Cost of reading a single p99 from a timer's snapshot: sorting every value,
+as snapshots used to, against selecting the top of the distribution, and
+against reusing the snapshot of an unchanged sample.
+
+    $ PYTHONPATH=. python benchmarks/bench_snapshot.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from random import random
+from timeit import default_timer
+
+from yunomi.core.timer import Timer
+from yunomi.stats.snapshot import Snapshot
+
+ROUNDS = 2000
+
+
+def sorted_p99(values):
+    values = sorted(values)
+    pos = 0.99 * (len(values) + 1)
+    lower, upper = values[int(pos) - 1], values[int(pos)]
+    return lower + (pos - int(pos)) * (upper - lower)
+
+
+def per_round(fn):
+    start = default_timer()
+    for _ in range(ROUNDS):
+        fn()
+    return (default_timer() - start) / ROUNDS * 1e6
+
+
+def main():
+    timer = Timer()
+    for _ in range(10000):
+        timer.update(random())
+    values = timer.histogram.sample.get_snapshot().values
+
+    print("sort everything:  {0:8.1f} us".format(
+        per_round(lambda: sorted_p99(values))))
+    print("select the top:   {0:8.1f} us".format(
+        per_round(lambda: Snapshot(values).get_99th_percentile())))
+    print("reused snapshot:  {0:8.1f} us".format(
+        per_round(lambda: timer.get_snapshot().get_99th_percentile())))
+
+
+if __name__ == "__main__":
+    main()
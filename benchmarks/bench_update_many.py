@@ -0,0 +1,47 @@
+"""
+Histogram updates, one value at a time against L{Histogram.update_many} with
+a list and, when NumPy is installed, with a NumPy array.
+
+    $ PYTHONPATH=. python benchmarks/bench_update_many.py
+"""
+from __future__ import division, absolute_import, print_function
+
+from random import random
+from timeit import default_timer
+
+from yunomi.compat import numpy
+from yunomi.core.histogram import Histogram
+
+BATCH = 100000
+
+
+def timed(fn, *args):
+    start = default_timer()
+    fn(*args)
+    return default_timer() - start
+
+
+def one_at_a_time(histogram, values):
+    for value in values:
+        histogram.update(value)
+
+
+def main():
+    values = [random() for _ in range(BATCH)]
+    print("{0:>10} {1:>14} {2:>14} {3:>14}".format(
+        "sample", "update (ms)", "list (ms)", "numpy (ms)"))
+    for name, factory in (("uniform", Histogram.get_uniform),
+                          ("biased", Histogram.get_biased)):
+        loop = timed(one_at_a_time, factory(), values)
+        batch = timed(factory().update_many, values)
+        if numpy is not None:
+            vectorized = "{0:>14.1f}".format(
+                timed(factory().update_many, numpy.array(values)) * 1e3)
+        else:
+            vectorized = "{0:>14}".format("n/a")
+        print("{0:>10} {1:>14.1f} {2:>14.1f} {3}".format(
+            name, loop * 1e3, batch * 1e3, vectorized))
+
+
+if __name__ == "__main__":
+    main()
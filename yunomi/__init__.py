@@ -1,14 +1,36 @@
 from __future__ import division, absolute_import
 
-from yunomi.core.metrics_registry import (MetricsRegistry, counter, histogram,
-                                          meter, timer, dump_metrics,
+from yunomi.core.metrics_registry import (MetricsRegistry, counter, gauge,
+                                          histogram, meter, timer,
+                                          dump_metrics,
+                                          iter_metrics,
                                           count_calls, meter_calls, hist_calls,
                                           time_calls)
-from yunomi.core.counter import Counter
-from yunomi.core.histogram import Histogram
+from yunomi.core.aggregator import RegistryAggregator
+from yunomi.core.columnar_meter import ColumnarMeterStore
+from yunomi.core.counter import Counter, StripedCounter
+from yunomi.core.family import MetricFamily
+from yunomi.core.gauge import CallbackGauge, Gauge
+from yunomi.core.histogram import Histogram, StripedHistogram
 from yunomi.core.meter import Meter
+from yunomi.core.prometheus import PrometheusExporter, start_http_server
+from yunomi.core.shared import (SharedMemoryStore, SharedMetricsCollector,
+                                SharedMetricsRegistry)
 from yunomi.core.timer import Timer
+from yunomi.stats.ddsketch import DDSketch
+from yunomi.stats.hdr_sample import HdrSample
+from yunomi.stats.sliding_time_window_sample import SlidingTimeWindowSample
+from yunomi.stats.sliding_window_sample import SlidingWindowSample
+from yunomi.stats.tick_scheduler import TickScheduler
 
-__all__ = ['MetricsRegistry', 'Counter', 'Histogram', 'Meter', 'Timer',
-           'counter', 'histogram', 'meter', 'timer', 'dump_metrics',
+__all__ = ['MetricsRegistry', 'Counter', 'StripedCounter', 'Histogram',
+           'StripedHistogram',
+           'Meter', 'Timer', 'DDSketch', 'HdrSample', 'TickScheduler',
+           'SharedMemoryStore', 'SharedMetricsRegistry',
+           'SharedMetricsCollector', 'ColumnarMeterStore',
+           'SlidingWindowSample', 'SlidingTimeWindowSample',
+           'PrometheusExporter', 'start_http_server', 'RegistryAggregator',
+           'MetricFamily', 'Gauge', 'CallbackGauge',
+           'counter', 'gauge', 'histogram', 'meter', 'timer', 'dump_metrics',
+           'iter_metrics',
            'count_calls', 'meter_calls', 'hist_calls', 'time_calls']
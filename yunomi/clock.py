@@ -0,0 +1,84 @@
+from __future__ import division, absolute_import
+
+from yunomi.compat import monotonic_ns
+
+NANOSECONDS_PER_SECOND = 1000000000
+
+
+class MonotonicClock(object):
+    """
+    The default clock of all metrics. It never jumps when the wall clock is
+    stepped, e.g. by NTP, and is read in integer nanoseconds.
+
+    A clock is any object with the two methods of this one; a fake one makes
+    every metric deterministic in tests and benchmarks.
+    """
+    __slots__ = ()
+
+    def nanoseconds(self):
+        """
+        Returns the current time.
+
+        @rtype: C{int}
+        @return: the time in nanoseconds, from an arbitrary starting point
+        """
+        return monotonic_ns()
+
+    def seconds(self):
+        """
+        Returns the current time.
+
+        @rtype: C{float}
+        @return: the time in seconds, from the same starting point as
+                 L{MonotonicClock.nanoseconds}
+        """
+        return monotonic_ns() / NANOSECONDS_PER_SECOND
+
+
+class FunctionClock(object):
+    """
+    A clock reading the time from a function returning seconds, such as
+    C{time.time} or the C{seconds} method of Twisted's reactor.
+    """
+    __slots__ = ("seconds",)
+
+    def __init__(self, seconds):
+        """
+        Creates a new L{FunctionClock}.
+
+        @type seconds: C{function}
+        @param seconds: the function returning the current time in seconds
+        """
+        self.seconds = seconds
+
+    def nanoseconds(self):
+        """
+        Returns the current time.
+
+        @rtype: C{int}
+        @return: the time in nanoseconds
+        """
+        return int(round(self.seconds() * NANOSECONDS_PER_SECOND))
+
+
+DEFAULT_CLOCK = MonotonicClock()
+
+
+def as_clock(clock):
+    """
+    Returns the clock to use for a I{clock} argument, which may be a clock,
+    a function returning seconds, or C{None} for L{DEFAULT_CLOCK}.
+
+    @return: an object with C{nanoseconds} and C{seconds} methods
+    """
+    if clock is None:
+        return DEFAULT_CLOCK
+    if hasattr(clock, "nanoseconds"):
+        return clock
+    return FunctionClock(clock)
+
+
+__all__ = [
+    "NANOSECONDS_PER_SECOND", "MonotonicClock", "FunctionClock",
+    "DEFAULT_CLOCK", "as_clock"
+]
@@ -1,6 +1,7 @@
 from __future__ import division, absolute_import
 
 import sys
+from array import array
 
 
 if sys.version_info < (3, 0):
@@ -22,7 +23,70 @@ else:
         """
         return d.items()
 
+# Coroutines and async generators can be timed from Python 3.6 on.
+_ASYNC = sys.version_info >= (3, 6)
+
+if _ASYNC:
+    from inspect import iscoroutinefunction, isasyncgenfunction
+else:
+    def iscoroutinefunction(fn):
+        """
+        Return whether I{fn} is a coroutine function; never, on this Python.
+        """
+        return False
+
+    def isasyncgenfunction(fn):
+        """
+        Return whether I{fn} is an async generator function; never, on this
+        Python.
+        """
+        return False
+
+try:
+    from time import monotonic_ns
+except ImportError:
+    try:
+        from time import monotonic
+    except ImportError:
+        from time import time as monotonic
+
+    def monotonic_ns():
+        """
+        Return the time of a monotonic clock, where there is one, in integer
+        nanoseconds.
+        """
+        return int(monotonic() * 1000000000)
+
+# The typecode of a 64-bit integer C{array}, which Python 2 does not have.
+try:
+    array("q")
+    int64_typecode = "q"
+except ValueError:
+    int64_typecode = "l"
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def is_array(values):
+    """
+    Return whether I{values} is a NumPy array, which can be processed
+    vectorized; always C{False} when NumPy is not installed.
+    """
+    return numpy is not None and isinstance(values, numpy.ndarray)
+
 
 __all__ = [
-    _PY3, xrange, dict_item_iter
+    _PY3, _ASYNC, xrange, dict_item_iter, iscoroutinefunction,
+    isasyncgenfunction, monotonic_ns, int64_typecode, BaseHTTPRequestHandler,
+    HTTPServer, ThreadingMixIn, numpy, is_array
 ]
@@ -0,0 +1,477 @@
+from __future__ import division, absolute_import
+
+from array import array
+from math import exp
+from threading import Lock
+
+from yunomi.clock import NANOSECONDS_PER_SECOND, as_clock
+from yunomi.compat import int64_typecode, xrange, numpy
+from yunomi.stats.ewma import EWMA
+
+
+class ColumnarMeterStore(object):
+    """
+    A store for many meters, whose counts and moving averages are kept in one
+    contiguous C{array} per field instead of in three L{EWMA} objects per
+    meter. A meter of the store, see L{ColumnarMeterStore.meter}, is only a
+    handle on its row, so it takes about a hundred bytes.
+
+    The moving averages of a row tick when they are read, like an L{EWMA};
+    L{ColumnarMeterStore.tick} ticks all the rows at once, with one clock
+    read and the decay factors computed once per distinct interval instead of
+    once per moving average, vectorized with NumPy when it is installed, and
+    otherwise a column at a time when the rows all ticked last together, as
+    scheduled rows do. A L{TickScheduler} can tick a store like it does an
+    L{EWMA}.
+
+    Marks take no lock. Each row keeps the number of events ever marked,
+    which only marks write, and the number of them its moving averages
+    counted so far, which only ticks write, so the events marked while the
+    rows tick are counted by the next tick. Merges, resets and ticks share
+    one lock. Like a L{Meter}, a row should be marked by one thread at a
+    time.
+    """
+    __slots__ = ("clock", "scheduled", "counts", "marked", "ticked",
+                 "m1_rates",
+                 "m5_rates", "m15_rates", "initialized", "last_ticks",
+                 "start_times", "updates", "_columns", "_interval_ns",
+                 "_lock", "__weakref__")
+    VECTORIZE_THRESHOLD = 64
+
+    def __init__(self, clock=None, scheduler=None):
+        """
+        Creates a new, empty L{ColumnarMeterStore}.
+
+        @param clock: the clock, or a function returning seconds; defaults to
+                      L{yunomi.clock.DEFAULT_CLOCK}
+        @type scheduler: L{TickScheduler}
+        @param scheduler: an optional scheduler which ticks all the rows,
+                          instead of ticking them when they are read
+        """
+        self.clock = as_clock(clock)
+        self.scheduled = False
+        self.counts = array(int64_typecode)
+        self.marked = array("d")
+        self.ticked = array("d")
+        self.m1_rates = array("d")
+        self.m5_rates = array("d")
+        self.m15_rates = array("d")
+        self.initialized = array("b")
+        self.last_ticks = array(int64_typecode)
+        self.start_times = array(int64_typecode)
+        self.updates = array(int64_typecode)
+        self._columns = ((self.m1_rates, 60), (self.m5_rates, 300),
+                         (self.m15_rates, 900))
+        self._interval_ns = EWMA.INTERVAL * NANOSECONDS_PER_SECOND
+        self._lock = Lock()
+        if scheduler is not None:
+            scheduler.register(self)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def meter(self, event_type=""):
+        """
+        Adds a row to the store.
+
+        @type event_type: C{str}
+        @param event_type: the plural name of the event the meter is measuring
+
+        @rtype: L{ColumnarMeter}
+        @return: the meter of the new row
+        """
+        now = self.clock.nanoseconds()
+        with self._lock:
+            row = len(self.counts)
+            self.counts.append(0)
+            self.marked.append(0.0)
+            self.ticked.append(0.0)
+            for rates, _ in self._columns:
+                rates.append(0.0)
+            self.initialized.append(0)
+            self.last_ticks.append(now)
+            self.start_times.append(now)
+            self.updates.append(0)
+        return ColumnarMeter(self, row, event_type)
+
+    def clear(self, row):
+        """
+        Resets a row.
+
+        @type row: C{int}
+        @param row: the row of a meter
+        """
+        now = self.clock.nanoseconds()
+        with self._lock:
+            self.counts[row] = 0
+            self.ticked[row] = self.marked[row]
+            for rates, _ in self._columns:
+                rates[row] = 0.0
+            self.initialized[row] = 0
+            self.last_ticks[row] = now
+            self.start_times[row] = now
+
+    def reset_count(self, row):
+        """
+        Returns the count of a row and resets it back to 0 along with the
+        start of its mean rate.
+
+        @type row: C{int}
+        @param row: the row of a meter
+
+        @rtype: C{int}
+        @return: the count since the last reset
+        """
+        now = self.clock.nanoseconds()
+        counts = self.counts
+        with self._lock:
+            # Taken off rather than overwritten, so concurrent marks stay.
+            count = counts[row]
+            counts[row] -= count
+            self.start_times[row] = now
+        return count
+
+    def state(self, row):
+        """
+        Returns the state of a row, like the private C{Meter._state}: the
+        count, the start of the mean rate, and the rate, the events not
+        counted in it yet, whether it is initialized and the time of its
+        last tick for each moving average.
+
+        @type row: C{int}
+        @param row: the row of a meter
+
+        @rtype: C{tuple}
+        """
+        uncounted = self.marked[row] - self.ticked[row]
+        initialized = self.initialized[row]
+        last_tick = self.last_ticks[row]
+        rates = [(rates[row], uncounted, initialized, last_tick)
+                 for rates, _ in self._columns]
+        return self.counts[row], self.start_times[row], rates
+
+    def merge(self, row, count, start_time, rates):
+        """
+        Adds the state of another meter to a row; see L{Meter.merge}.
+
+        @type row: C{int}
+        @param row: the row of a meter
+        @type count: C{int}
+        @param count: the count of the other meter
+        @type start_time: C{int}
+        @param start_time: the start of the mean rate of the other meter
+        @param rates: the state of the moving averages of the other meter,
+                      see L{state}
+        """
+        now = self.clock.nanoseconds()
+        with self._lock:
+            self._tick_row(row, now)
+            self.counts[row] += count
+            self.updates[row] += 1
+            if start_time < self.start_times[row]:
+                self.start_times[row] = start_time
+            for (column, _), (rate, _, initialized, _) in zip(self._columns,
+                                                               rates):
+                column[row] += rate
+                if initialized:
+                    self.initialized[row] = 1
+            # The moving averages of a row share their uncounted events.
+            self.ticked[row] -= rates[0][1]
+
+    def mark(self, row, n=1):
+        """
+        Marks the occurrence of I{n} events in a row.
+
+        @type row: C{int}
+        @param row: the row of a meter
+        @type n: C{int}
+        @param n: number of events
+        """
+        self.counts[row] += n
+        self.marked[row] += n
+        self.updates[row] += 1
+
+    def tick(self, now=None):
+        """
+        Ticks the moving averages of every row.
+
+        @type now: C{int}
+        @param now: the current time in nanoseconds; defaults to reading the
+                    clock
+        """
+        if now is None:
+            now = self.clock.nanoseconds()
+        if numpy is not None and len(self.counts) >= self.VECTORIZE_THRESHOLD:
+            self._tick_vectorized(now)
+        else:
+            self._tick_rows(now)
+
+    def _alphas(self, interval):
+        """
+        Returns the decay factor of each moving average for an interval.
+        """
+        return [(rates, 1 - exp(-interval / period))
+                for rates, period in self._columns]
+
+    def _tick_rows(self, now):
+        """
+        Ticks every row in one pass over the arrays, computing the decay
+        factors once for each distinct interval since the last tick. Rows
+        which all ticked last together, as scheduled rows do, are ticked a
+        column at a time instead, see L{_tick_columns}. The lock is held
+        throughout, so no merge or tick of a single row can land between
+        reading a row and writing it back.
+        """
+        alphas = {}
+        last_ticks, initialized, ticked = [], [], []
+        m1_rates, m5_rates, m15_rates = [], [], []
+        with self._lock:
+            n = len(self.counts)
+            if not n:
+                return
+            last = self.last_ticks[0]
+            if (self.last_ticks.count(last) == n and
+                    0 not in self.initialized):
+                self._tick_columns(now, now - last)
+                return
+            for last, init, marked, counted, m1, m5, m15 in zip(
+                    self.last_ticks, self.initialized, self.marked,
+                    self.ticked, self.m1_rates, self.m5_rates,
+                    self.m15_rates):
+                elapsed = now - last
+                if elapsed > 0:
+                    interval = elapsed / NANOSECONDS_PER_SECOND
+                    instant_rate = (marked - counted) / interval
+                    counted = marked
+                    if init:
+                        row_alphas = alphas.get(elapsed)
+                        if row_alphas is None:
+                            row_alphas = alphas[elapsed] = [
+                                alpha for _, alpha in self._alphas(interval)]
+                        a1, a5, a15 = row_alphas
+                        m1 += a1 * (instant_rate - m1)
+                        m5 += a5 * (instant_rate - m5)
+                        m15 += a15 * (instant_rate - m15)
+                    else:
+                        m1 = m5 = m15 = instant_rate
+                        init = 1
+                    last = now
+                last_ticks.append(last)
+                initialized.append(init)
+                ticked.append(counted)
+                m1_rates.append(m1)
+                m5_rates.append(m5)
+                m15_rates.append(m15)
+            self.last_ticks[:n] = array(self.last_ticks.typecode, last_ticks)
+            self.initialized[:n] = array("b", initialized)
+            self.ticked[:n] = array("d", ticked)
+            self.m1_rates[:n] = array("d", m1_rates)
+            self.m5_rates[:n] = array("d", m5_rates)
+            self.m15_rates[:n] = array("d", m15_rates)
+
+    def _tick_columns(self, now, elapsed):
+        """
+        Ticks rows which are all initialized and ticked last I{elapsed}
+        nanoseconds ago with one set of decay factors, a column at a time
+        with list comprehensions rather than a row at a time; the lock must
+        be held.
+        """
+        if elapsed <= 0:
+            return
+        n = len(self.counts)
+        interval = elapsed / NANOSECONDS_PER_SECOND
+        marked = self.marked[:]
+        instant_rates = [(events - counted) / interval
+                         for events, counted in zip(marked, self.ticked)]
+        for rates, alpha in self._alphas(interval):
+            rates[:] = array("d", [rate + alpha * (instant - rate)
+                                   for rate, instant
+                                   in zip(rates, instant_rates)])
+        self.ticked[:] = marked
+        self.last_ticks[:] = array(self.last_ticks.typecode, [now]) * n
+
+    def _tick_vectorized(self, now):
+        """
+        Ticks every row at once with NumPy, through views of the arrays.
+        """
+        with self._lock:
+            last_ticks = numpy.frombuffer(
+                self.last_ticks, "i%d" % self.last_ticks.itemsize)
+            ticked = numpy.frombuffer(self.ticked, numpy.float64)
+            initialized = numpy.frombuffer(self.initialized, numpy.int8)
+            # A copy, since marks keep writing to the column.
+            marked = numpy.array(self.marked, numpy.float64)
+
+            elapsed = now - last_ticks
+            due = elapsed > 0
+            intervals = elapsed[due] / NANOSECONDS_PER_SECOND
+            instant_rates = (marked[due] - ticked[due]) / intervals
+            ticked[due] = marked[due]
+            was_initialized = initialized[due] != 0
+            if len(intervals) and (intervals == intervals[0]).all():
+                # The usual case of scheduled rows: one set of alphas.
+                intervals = intervals[0]
+            for rates, period in self._columns:
+                rates = numpy.frombuffer(rates, numpy.float64)
+                alphas = 1 - numpy.exp(-intervals / period)
+                old_rates = rates[due]
+                rates[due] = numpy.where(
+                    was_initialized,
+                    old_rates + alphas * (instant_rates - old_rates),
+                    instant_rates)
+            initialized[due] = 1
+            last_ticks[due] = now
+            del rates, last_ticks, ticked, initialized
+
+    def _tick_row(self, row, now):
+        """
+        Decays the moving averages of a row, like L{EWMA.tick}; the lock
+        must be held.
+        """
+        elapsed = now - self.last_ticks[row]
+        if elapsed <= 0:
+            return
+        interval = elapsed / NANOSECONDS_PER_SECOND
+        marked = self.marked[row]
+        instant_rate = (marked - self.ticked[row]) / interval
+        self.ticked[row] = marked
+
+        if self.initialized[row]:
+            for rates, alpha in self._alphas(interval):
+                rates[row] += alpha * (instant_rate - rates[row])
+        else:
+            for rates, _ in self._columns:
+                rates[row] = instant_rate
+            self.initialized[row] = 1
+
+        self.last_ticks[row] = now
+
+    def rate(self, row, rates):
+        """
+        Returns a moving average of a row, ticking the row first when it is
+        not scheduled and the last tick is older than L{EWMA.INTERVAL}.
+
+        @type row: C{int}
+        @param row: the row of a meter
+        @type rates: C{array}
+        @param rates: the column of the moving average, e.g.
+                      L{ColumnarMeterStore.m1_rates}
+
+        @rtype: C{float}
+        """
+        if not self.scheduled:
+            now = self.clock.nanoseconds()
+            if now - self.last_ticks[row] >= self._interval_ns:
+                with self._lock:
+                    self._tick_row(row, now)
+        return rates[row]
+
+    def mean_rate(self, row):
+        """
+        Returns the number of events of a row over the time since it was
+        added or cleared, or 0 until some time has passed.
+
+        @type row: C{int}
+        @param row: the row of a meter
+
+        @rtype: C{float}
+        """
+        count = self.counts[row]
+        if count == 0:
+            return 0.0
+        elapsed = self.clock.nanoseconds() - self.start_times[row]
+        if elapsed <= 0:
+            return 0.0
+        return count * NANOSECONDS_PER_SECOND / elapsed
+
+
+class ColumnarMeter(object):
+    """
+    A meter whose state is a row of a L{ColumnarMeterStore}, with the same
+    interface as L{Meter}.
+    """
+    __slots__ = ("store", "row", "event_type", "__weakref__")
+
+    def __init__(self, store, row, event_type=""):
+        """
+        Creates a new L{ColumnarMeter}; see L{ColumnarMeterStore.meter}.
+
+        @type store: L{ColumnarMeterStore}
+        @param store: the store holding the state of the meter
+        @type row: C{int}
+        @param row: the row of the meter in the store
+        @type event_type: C{str}
+        @param event_type: the plural name of the event the meter is measuring
+        """
+        self.store = store
+        self.row = row
+        self.event_type = event_type
+
+    def clear(self):
+        """
+        Resets the meter.
+        """
+        self.store.clear(self.row)
+
+    def get_event_type(self):
+        """
+        L{Meter.get_event_type}
+        """
+        return self.event_type
+
+    def get_snapshot_and_reset(self):
+        """
+        L{Meter.get_snapshot_and_reset}
+        """
+        return self.store.reset_count(self.row)
+
+    def _state(self):
+        return self.store.state(self.row)
+
+    def _generation(self):
+        return self.store.updates[self.row]
+
+    def merge(self, other):
+        """
+        L{Meter.merge}
+        """
+        self.store.merge(self.row, *other._state())
+
+    def mark(self, n=1):
+        """
+        L{Meter.mark}
+        """
+        self.store.mark(self.row, n)
+
+    def get_count(self):
+        """
+        L{Meter.get_count}
+        """
+        return self.store.counts[self.row]
+
+    def get_fifteen_minute_rate(self):
+        """
+        L{Meter.get_fifteen_minute_rate}
+        """
+        return self.store.rate(self.row, self.store.m15_rates)
+
+    def get_five_minute_rate(self):
+        """
+        L{Meter.get_five_minute_rate}
+        """
+        return self.store.rate(self.row, self.store.m5_rates)
+
+    def get_one_minute_rate(self):
+        """
+        L{Meter.get_one_minute_rate}
+        """
+        return self.store.rate(self.row, self.store.m1_rates)
+
+    def get_mean_rate(self):
+        """
+        L{Meter.get_mean_rate}
+        """
+        return self.store.mean_rate(self.row)
+
+
+__all__ = ["ColumnarMeterStore", "ColumnarMeter"]
@@ -0,0 +1,123 @@
+"""
+Wrappers for coroutine functions and async generator functions, used by the
+call-tracking decorators of L{MetricsRegistry}. This module needs Python 3.6
+or later and is only imported there.
+"""
+from __future__ import division, absolute_import
+
+from functools import wraps
+
+
+def call_before_coroutine(fn, before):
+    """
+    Wraps a coroutine function so that I{before} is called whenever the
+    coroutine is called.
+    """
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        before()
+        return await fn(*args, **kwargs)
+    return wrapper
+
+
+def call_before_async_generator(fn, before):
+    """
+    Wraps an async generator function so that I{before} is called whenever
+    the generator is started. The values sent and the exceptions thrown
+    into the wrapper, and its closing, are passed on to the generator.
+    """
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        before()
+        generator = fn(*args, **kwargs)
+        try:
+            item = await generator.__anext__()
+            while True:
+                # An async generator cannot "yield from", so this is its
+                # expansion, for asend, athrow and aclose.
+                try:
+                    value = yield item
+                except GeneratorExit:
+                    await generator.aclose()
+                    raise
+                except BaseException as e:
+                    item = await generator.athrow(e)
+                else:
+                    item = await generator.asend(value)
+        except StopAsyncIteration:
+            pass
+    return wrapper
+
+
+def hist_coroutine(fn, update):
+    """
+    Wraps a coroutine function so that its numeric results are passed to
+    I{update}.
+    """
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        rtn = await fn(*args, **kwargs)
+        if type(rtn) in (int, float):
+            update(rtn)
+        return rtn
+    return wrapper
+
+
+def time_coroutine(fn, update, clock):
+    """
+    Wraps a coroutine function so that the time from calling it until it
+    returns or raises, including any time spent suspended, is passed to
+    I{update}.
+    """
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            update(clock() - start)
+    return wrapper
+
+
+def time_async_generator(fn, update, clock):
+    """
+    Wraps an async generator function so that the time from starting the
+    generator until it is exhausted, raises or is closed is passed to
+    I{update}. Like L{call_before_async_generator}, the wrapper passes on
+    what is sent and thrown into it, and its closing.
+    """
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = clock()
+        generator = fn(*args, **kwargs)
+        try:
+            item = await generator.__anext__()
+            while True:
+                try:
+                    value = yield item
+                except GeneratorExit:
+                    await generator.aclose()
+                    raise
+                except BaseException as e:
+                    item = await generator.athrow(e)
+                else:
+                    item = await generator.asend(value)
+        except StopAsyncIteration:
+            pass
+        finally:
+            update(clock() - start)
+    return wrapper
+
+
+class AsyncContextManager(object):
+    """
+    Mixin which lets a synchronous context manager be used with
+    C{async with} as well.
+    """
+    __slots__ = ()
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return self.__exit__(exc_type, exc_value, traceback)
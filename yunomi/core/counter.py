@@ -1,14 +1,21 @@
 from __future__ import division, absolute_import
 
+from threading import Lock, current_thread, local
+from weakref import ref
+
+
 class Counter(object):
     """
     A counter method that increments and decrements.
     """
+    __slots__ = ("_count", "_updates", "__weakref__")
+
     def __init__(self):
         """
         Create a new instance of a L{Counter}.
         """
         self._count = 0
+        self._updates = 0
 
     def inc(self, n = 1):
         """
@@ -18,6 +25,7 @@ class Counter(object):
         @param n: the amount to be incremented
         """
         self._count += n
+        self._updates += 1
 
     def dec(self, n = 1):
         """
@@ -27,6 +35,7 @@ class Counter(object):
         @param n: the amount to be decrement
         """
         self._count -= n
+        self._updates += 1
 
     def get_count(self):
         """
@@ -42,3 +51,194 @@ class Counter(object):
         Resets the count back to 0.
         """
         self._count = 0
+
+    def merge(self, other):
+        """
+        Adds the count of another counter, e.g. of another process, to this
+        one.
+
+        @type other: L{Counter} or L{StripedCounter}
+        @param other: the counter to merge into this one
+        """
+        self._count += other.get_count()
+        self._updates += 1
+
+    def _generation(self):
+        """
+        Returns the number of updates so far, which only grows, for
+        L{MetricsRegistry.evict_idle}.
+        """
+        return self._updates
+
+    def get_snapshot_and_reset(self):
+        """
+        Returns the count and resets it back to 0, for reporting the count of
+        each interval. The count read is taken off rather than overwritten,
+        so increments between the read and the reset carry over to the next
+        interval.
+
+        @rtype: C{int}
+        @return: the count since the last reset
+        """
+        count = self._count
+        self._count -= count
+        return count
+
+
+class StripedCounter(object):
+    """
+    A thread-safe counter which keeps a separate cell per thread, so threads
+    never contend on a shared value or a lock when counting. The count is the
+    sum of all the cells, in the spirit of Java's C{LongAdder}.
+
+    The cells of threads which have died are folded into a single retired
+    cell when a new thread counts for the first time and on
+    L{get_snapshot_and_reset}, in the same way as L{StripedHistogram}, so
+    short-lived threads do not pile up cells.
+    """
+    __slots__ = ("_cells", "_retired", "_local", "_lock", "_reset_count",
+                 "__weakref__")
+
+    def __init__(self):
+        """
+        Create a new instance of a L{StripedCounter}.
+        """
+        self._cells = []
+        self._retired = [0, 0]
+        self._local = local()
+        self._lock = Lock()
+        self._reset_count = 0
+
+    def _new_cell(self):
+        """
+        Creates and registers the cell of the current thread, and retires
+        the cells of the threads which have died.
+
+        @rtype: C{list}
+        @return: a list holding this thread's share of the count, the
+                 number of its updates and a weak reference to the thread
+        """
+        cell = self._local.cell = [0, 0, ref(current_thread())]
+        with self._lock:
+            self._retire_dead_cells()
+            self._cells.append(cell)
+        return cell
+
+    def _retire_dead_cells(self):
+        """
+        Adds the cells of the threads which have died to the retired cell,
+        and drops them; the lock must be held. A dead thread cannot update
+        its cell any more, so nothing it counted is lost.
+        """
+        live = []
+        count, updates = self._retired
+        for cell in self._cells:
+            thread = cell[2]()
+            if thread is not None and thread.is_alive():
+                live.append(cell)
+                continue
+            count += cell[0]
+            updates += cell[1]
+        if len(live) < len(self._cells):
+            self._cells = live
+            self._retired = [count, updates]
+
+    def _totals(self):
+        """
+        Returns the sums of the counts and of the updates of every cell,
+        retired or not.
+
+        @rtype: C{tuple}
+        """
+        with self._lock:
+            cells = self._cells
+            count, updates = self._retired
+        for cell in cells:
+            count += cell[0]
+            updates += cell[1]
+        return count, updates
+
+    def inc(self, n = 1):
+        """
+        Increment the counter by I{n}.
+
+        @type n: C{int}
+        @param n: the amount to be incremented
+        """
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[0] += n
+        cell[1] += 1
+
+    def dec(self, n = 1):
+        """
+        Decrement the counter by I{n}.
+
+        @type n: C{int}
+        @param n: the amount to be decrement
+        """
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[0] -= n
+        cell[1] += 1
+
+    def get_count(self):
+        """
+        Returns the count, summed over the cells of all threads, since the
+        last reset.
+
+        @rtype: C{int}
+        @return: the count
+        """
+        return self._totals()[0] - self._reset_count
+
+    def merge(self, other):
+        """
+        Adds the count of another counter to the cell of the current thread.
+
+        @type other: L{Counter} or L{StripedCounter}
+        @param other: the counter to merge into this one
+        """
+        self.inc(other.get_count())
+
+    def _generation(self):
+        """
+        Returns the number of updates of all the threads so far, which only
+        grows, for L{MetricsRegistry.evict_idle}.
+        """
+        return self._totals()[1]
+
+    def clear(self):
+        """
+        Resets the count back to 0. Like L{get_snapshot_and_reset}, it
+        leaves the cells of other threads alone, and moves the zero to their
+        current sum instead.
+        """
+        with self._lock:
+            total = self._retired[0]
+            for cell in self._cells:
+                total += cell[0]
+            self._reset_count = total
+
+    def get_snapshot_and_reset(self):
+        """
+        Returns the count and resets it back to 0, for reporting the count of
+        each interval. The cells are left alone: the sum they are read at
+        becomes the zero of the next interval, so increments which happen
+        concurrently are counted in exactly one interval.
+
+        @rtype: C{int}
+        @return: the count since the last reset
+        """
+        with self._lock:
+            self._retire_dead_cells()
+            total = self._retired[0]
+            for cell in self._cells:
+                total += cell[0]
+            count = total - self._reset_count
+            self._reset_count = total
+        return count
@@ -0,0 +1,98 @@
+from __future__ import division, absolute_import
+
+
+class MetricFamily(object):
+    """
+    The metrics of one kind and key which differ by the values of their
+    labels, e.g. a timer of HTTP requests for each endpoint and status. A
+    child metric is created the first time its label values are seen, see
+    L{MetricsRegistry.family}, and cached under the tuple of its values, so
+    getting it again with L{labels} is a single dict probe; L{child} finds
+    it by the names of its labels instead. A child can also be looked up
+    once and kept::
+
+        requests = registry.family("timer", "http", ("endpoint", "status"))
+        index_ok = requests.labels("/", 200)
+        index_ok.update(duration)
+
+    Each child has its labels as an interned tuple of C{(name, value)}
+    pairs, the values turned to strings, which the registry indexes it by
+    and which its dumps and exports carry; see L{MetricsRegistry.metrics}.
+    """
+    __slots__ = ("registry", "kind", "key", "label_names", "_factory",
+                 "_children")
+
+    def __init__(self, registry, kind, key, label_names, factory):
+        """
+        Creates a new L{MetricFamily}; see L{MetricsRegistry.family}.
+
+        @type registry: L{MetricsRegistry}
+        @param registry: the registry of the children
+        @type kind: C{str}
+        @param kind: the kind of the children, e.g. C{"timer"}
+        @type key: C{str}
+        @param key: the key of the children
+        @type label_names: C{tuple} of C{str}
+        @param label_names: the names of the labels, in the order of the
+                            values given to L{labels}
+        @param factory: a callable returning a new child
+        """
+        self.registry = registry
+        self.kind = kind
+        self.key = key
+        self.label_names = tuple(label_names)
+        self._factory = factory
+        self._children = {}
+
+    def labels(self, *values):
+        """
+        Gets the child with the given label values, in the order of
+        I{label_names}, creating it if it does not exist.
+
+        @raise ValueError: if the values do not match the I{label_names}
+
+        @return: the child metric, e.g. a L{Timer}
+        """
+        child = self._children.get(values)
+        if child is None:
+            child = self._new_child(values)
+        return child
+
+    def child(self, labels):
+        """
+        Gets the child with labels given by name, creating it if it does not
+        exist.
+
+        @type labels: C{dict}, or C{tuple} of C{(name, value)} pairs
+        @param labels: the labels of the child
+
+        @raise ValueError: if the names are not the I{label_names}
+
+        @return: the child metric, e.g. a L{Timer}
+        """
+        labels = dict(labels)
+        if len(labels) != len(self.label_names):
+            raise ValueError("Expected the labels {0}".format(
+                ", ".join(self.label_names)))
+        try:
+            values = tuple([labels[name] for name in self.label_names])
+        except KeyError:
+            raise ValueError("Expected the labels {0}".format(
+                ", ".join(self.label_names)))
+        return self.labels(*values)
+
+    def _new_child(self, values):
+        """
+        Registers the child of a tuple of label values, which the registry
+        caches, unless it is the overflow metric of its kind.
+        """
+        if len(values) != len(self.label_names):
+            raise ValueError("Expected the labels {0}".format(
+                ", ".join(self.label_names)))
+        labels = tuple(zip(self.label_names,
+                           ["%s" % (value,) for value in values]))
+        return self.registry._add(self.kind, self.key, self._factory, labels,
+                                  self, values)
+
+
+__all__ = ["MetricFamily"]
@@ -0,0 +1,127 @@
+from __future__ import division, absolute_import
+
+from numbers import Real
+from threading import Lock
+
+from yunomi.clock import as_clock
+
+
+def is_number(value):
+    """
+    Returns whether a value is a number which a gauge can report, unlike
+    C{None} or a string which the function of a L{CallbackGauge} might
+    return.
+
+    @rtype: C{bool}
+    """
+    return isinstance(value, Real)
+
+
+class Gauge(object):
+    """
+    A value which is set rather than counted, e.g. the depth of a queue or
+    the size of a pool, reported as it was last set.
+    """
+    __slots__ = ("_value", "_updates", "__weakref__")
+
+    def __init__(self, value=0):
+        """
+        Create a new instance of a L{Gauge}.
+
+        @param value: the initial value
+        """
+        self._value = value
+        self._updates = 0
+
+    def set(self, value):
+        """
+        Sets the value of the gauge.
+
+        @type value: C{int} or C{float}
+        @param value: the new value
+        """
+        self._value = value
+        self._updates += 1
+
+    def get_value(self):
+        """
+        Returns the value the gauge was last set to.
+
+        @rtype: C{int} or C{float}
+        @return: the value
+        """
+        return self._value
+
+    def merge(self, other):
+        """
+        Adds the value of another gauge, e.g. of another process, to this
+        one, so that the gauges of all the workers add up to their total.
+
+        @type other: L{Gauge} or L{CallbackGauge}
+        @param other: the gauge to merge into this one
+        """
+        self._value += other.get_value()
+        self._updates += 1
+
+    def _generation(self):
+        """
+        Returns the number of times the gauge was set or merged into, which
+        only grows, for L{MetricsRegistry.evict_idle}.
+        """
+        return self._updates
+
+
+class CallbackGauge(object):
+    """
+    A gauge whose value is computed by a function only when it is read, e.g.
+    when the registry is dumped or scraped, so that nothing is done on the
+    hot path when the value changes. The value of an expensive function can
+    be cached for I{ttl} seconds, so that it runs at most once per interval
+    however often the gauge is read.
+    """
+    __slots__ = ("function", "ttl", "clock", "_value", "_expires", "_lock")
+
+    def __init__(self, function, ttl=None, clock=None):
+        """
+        Create a new instance of a L{CallbackGauge}.
+
+        @param function: a callable without arguments returning the value
+        @type ttl: C{int} or C{float}
+        @param ttl: the number of seconds the value is cached for; if
+                    C{None}, I{function} is called on every read
+        @param clock: the clock, or a function returning seconds, which the
+                      cached value expires on; defaults to
+                      L{yunomi.clock.DEFAULT_CLOCK}
+        """
+        self.function = function
+        self.ttl = ttl
+        self.clock = as_clock(clock)
+        self._value = None
+        self._expires = None
+        self._lock = Lock()
+
+    def get_value(self):
+        """
+        Returns the value of the function, from the cache if it has not
+        expired yet. Errors of the function are not caught.
+
+        @rtype: C{int} or C{float}
+        @return: the value
+        """
+        if self.ttl is None:
+            return self.function()
+        with self._lock:
+            now = self.clock.seconds()
+            if self._expires is None or now >= self._expires:
+                self._value = self.function()
+                self._expires = now + self.ttl
+            return self._value
+
+    def merge(self, other):
+        """
+        Refuses to merge: the value of a L{CallbackGauge} is only ever its
+        function's.
+
+        @raise ValueError: always
+        """
+        raise ValueError("Cannot merge into a callback gauge")
@@ -1,10 +1,24 @@
 from __future__ import division, absolute_import
 
+from copy import copy
 from math import sqrt
+from random import sample as random_sample
+from threading import Lock, current_thread, local
+from weakref import ref
 
+from yunomi.compat import is_array
 from yunomi.stats.exp_decay_sample import ExponentiallyDecayingSample
+from yunomi.stats.hdr_sample import HdrSample
+from yunomi.stats.sliding_time_window_sample import SlidingTimeWindowSample
+from yunomi.stats.sliding_window_sample import SlidingWindowSample
+from yunomi.stats.snapshot import Snapshot
 from yunomi.stats.uniform_sample import UniformSample
 
+# The samples whose values StripedHistogram.get_snapshot pools, rather than
+# merging them, so its snapshot keeps every value the shards hold.
+_POOLED = (ExponentiallyDecayingSample, SlidingTimeWindowSample,
+           SlidingWindowSample, UniformSample)
+
 
 class Histogram(object):
     """
@@ -12,32 +26,35 @@ class Histogram(object):
 
     @see: <a href="http://www.johndcook.com/standard_deviation.html">Accurately computing running variance</a>
     """
+    __slots__ = ("sample", "max_", "min_", "sum_", "count", "mean",
+                 "sum_of_squares", "_updates", "__weakref__")
     DEFAULT_SAMPLE_SIZE = 1028
     DEFAULT_ALPHA = 0.015
-    count = 0
-    mean = 0
-    sum_of_squares = -1.0
 
     def __init__(self, sample):
         """
         Creates a new instance of a L{Histogram}.
 
-        @type sample: L{ExponentiallyDecayingSample} or L{UniformSample}
-        @param sample: an instance of L{ExponentiallyDecayingSample} or
-                       L{UniformSample}
+        @type sample: L{ExponentiallyDecayingSample}, L{UniformSample},
+                      L{HdrSample}, L{SlidingWindowSample} or
+                      L{SlidingTimeWindowSample}
+        @param sample: an instance of one of the samples
         """
         self.sample = sample
+        self._updates = 0
         self.clear()
 
     @classmethod
-    def get_biased(klass):
+    def get_biased(klass, clock=None):
         """
         Create a new instance of L{Histogram} that uses an L{ExponentiallyDecayingSample}
         with sample size L{DEFAULT_SAMPLE_SIZE} and alpha L{DEFAULT_ALPHA}.
 
+        @param clock: the clock of the sample, defaults to
+                      L{yunomi.clock.DEFAULT_CLOCK}
         @return: L{Histogram}
         """
-        return klass(ExponentiallyDecayingSample(klass.DEFAULT_SAMPLE_SIZE, klass.DEFAULT_ALPHA))
+        return klass(ExponentiallyDecayingSample(klass.DEFAULT_SAMPLE_SIZE, klass.DEFAULT_ALPHA, clock))
 
     @classmethod
     def get_uniform(klass):
@@ -48,11 +65,79 @@ class Histogram(object):
         """
         return klass(UniformSample(klass.DEFAULT_SAMPLE_SIZE))
 
+    @classmethod
+    def get_hdr(klass, significant_figures=2):
+        """
+        Create a new instance of L{Histogram} that uses an L{HdrSample}, which
+        counts every value instead of sampling them.
+
+        @type significant_figures: C{int}
+        @param significant_figures: the number of significant decimal figures
+                                    to which each value is kept
+
+        @return: L{Histogram}
+        """
+        return klass(HdrSample(significant_figures))
+
+    @classmethod
+    def get_sliding_window(klass, size=DEFAULT_SAMPLE_SIZE):
+        """
+        Create a new instance of L{Histogram} that uses a
+        L{SlidingWindowSample} of the last I{size} values.
+
+        @type size: C{int}
+        @param size: the number of most recent values kept
+
+        @return: L{Histogram}
+        """
+        return klass(SlidingWindowSample(size))
+
+    @classmethod
+    def get_sliding_time_window(klass, window=60, clock=None):
+        """
+        Create a new instance of L{Histogram} that uses a
+        L{SlidingTimeWindowSample} of the values of the last I{window}
+        seconds.
+
+        @type window: C{int} or C{float}
+        @param window: the number of seconds a value is kept for
+        @param clock: the clock of the sample, defaults to
+                      L{yunomi.clock.DEFAULT_CLOCK}
+
+        @return: L{Histogram}
+        """
+        return klass(SlidingTimeWindowSample(window, clock))
+
     def clear(self):
         """
         Resets the values to default.
         """
         self.sample.clear()
+        self._reset()
+
+    def get_snapshot_and_reset(self):
+        """
+        Moves the values recorded so far into a new L{Histogram}, which is
+        returned, and starts over with an empty sample. Nothing is copied:
+        the sample is swapped for an empty one of the same kind, so the reset
+        takes the same time however many values were recorded. Like
+        L{update}, it is not thread-safe; see
+        L{StripedHistogram.get_snapshot_and_reset}.
+
+        @rtype: L{Histogram}
+        @return: the values of the interval since the last reset
+        """
+        interval = copy(self)
+        sample = copy(self.sample)
+        sample.clear()
+        self.sample = sample
+        self._reset()
+        return interval
+
+    def _reset(self):
+        """
+        Resets the running statistics, but not the sample.
+        """
         self.max_ = -2147483647.0
         self.min_ = 2147483647.0
         self.sum_ = 0.0
@@ -67,12 +152,106 @@ class Histogram(object):
         @type value: C{int}
         @param value: the value to update the fields with
         """
-        self.count += 1
+        self._updates += 1
         self.sample.update(value)
         self.set_max(value)
         self.set_min(value)
         self.sum_ += value
         self.update_variance_info(value)
+        # The count goes last, so readers in other threads, like
+        # StripedHistogram, never count a value before its variance.
+        self.count += 1
+
+    def update_many(self, values):
+        """
+        Updates all the fields with a batch of values, with the same result
+        as calling L{update} for each of them. The minimum, maximum, sum and
+        variance of the batch are computed in one pass each, vectorized when
+        I{values} is a NumPy array, and the variance is combined with the
+        running one using Chan et al's parallel algorithm.
+
+        @type values: iterable of C{int} or C{float}, or a NumPy array
+        @param values: the values to update the fields with
+        """
+        if is_array(values):
+            n = len(values)
+            if not n:
+                return
+            batch_min, batch_max = values.min().item(), values.max().item()
+            batch_sum = values.sum().item()
+            batch_mean = float(batch_sum) / n
+            deviations = values - batch_mean
+            batch_sum_of_squares = float((deviations * deviations).sum())
+        else:
+            values = list(values)
+            n = len(values)
+            if not n:
+                return
+            batch_min, batch_max = min(values), max(values)
+            batch_sum = sum(values)
+            batch_mean = float(batch_sum) / n
+            batch_sum_of_squares = sum([(value - batch_mean) ** 2
+                                        for value in values])
+
+        self.sample.update_many(values)
+        self._updates += 1
+        self._combine(n, batch_min, batch_max, batch_sum, batch_mean,
+                      batch_sum_of_squares)
+
+    def _combine(self, n, batch_min, batch_max, batch_sum, batch_mean,
+                 batch_sum_of_squares):
+        """
+        Adds the statistics of I{n} more values to the running ones, with
+        Chan et al's parallel algorithm for the mean and variance.
+        """
+        old_count = self.count
+        count = old_count + n
+        self.set_max(batch_max)
+        self.set_min(batch_min)
+        self.sum_ += batch_sum
+        if self.sum_of_squares == -1.0:
+            self.mean = batch_mean
+            self.sum_of_squares = batch_sum_of_squares
+        else:
+            delta = batch_mean - self.mean
+            self.mean += delta * n / count
+            self.sum_of_squares += (batch_sum_of_squares +
+                                    delta * delta * old_count * n / count)
+        self.count = count
+
+    def merge(self, other):
+        """
+        Adds the values of another histogram, e.g. one decoded from another
+        process, to this one. Counts, sums and extrema add up, the means and
+        variances are combined exactly with Chan et al's parallel algorithm,
+        and the samples are merged, see e.g. L{UniformSample.merge}.
+
+        @type other: L{Histogram} or L{StripedHistogram}
+        @param other: the histogram to merge into this one
+
+        @raise ValueError: if the two histograms have different kinds of
+                           samples
+        """
+        if isinstance(other, StripedHistogram):
+            other = other.merged()
+        if type(self.sample) is not type(other.sample):
+            raise ValueError("Cannot merge a histogram of {0} into a "
+                             "histogram of {1}".format(
+                                 type(other.sample).__name__,
+                                 type(self.sample).__name__))
+        if not other.count:
+            return
+        self.sample.merge(other.sample)
+        self._updates += 1
+        self._combine(other.count, other.min_, other.max_, other.sum_,
+                      other.mean, other.sum_of_squares)
+
+    def _generation(self):
+        """
+        Returns the number of updates so far, which only grows, for
+        L{MetricsRegistry.evict_idle}.
+        """
+        return self._updates
 
     def get_count(self):
         """
@@ -182,8 +361,8 @@ class Histogram(object):
     def update_variance_info(self, value):
         """
         Updates the I{sum_of_squares} and I{mean} whenever a new value is
-        updated. This makes computing the variance more computationally
-        efficient.
+        updated, before the count is. This makes computing the variance
+        more computationally efficient.
 
         @type value: C{int} or C{float}
         @param value: the value being added to the histogram
@@ -194,5 +373,346 @@ class Histogram(object):
             self.mean = value
             self.sum_of_squares = 0.0
         else:
-            self.mean += (float(delta) / self.get_count())
+            self.mean += (float(delta) / (self.count + 1))
             self.sum_of_squares += (float(delta) * (value - self.mean))
+
+
+class StripedHistogram(object):
+    """
+    A thread-safe histogram which records into a separate L{Histogram} per
+    thread, with its own sample and running variance, so threads never
+    interleave their updates or contend on a lock, in the same way as
+    L{StripedCounter}. The accessors merge the shards when they are called:
+    counts, sums and extrema add up, and the means and variances of the
+    shards are combined with Chan et al's parallel algorithm.
+
+    Bucketed samples, like L{HdrSample} and L{DDSketch}, are merged into a
+    new one for L{get_snapshot}. The values of reservoirs and windows are
+    pooled instead, to keep all of them; when a shard's reservoir holds fewer values than the shard
+    recorded, each shard's values are subsampled so every pooled value
+    stands for as many recorded values.
+
+    The shards of threads which have died are folded into a single retired
+    shard when a new thread records its first value and on
+    L{get_snapshot_and_reset}, so short-lived threads do not pile up shards.
+    """
+    __slots__ = ("sample_factory", "_cells", "_retired", "_local", "_lock",
+                 "__weakref__")
+
+    def __init__(self, sample_factory=None):
+        """
+        Creates a new instance of a L{StripedHistogram}.
+
+        @param sample_factory: a callable returning the sample of a new
+                               shard, e.g. L{HdrSample}; defaults to a
+                               L{UniformSample} of
+                               L{Histogram.DEFAULT_SAMPLE_SIZE} values
+        """
+        if sample_factory is None:
+            sample_factory = lambda: UniformSample(
+                Histogram.DEFAULT_SAMPLE_SIZE)
+        self.sample_factory = sample_factory
+        self._cells = []
+        self._retired = None
+        self._local = local()
+        self._lock = Lock()
+
+    def _new_cell(self):
+        """
+        Creates and registers the cell of the current thread, holding its
+        shard, and retires the cells of the threads which have died.
+
+        @rtype: C{list}
+        @return: a list holding this thread's L{Histogram} and a weak
+                 reference to the thread
+        """
+        cell = self._local.cell = [Histogram(self.sample_factory()),
+                                   ref(current_thread())]
+        with self._lock:
+            self._retire_dead_cells()
+            self._cells.append(cell)
+        return cell
+
+    def _retire_dead_cells(self):
+        """
+        Merges the shards of the threads which have died into the retired
+        shard, and drops their cells; the lock must be held. A dead thread
+        cannot update its shard any more, so nothing it recorded is lost.
+        """
+        live = []
+        for cell in self._cells:
+            thread = cell[1]()
+            if thread is not None and thread.is_alive():
+                live.append(cell)
+                continue
+            shard = cell[0]
+            if self._retired is None:
+                self._retired = shard
+                continue
+            updates = self._retired._updates + shard._updates
+            self._retired.merge(shard)
+            self._retired._updates = updates
+        if len(live) < len(self._cells):
+            self._cells = live
+
+    def shards(self):
+        """
+        Returns the shards of all the threads, and the retired shard of the
+        threads which have died.
+
+        @rtype: C{list} of L{Histogram}
+        """
+        shards = [cell[0] for cell in list(self._cells)]
+        retired = self._retired
+        if retired is not None:
+            shards.append(retired)
+        return shards
+
+    def clear(self):
+        """
+        Resets every shard. Updates which happen concurrently with a clear
+        may or may not be kept.
+        """
+        for shard in self.shards():
+            shard.clear()
+
+    def get_snapshot_and_reset(self):
+        """
+        Swaps the shard of each thread for an empty one, and returns a
+        L{StripedHistogram} of the previous shards. A thread records into
+        the shard it finds in its cell, so each swap is a single store which
+        never blocks it, and no update is lost: one which was under way
+        during the swap lands in the returned histogram. The shards of
+        threads which have died are retired first, so only the live threads
+        get an empty shard.
+
+        @rtype: L{StripedHistogram}
+        @return: the values of the interval since the last reset
+        """
+        interval = StripedHistogram(self.sample_factory)
+        with self._lock:
+            self._retire_dead_cells()
+            for cell in self._cells:
+                fresh = Histogram(self.sample_factory())
+                # The generation of the thread carries on.
+                fresh._updates = cell[0]._updates
+                shard, cell[0] = cell[0], fresh
+                interval._cells.append([shard, cell[1]])
+            retired = self._retired
+            if retired is not None and retired.count:
+                fresh = Histogram(self.sample_factory())
+                fresh._updates = retired._updates
+                interval._retired, self._retired = retired, fresh
+        return interval
+
+    def update(self, value):
+        """
+        Updates the shard of the current thread with a new value.
+
+        @type value: C{int} or C{float}
+        @param value: the value to update the fields with
+        """
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[0].update(value)
+
+    def update_many(self, values):
+        """
+        Updates the shard of the current thread with a batch of values; see
+        L{Histogram.update_many}.
+
+        @type values: iterable of C{int} or C{float}, or a NumPy array
+        @param values: the values to update the fields with
+        """
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[0].update_many(values)
+
+    def merge(self, other):
+        """
+        Adds the values of another histogram to the shard of the current
+        thread; see L{Histogram.merge}.
+
+        @type other: L{Histogram} or L{StripedHistogram}
+        @param other: the histogram to merge into this one
+        """
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[0].merge(other)
+
+    def _generation(self):
+        """
+        Returns the number of updates of all the threads so far, which only
+        grows, for L{MetricsRegistry.evict_idle}.
+        """
+        return sum([shard._updates for shard in self.shards()])
+
+    def _recorded(self):
+        """
+        Returns the shards which have recorded any value.
+        """
+        return [shard for shard in self.shards() if shard.count]
+
+    def get_count(self):
+        """
+        The number of values put into the histogram by every thread.
+        """
+        return sum([shard.count for shard in self.shards()])
+
+    def get_max(self):
+        """
+        The maximum value that has been updated into the histogram.
+
+        @rtype: C{int} or C{float}
+        @return: the max value
+        """
+        shards = self._recorded()
+        if shards:
+            return max([shard.max_ for shard in shards])
+        return 0.0
+
+    def get_min(self):
+        """
+        The minimum value that has been updated into the histogram.
+
+        @rtype: C{int} or C{float}
+        @return: the min value
+        """
+        shards = self._recorded()
+        if shards:
+            return min([shard.min_ for shard in shards])
+        return 0.0
+
+    def get_sum(self):
+        """
+        The sum of all the values of every thread.
+
+        @rtype: C{int} or C{float}
+        @return: the sum of all the values
+        """
+        return sum([shard.sum_ for shard in self.shards()], 0.0)
+
+    def get_mean(self):
+        """
+        The average of all the values that have been updated into the
+        histogram.
+
+        @rtype: C{float}
+        @return: the average of all the values updated
+        """
+        count = 0
+        sum_ = 0.0
+        for shard in self.shards():
+            count += shard.count
+            sum_ += shard.sum_
+        if count > 0:
+            return sum_ / count
+        return 0.0
+
+    def _combined(self, shards):
+        """
+        Combines the counts, means and sums of squares of deviations of
+        shards with Chan et al's parallel algorithm.
+
+        @rtype: C{tuple}
+        @return: the count, mean and sum of squares of all the values
+        """
+        count = 0
+        mean = 0.0
+        sum_of_squares = 0.0
+        for shard in shards:
+            shard_count, shard_mean, shard_squares = (
+                shard.count, shard.mean, shard.sum_of_squares)
+            if shard_count <= 0:
+                continue
+            # A clear in another thread may reset a shard under us.
+            shard_squares = max(shard_squares, 0.0)
+            total = count + shard_count
+            delta = shard_mean - mean
+            mean += delta * shard_count / total
+            sum_of_squares += (shard_squares +
+                               delta * delta * count * shard_count / total)
+            count = total
+        return count, mean, sum_of_squares
+
+    def get_variance(self):
+        """
+        Returns the variance of all the values, combining the count, mean
+        and sum of squares of deviations of each shard with Chan et al's
+        parallel algorithm.
+
+        @rtype: C{float}
+        @return: the variance
+        """
+        count, _, sum_of_squares = self._combined(self._recorded())
+        if count <= 1:
+            return 0.0
+        return sum_of_squares / (count - 1)
+
+    def merged(self):
+        """
+        Returns a single L{Histogram} of the values of every thread, with
+        the combined statistics of the shards. Its sample is the merge of
+        the samples of the shards.
+
+        @rtype: L{Histogram}
+        """
+        shards = self._recorded()
+        histogram = Histogram(self.sample_factory())
+        if not shards:
+            return histogram
+        sample = histogram.sample
+        for shard in shards:
+            sample.merge(shard.sample)
+        (histogram.count, histogram.mean,
+         histogram.sum_of_squares) = self._combined(shards)
+        histogram.sum_ = sum([shard.sum_ for shard in shards], 0.0)
+        histogram.min_ = min([shard.min_ for shard in shards])
+        histogram.max_ = max([shard.max_ for shard in shards])
+        return histogram
+
+    def get_std_dev(self):
+        """
+        Returns the standard devation of all the values.
+
+        @rtype: C{float}
+        @return: the standard deviation
+        """
+        return sqrt(self.get_variance())
+
+    def get_snapshot(self):
+        """
+        Returns a snapshot of the values of the samples of every thread.
+
+        @rtype: L{Snapshot} or L{BucketSnapshot}
+        @return: the snapshot of the current values
+        """
+        shards = self._recorded()
+        merged = self.sample_factory()
+        if not isinstance(merged, _POOLED):
+            for shard in shards:
+                merged.merge(shard.sample)
+            return merged.get_snapshot()
+
+        pooled = [(shard.sample.get_snapshot().get_values(), shard.count)
+                  for shard in shards]
+        if not hasattr(merged, "reservoir_size"):
+            # Unbounded samples, like time windows, hold every value.
+            weights = [1.0] * len(pooled)
+        else:
+            weights = [count / max(len(values), 1)
+                       for values, count in pooled]
+        heaviest = max(weights) if weights else 1.0
+        values = []
+        for (shard_values, _), weight in zip(pooled, weights):
+            keep = int(round(len(shard_values) * weight / heaviest))
+            if keep < len(shard_values):
+                shard_values = random_sample(shard_values, keep)
+            values.extend(shard_values)
+        return Snapshot(values)
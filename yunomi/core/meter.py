@@ -1,7 +1,6 @@
 from __future__ import division, absolute_import
 
-from time import time
-
+from yunomi.clock import NANOSECONDS_PER_SECOND, as_clock
 from yunomi.stats.ewma import EWMA
 
 
@@ -12,32 +11,92 @@ class Meter(object):
 
     @see: <a href="http://en.wikipedia.org/wiki/Moving_average#Exponential_moving_average">EMA</a>
     """
+    __slots__ = ("event_type", "scheduler", "clock", "start_time", "_count",
+                 "_m1_rate", "_m5_rate", "_m15_rate", "_updates",
+                 "__weakref__")
     INTERVAL = 5
 
-    def __init__(self, event_type=""):
+    def __init__(self, event_type="", scheduler=None, clock=None):
         """
         Creates a new L{Meter} instance.
 
         @type event_type: C{str}
         @param event_type: the plural name of the event the meter is measuring
                            (e.g., I{"requests"})
+        @type scheduler: L{TickScheduler}
+        @param scheduler: an optional scheduler which ticks the moving
+                          averages, instead of ticking them when they are read
+        @param clock: the clock, or a function returning seconds; defaults to
+                      L{yunomi.clock.DEFAULT_CLOCK}
         """
         self.event_type = event_type
-        self.start_time = time()
-        self._m1_rate = EWMA.one_minute_EWMA()
-        self._m5_rate = EWMA.five_minute_EWMA()
-        self._m15_rate = EWMA.fifteen_minute_EWMA()
-        self._count = 0
+        self.scheduler = scheduler
+        self.clock = as_clock(clock)
+        self._updates = 0
+        self.clear()
 
     def clear(self):
         """
         Resets the meter.
         """
-        self.start_time = time()
+        self.start_time = self.clock.nanoseconds()
         self._count = 0
-        self._m1_rate = EWMA.one_minute_EWMA()
-        self._m5_rate = EWMA.five_minute_EWMA()
-        self._m15_rate = EWMA.fifteen_minute_EWMA()
+        self._m1_rate = EWMA.one_minute_EWMA(self.clock)
+        self._m5_rate = EWMA.five_minute_EWMA(self.clock)
+        self._m15_rate = EWMA.fifteen_minute_EWMA(self.clock)
+        if self.scheduler is not None:
+            for rate in self._m1_rate, self._m5_rate, self._m15_rate:
+                self.scheduler.register(rate)
+
+    def get_snapshot_and_reset(self):
+        """
+        Returns the number of events since the last reset, and resets it
+        back to 0 along with the start of the mean rate. The moving averages
+        carry on, as they already only weigh recent events.
+
+        @rtype: C{int}
+        @return: the number of events since the last reset
+        """
+        now = self.clock.nanoseconds()
+        count, self._count = self._count, 0
+        self.start_time = now
+        return count
+
+    def _state(self):
+        """
+        Returns the count, the start of the mean rate, and the rate, the
+        events not counted in it yet, whether it is initialized and the time
+        of its last tick for each moving average.
+        """
+        rates = [(rate._rate, rate._uncounted, rate.initialized,
+                  rate._last_tick)
+                 for rate in (self._m1_rate, self._m5_rate, self._m15_rate)]
+        return self.get_count(), self.start_time, rates
+
+    def merge(self, other):
+        """
+        Adds the events of another meter, e.g. one decoded from another
+        process, to this one. The counts add up and so do the moving
+        averages, since the rate of the events of both meters is the sum of
+        their rates; the mean rate is taken from the earlier of the two
+        starts. The moving averages of this meter are ticked first, so the
+        events they have not counted yet are not smoothed into the rates of
+        I{other}. The two meters have to be on the same clock.
+
+        @type other: L{Meter} or L{ColumnarMeter}
+        @param other: the meter to merge into this one
+        """
+        self._tick()
+        count, start_time, rates = other._state()
+        self._count += count
+        self._updates += 1
+        if start_time < self.start_time:
+            self.start_time = start_time
+        for ewma, (rate, uncounted, initialized, _) in zip(
+                (self._m1_rate, self._m5_rate, self._m15_rate), rates):
+            ewma._rate += rate
+            ewma._uncounted += uncounted
+            ewma.initialized = ewma.initialized or bool(initialized)
 
     def get_event_type(self):
         """
@@ -50,11 +109,12 @@ class Meter(object):
 
     def _tick(self):
         """
-        Updates the moving averages.
+        Updates the moving averages, with a single clock read.
         """
-        self._m1_rate.tick()
-        self._m15_rate.tick()
-        self._m5_rate.tick()
+        now = self.clock.nanoseconds()
+        self._m1_rate.tick(now)
+        self._m15_rate.tick(now)
+        self._m5_rate.tick(now)
 
     def mark(self, n = 1):
         """
@@ -64,10 +124,18 @@ class Meter(object):
         @param n: number of events
         """
         self._count += n
+        self._updates += 1
         self._m1_rate.update(n)
         self._m15_rate.update(n)
         self._m5_rate.update(n)
 
+    def _generation(self):
+        """
+        Returns the number of updates so far, which only grows, for
+        L{MetricsRegistry.evict_idle}.
+        """
+        return self._updates
+
     def get_count(self):
         """
         Return the number of events that have been counted.
@@ -107,13 +175,15 @@ class Meter(object):
     def get_mean_rate(self):
         """
         Get the overall rate, the total number of events over the time since
-        the beginning.
+        the beginning. It is 0 until some time has passed, e.g. with a
+        frozen clock or right after L{get_snapshot_and_reset}.
 
         @rtype: C{float}
         @return: the mean minute rate
         """
         if self._count == 0:
             return 0.0
-        else:
-            elapsed = time() - self.start_time
-            return float(self._count) / elapsed
+        elapsed = self.clock.nanoseconds() - self.start_time
+        if elapsed <= 0:
+            return 0.0
+        return self._count * NANOSECONDS_PER_SECOND / elapsed
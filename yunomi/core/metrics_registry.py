@@ -1,255 +1,970 @@
 from __future__ import division, absolute_import
 
-from time import time
+from bisect import insort
+from copy import copy
+from threading import Lock
 from functools import wraps
-
-from yunomi.compat import dict_item_iter
-from yunomi.core.counter import Counter
-from yunomi.core.histogram import Histogram
+from weakref import ref
+
+from yunomi.clock import as_clock
+from yunomi.compat import (_ASYNC, dict_item_iter, iscoroutinefunction,
+                           isasyncgenfunction)
+from yunomi.core import serialization
+from yunomi.core.counter import Counter, StripedCounter
+from yunomi.core.family import MetricFamily
+from yunomi.core.gauge import CallbackGauge, Gauge
+from yunomi.core.histogram import Histogram, StripedHistogram
 from yunomi.core.meter import Meter
 from yunomi.core.timer import Timer
+from yunomi.stats.exp_decay_sample import ExponentiallyDecayingSample
+from yunomi.stats.sliding_time_window_sample import SlidingTimeWindowSample
+from yunomi.stats.uniform_sample import UniformSample
+
+if _ASYNC:
+    from yunomi.core import coroutines
+
+
+# The stats reported for each kind of metric, as (suffix, whether the stat is
+# read from a snapshot, name of the getter), sorted by suffix.
+_METER_STATS = [("15m_rate", False, "get_fifteen_minute_rate"),
+                ("5m_rate", False, "get_five_minute_rate"),
+                ("1m_rate", False, "get_one_minute_rate"),
+                ("mean_rate", False, "get_mean_rate")]
+_HISTOGRAM_STATS = [("avg", False, "get_mean"),
+                    ("max", False, "get_max"),
+                    ("min", False, "get_min"),
+                    ("std_dev", False, "get_std_dev"),
+                    ("75_percentile", True, "get_75th_percentile"),
+                    ("98_percentile", True, "get_98th_percentile"),
+                    ("99_percentile", True, "get_99th_percentile"),
+                    ("999_percentile", True, "get_999th_percentile")]
+_STATS = {
+    "counter": [("count", False, "get_count")],
+    "gauge": [("value", False, "get_value")],
+    "histogram": sorted(_HISTOGRAM_STATS),
+    "meter": sorted(_METER_STATS),
+    "timer": sorted(_HISTOGRAM_STATS + _METER_STATS),
+}
+_TYPES = {
+    "counter": "int",
+    "gauge": "float",
+    "histogram": "float",
+    "meter": "float",
+    "timer": "float",
+}
+
+# The counters of the metrics a registry dropped, labeled by kind and by
+# reason, and the keys of the metrics standing in for the ones refused over
+# the cardinality limit of a kind.
+DROPPED_KEY = "yunomi_dropped_metrics"
+OVERFLOW_KEY = "yunomi_overflow_%s"
+
+
+def _label_pairs(labels):
+    """
+    Returns labels given as a C{dict} or a sequence as a tuple of
+    C{(name, value)} pairs, in their order.
+    """
+    if isinstance(labels, dict):
+        return tuple(dict_item_iter(labels))
+    return tuple(labels)
 
 
 class MetricsRegistry(object):
     """
     A single interface used to gather metrics on a service. It keeps track of
-    all the relevant Counters, Meters, Histograms, and Timers. It does not have
-    a reference back to its service. The service would create a
-    L{MetricsRegistry} to manage all of its metrics tools.
+    all the relevant Counters, Gauges, Meters, Histograms, and Timers. It
+    does not have a reference back to its service. The service would create
+    a L{MetricsRegistry} to manage all of its metrics tools.
     """
-    def __init__(self, clock=time):
+    def __init__(self, clock=None, scheduler=None, meter_store=None,
+                 max_metrics=None, idle_timeout=None):
         """
         Creates a new L{MetricsRegistry} instance.
+
+        @param clock: the clock, or a function returning seconds, of all the
+                      meters, timers and biased histograms created by this
+                      registry; defaults to L{yunomi.clock.DEFAULT_CLOCK}
+
+        @param scheduler: an optional scheduler which ticks the rates of all
+                          the meters and timers created by this registry
+        @type scheduler: L{TickScheduler}
+
+        @param meter_store: an optional store which keeps the meters of this
+                            registry and of its timers, to use less memory
+                            per metric; it has its own clock and scheduler
+        @type meter_store: L{ColumnarMeterStore}
+
+        @param max_metrics: the most metrics of each kind the registry keeps,
+                            either for every kind or as a C{dict} of kind to
+                            limit, e.g. C{{"timer": 1000}}; once a kind is
+                            full, new metrics of that kind are all the one
+                            overflow metric under C{"yunomi_overflow_<kind>"}
+        @type max_metrics: C{int} or C{dict}
+
+        @param idle_timeout: the number of seconds after which
+                             L{evict_idle} drops a metric which has not
+                             been updated
+        @type idle_timeout: C{int} or C{float}
         """
         self._timers = {}
         self._meters = {}
         self._counters = {}
         self._histograms = {}
+        self._gauges = {}
+        self._kinds = {
+            "counter": self._counters,
+            "gauge": self._gauges,
+            "histogram": self._histograms,
+            "meter": self._meters,
+            "timer": self._timers,
+        }
+        self._families = {
+            "counter": {},
+            "gauge": {},
+            "histogram": {},
+            "meter": {},
+            "timer": {},
+        }
+        self._index = []
+        self._lock = Lock()
+
+        self._clock = as_clock(clock)
+        self._scheduler = scheduler
+        self._meter_store = meter_store
+
+        if isinstance(max_metrics, dict):
+            self._limits = dict(max_metrics)
+        else:
+            self._limits = dict.fromkeys(self._kinds, max_metrics)
+        self._idle_timeout = idle_timeout
+        self._activity = {}
+        # Weak references to the evicted metrics, and their activity then.
+        self._evicted = {}
+        # The overflow metrics and dropped counters, not held to the limits.
+        self._exempt = dict.fromkeys(self._kinds, 0)
+        # The children of families by kind, key and labels as the getters
+        # were given them, so that getting one again is a single probe.
+        self._labeled = {}
+
+    def _add(self, kind, key, factory, labels=(), family=None, values=()):
+        """
+        Adds a new metric to the registry and to the sorted index of all
+        metrics, unless another thread got there first. Only creating a
+        metric takes the registry's lock; looking up an existing one never
+        does. A metric over the limit of its kind is not added, and the
+        overflow metric of the kind is returned instead, see L{_overflow}.
+
+        @param kind: the kind of metric, e.g. C{"counter"}
+        @type kind: C{str}
+        @param key: name of the metric
+        @type key: C{str}
+        @param factory: a callable returning the new metric
+        @param labels: the labels of a child of a L{MetricFamily}, as
+                       C{(name, value)} pairs; a labeled metric is kept under
+                       C{(key, labels)}
+        @type labels: C{tuple}
+        @param family: the family caching the child under its label
+                       I{values}, which is done with the lock held so that
+                       L{evict_idle} never leaves an evicted child cached
+        @type family: L{MetricFamily}
+
+        @return: the metric registered under I{key} and I{labels}
+        """
+        metrics = self._kinds[kind]
+        name = (key, labels) if labels else key
+        with self._lock:
+            metric = metrics.get(name)
+            if metric is None:
+                metric = self._revive(kind, key, labels)
+            if metric is None and (key == DROPPED_KEY or not self._full(kind)):
+                metric = metrics[name] = self._create(kind, key, labels,
+                                                      factory)
+                insort(self._index, (key, kind, labels))
+                if key == DROPPED_KEY:
+                    self._exempt[kind] += 1
+            if metric is not None and family is not None:
+                registered = self._families[kind].setdefault(key, family)
+                if registered is not family:
+                    # The family was evicted, and another one took its place.
+                    if registered.label_names != family.label_names:
+                        return metric
+                    family._children = registered._children
+                family._children[values] = metric
+        if metric is None:
+            return self._overflow(kind, factory)
+        return metric
+
+    def _full(self, kind):
+        """
+        Returns whether a kind of metric has reached its limit, see
+        L{MetricsRegistry}.
+        """
+        limit = self._limits.get(kind)
+        return (limit is not None and
+                len(self._kinds[kind]) - self._exempt[kind] >= limit)
+
+    def _overflow(self, kind, factory):
+        """
+        Returns the metric standing in for all the metrics of a kind refused
+        over its limit, created with the factory of the first one, and
+        counts the refusal.
+        """
+        self.counter(DROPPED_KEY,
+                     labels=(("kind", kind), ("reason", "overflow"))).inc()
+        metrics = self._kinds[kind]
+        key = OVERFLOW_KEY % (kind,)
+        with self._lock:
+            metric = metrics.get(key)
+            if metric is None:
+                metric = self._revive(kind, key, ())
+            if metric is None:
+                metric = metrics[key] = self._create(kind, key, (), factory)
+                insort(self._index, (key, kind, ()))
+                self._exempt[kind] += 1
+        return metric
+
+    def _create(self, kind, key, labels, factory):
+        """
+        Creates a new metric of a kind, key and labels with its factory, for
+        L{_add} and L{_overflow}; subclasses keeping some kinds elsewhere,
+        e.g. L{SharedMetricsRegistry}, override it.
+        """
+        return factory()
+
+    def _revive(self, kind, key, labels):
+        """
+        Registers an evicted metric again, if anything still refers to it,
+        and returns it; the lock must be held.
+        """
+        name = (key, labels) if labels else key
+        evicted = self._evicted.pop((kind, name), None)
+        if evicted is None:
+            return None
+        metric = evicted[0]()
+        if metric is not None:
+            self._kinds[kind][name] = metric
+            insort(self._index, (key, kind, labels))
+            if key == OVERFLOW_KEY % (kind,):
+                self._exempt[kind] += 1
+        return metric
+
+    def family(self, kind, key, label_names, **options):
+        """
+        Gets the family of metrics of a kind under a key, whose children
+        differ by the values of their labels; creates it if it does not
+        exist. Keeping the family, or a child of it, saves looking them up
+        again:
 
-        self._clock = clock
+            requests = registry.family("timer", "http", ("endpoint", "status"))
+            requests.labels("/", 200).update(duration)
 
-    def counter(self, key):
+        @param kind: the kind of the children, e.g. C{"timer"}
+        @type kind: C{str}
+        @param key: name of the metrics
+        @type key: C{str}
+        @param label_names: the names of the labels of the children
+        @type label_names: C{tuple} of C{str}
+        @param options: the options of the children, as for L{counter},
+                        L{histogram}, L{meter} or L{timer}, e.g.
+                        C{striped=True}
+
+        @rtype: L{MetricFamily}
+        @raise ValueError: if the family exists with other label names
+        """
+        families = self._families[kind]
+        family = families.get(key)
+        if family is None:
+            factory = getattr(self, "_%s_factory" % kind)(**options)
+            with self._lock:
+                family = families.get(key)
+                if family is None:
+                    family = families[key] = MetricFamily(
+                        self, kind, key, label_names, factory)
+        if family.label_names != tuple(label_names):
+            raise ValueError("The {0} {1} has the labels {2}".format(
+                kind, key, ", ".join(family.label_names)))
+        return family
+
+    def _child(self, kind, key, labels, options):
+        """
+        Gets the child of a family with labels given by name, as
+        C{(name, value)} pairs, creating the family, with the label names
+        sorted, if it does not exist. The child is cached under the labels
+        as they were given, unless it is the overflow metric of its kind.
+        """
+        family = self._families[kind].get(key)
+        if family is None:
+            factory = getattr(self, "_%s_factory" % kind)(**options)
+            if self._full(kind) and key != DROPPED_KEY:
+                # No family is kept for a key which only overflows.
+                return self._add(kind, key, factory, tuple(sorted([
+                    (name, "%s" % (value,)) for name, value in labels])))
+            family = self.family(kind, key,
+                                 sorted([name for name, _ in labels]),
+                                 **options)
+        child = family.child(labels)
+        if child is not self._kinds[kind].get(OVERFLOW_KEY % (kind,)):
+            self._labeled[(kind, key, labels)] = child
+        return child
+
+    def counter(self, key, striped=False, labels=None):
         """
         Gets a counter based on a key, creates a new one if it does not exist.
 
         @param key: name of the metric
         @type key: C{str}
 
-        @return: L{Counter}
+        @param striped: whether a new counter should be a thread-safe
+                        L{StripedCounter}
+        @type striped: C{bool}
+
+        @param labels: the labels of the counter, e.g.
+                       C{(("status", 200),)}, which make it a child of the
+                       family of I{key}; see L{family}. Getting a child
+                       again under the same tuple of C{(name, value)} pairs
+                       is a single dict probe; a C{dict} is turned into
+                       such a tuple first.
+        @type labels: C{tuple} or C{dict}
+
+        @return: L{Counter} or L{StripedCounter}
+        """
+        if labels:
+            if labels.__class__ is not tuple:
+                labels = _label_pairs(labels)
+            child = self._labeled.get(("counter", key, labels))
+            if child is None:
+                child = self._child("counter", key, labels,
+                                    {"striped": striped})
+            return child
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = self._add("counter", key, self._counter_factory(striped))
+        return counter
+
+    def _counter_factory(self, striped=False):
         """
-        if key not in self._counters:
-            self._counters[key] = Counter()
-        return self._counters[key]
+        Returns a callable creating a new counter; see L{counter}.
+        """
+        if striped:
+            return StripedCounter
+        return Counter
 
-    def histogram(self, key, biased=False):
+    def gauge(self, key, callback=None, ttl=None, labels=None):
         """
-        Gets a histogram based on a key, creates a new one if it does not exist.
+        Gets a gauge based on a key, creates a new one if it does not exist.
 
         @param key: name of the metric
         @type key: C{str}
 
-        @return: L{Histogram}
+        @param callback: a callable without arguments computing the value
+                         of a new gauge whenever it is read, which makes it
+                         a L{CallbackGauge}
+        @param ttl: the number of seconds a L{CallbackGauge} caches the
+                    value of I{callback} for, on the clock of the registry
+        @type ttl: C{int} or C{float}
+
+        @param labels: the labels of the gauge, which make it a child of the
+                       family of I{key}; see L{counter}
+        @type labels: C{tuple} or C{dict}
+
+        @return: L{Gauge} or L{CallbackGauge}
         """
-        if key not in self._histograms:
-            if biased:
-                self._histograms[key] = Histogram.get_biased()
-            else:
-                self._histograms[key] = Histogram.get_uniform()
+        if labels:
+            if labels.__class__ is not tuple:
+                labels = _label_pairs(labels)
+            child = self._labeled.get(("gauge", key, labels))
+            if child is None:
+                child = self._child("gauge", key, labels, {
+                    "callback": callback, "ttl": ttl})
+            return child
+        gauge = self._gauges.get(key)
+        if gauge is None:
+            gauge = self._add("gauge", key, self._gauge_factory(callback,
+                                                                ttl))
+        return gauge
+
+    def _gauge_factory(self, callback=None, ttl=None):
+        """
+        Returns a callable creating a new gauge; see L{gauge}.
+        """
+        if callback is not None:
+            return lambda: CallbackGauge(callback, ttl, self._clock)
+        return Gauge
 
-        return self._histograms[key]
+    def histogram(self, key, biased=False, sample=None, window=None,
+                  striped=False, labels=None):
+        """
+        Gets a histogram based on a key, creates a new one if it does not
+        exist.
 
-    def meter(self, key):
+        @param key: name of the metric
+        @type key: C{str}
+
+        @param biased: whether a new histogram should use an
+                       L{ExponentiallyDecayingSample} rather than an
+                       L{UniformSample}
+        @type biased: C{bool}
+
+        @param sample: a callable returning the sample for a new histogram,
+                       e.g. L{HdrSample} or L{SlidingWindowSample}; takes
+                       precedence over I{biased}
+
+        @param window: the number of seconds a new histogram should keep its
+                       values for, in a L{SlidingTimeWindowSample} on the
+                       clock of the registry; takes precedence over
+                       I{sample} and I{biased}
+        @type window: C{int} or C{float}
+
+        @param striped: whether a new histogram should be a thread-safe
+                        L{StripedHistogram}, with one such sample per thread
+        @type striped: C{bool}
+
+        @param labels: the labels of the histogram, which make it a child of
+                       the family of I{key}; see L{counter}
+        @type labels: C{tuple} or C{dict}
+
+        @return: L{Histogram} or L{StripedHistogram}
+        """
+        if labels:
+            if labels.__class__ is not tuple:
+                labels = _label_pairs(labels)
+            child = self._labeled.get(("histogram", key, labels))
+            if child is None:
+                child = self._child("histogram", key, labels, {
+                    "biased": biased, "sample": sample, "window": window,
+                    "striped": striped})
+            return child
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._add("histogram", key, self._histogram_factory(
+                biased, sample, window, striped))
+        return histogram
+
+    def _histogram_factory(self, biased=False, sample=None, window=None,
+                           striped=False):
+        """
+        Returns a callable creating a new histogram; see L{histogram}.
+        """
+        new_sample = self._sample_factory(biased, sample, window)
+        if striped:
+            return lambda: StripedHistogram(new_sample)
+        return lambda: Histogram(new_sample())
+
+    def _sample_factory(self, biased=False, sample=None, window=None):
+        """
+        Returns a callable creating the sample of a new histogram; see
+        L{histogram}.
+        """
+        if window is not None:
+            return lambda: SlidingTimeWindowSample(window, self._clock)
+        if sample is not None:
+            return sample
+        if biased:
+            return lambda: ExponentiallyDecayingSample(
+                Histogram.DEFAULT_SAMPLE_SIZE, Histogram.DEFAULT_ALPHA,
+                self._clock)
+        return lambda: UniformSample(Histogram.DEFAULT_SAMPLE_SIZE)
+
+    def meter(self, key, labels=None):
         """
         Gets a meter based on a key, creates a new one if it does not exist.
 
         @param key: name of the metric
         @type key: C{str}
 
+        @param labels: the labels of the meter, which make it a child of the
+                       family of I{key}; see L{counter}
+        @type labels: C{tuple} or C{dict}
+
         @return: L{Meter}
         """
-        if key not in self._meters:
-            self._meters[key] = Meter()
-        return self._meters[key]
+        if labels:
+            if labels.__class__ is not tuple:
+                labels = _label_pairs(labels)
+            child = self._labeled.get(("meter", key, labels))
+            if child is None:
+                child = self._child("meter", key, labels, {})
+            return child
+        meter = self._meters.get(key)
+        if meter is None:
+            meter = self._add("meter", key, self._new_meter)
+        return meter
+
+    def _meter_factory(self):
+        """
+        Returns a callable creating a new meter; see L{meter}.
+        """
+        return self._new_meter
 
-    def timer(self, key):
+    def _new_meter(self, event_type=""):
+        """
+        Creates a meter, in the meter store if the registry has one.
+        """
+        if self._meter_store is not None:
+            return self._meter_store.meter(event_type)
+        return Meter(event_type, self._scheduler, self._clock)
+
+    def timer(self, key, sample=None, window=None, striped=False,
+              labels=None):
         """
         Gets a timer based on a key, creates a new one if it does not exist.
 
         @param key: name of the metric
         @type key: C{str}
 
+        @param sample: a callable returning the sample for the histogram of a
+                       new timer, e.g. L{HdrSample}
+
+        @param window: the number of seconds a new timer should keep its
+                       durations for, in a L{SlidingTimeWindowSample} on the
+                       clock of the registry; takes precedence over I{sample}
+        @type window: C{int} or C{float}
+
+        @param striped: whether a new timer should record its durations into
+                        a thread-safe L{StripedHistogram}
+        @type striped: C{bool}
+
+        @param labels: the labels of the timer, e.g.
+                       C{(("endpoint", "/"),)}, which make it a child of the
+                       family of I{key}; see L{counter}
+        @type labels: C{tuple} or C{dict}
+
         @return: L{Timer}
         """
-        if key not in self._timers:
-            self._timers[key] = Timer()
-        return self._timers[key]
+        if labels:
+            if labels.__class__ is not tuple:
+                labels = _label_pairs(labels)
+            child = self._labeled.get(("timer", key, labels))
+            if child is None:
+                child = self._child("timer", key, labels, {
+                    "sample": sample, "window": window, "striped": striped})
+            return child
+        timer = self._timers.get(key)
+        if timer is None:
+            timer = self._add("timer", key, self._timer_factory(
+                sample, window, striped))
+        return timer
+
+    def _timer_factory(self, sample=None, window=None, striped=False):
+        """
+        Returns a callable creating a new timer; see L{timer}.
+        """
+        if window is not None:
+            sample = self._sample_factory(window=window)
+        if striped:
+            new_sample = self._sample_factory(True, sample)
+            return lambda: Timer(
+                self._scheduler, None, self._clock, self._new_meter("calls"),
+                StripedHistogram(new_sample))
+        return lambda: Timer(self._scheduler, sample and sample(),
+                             self._clock, self._new_meter("calls"))
+
+    def count_calls(self, fn=None, name=None):
+        """
+        Decorator to track the number of times a function is called. The
+        counter is looked up once, when the function is decorated. Coroutine
+        and async generator functions stay so, and are counted when called.
 
-    def dump_metrics(self):
+        Use it bare, as C{@count_calls}, to count into I{"<function>_calls"},
+        or as C{@count_calls(name="...")} to pick the name of the counter.
+
+        @param fn: the function to be decorated
+        @type fn: C{func}
+        @param name: the name of the counter
+        @type name: C{str}
+
+        @return: the decorated function
+        @rtype: C{func}
         """
-        Formats all the metrics into dicts, and returns a list of all of them
+        if fn is None:
+            return lambda fn: self.count_calls(fn, name)
+        inc = self.counter(name or "%s_calls" % fn.__name__).inc
+        if iscoroutinefunction(fn):
+            return coroutines.call_before_coroutine(fn, inc)
+        if isasyncgenfunction(fn):
+            return coroutines.call_before_async_generator(fn, inc)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            inc()
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def meter_calls(self, fn=None, name=None):
+        """
+        Decorator to the rate at which a function is called. The meter is
+        looked up once, when the function is decorated. Coroutine and async
+        generator functions stay so, and are marked when called.
 
-        @return: C{list} of C{dict} of metrics
+        Use it bare, as C{@meter_calls}, to mark I{"<function>_calls"}, or as
+        C{@meter_calls(name="...")} to pick the name of the meter.
+
+        @param fn: the function to be decorated
+        @type fn: C{func}
+        @param name: the name of the meter
+        @type name: C{str}
+
+        @return: the decorated function
+        @rtype: C{func}
         """
-        metrics = []
+        if fn is None:
+            return lambda fn: self.meter_calls(fn, name)
+        mark = self.meter(name or "%s_calls" % fn.__name__).mark
+        if iscoroutinefunction(fn):
+            return coroutines.call_before_coroutine(fn, mark)
+        if isasyncgenfunction(fn):
+            return coroutines.call_before_async_generator(fn, mark)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            mark()
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def hist_calls(self, fn=None, name=None):
+        """
+        Decorator to check the distribution of return values of a function.
+        The histogram is looked up once, when the function is decorated. For
+        coroutine functions, the values they return once awaited are used.
 
-        # format timed stats
-        for key, timer in dict_item_iter(self._timers):
-            snapshot = timer.get_snapshot()
-            for suffix, val in (("avg", timer.get_mean()),
-                                ("max", timer.get_max()),
-                                ("min", timer.get_min()),
-                                ("std_dev", timer.get_std_dev()),
-                                ("15m_rate", timer.get_fifteen_minute_rate()),
-                                ("5m_rate", timer.get_five_minute_rate()),
-                                ("1m_rate", timer.get_one_minute_rate()),
-                                ("mean_rate", timer.get_mean_rate()),
-                                ("75_percentile", snapshot.get_75th_percentile()),
-                                ("98_percentile", snapshot.get_98th_percentile()),
-                                ("99_percentile", snapshot.get_99th_percentile()),
-                                ("999_percentile", snapshot.get_999th_percentile())):
-                k = "_".join([key, suffix])
-                _new_metric = {
-                    "type": "float",
-                    "name": k,
-                    "value": val,
-                }
-                metrics.append(_new_metric)
-
-        # format meter stats
-        for key, meter in dict_item_iter(self._meters):
-            for suffix, val in (("15m_rate", meter.get_fifteen_minute_rate()),
-                                ("5m_rate", meter.get_five_minute_rate()),
-                                ("1m_rate", meter.get_one_minute_rate()),
-                                ("mean_rate", meter.get_mean_rate())):
-                k = "_".join([key, suffix])
-                _new_metric = {
-                    "type": "float",
-                    "name": k,
-                    "value": val,
-                }
-                metrics.append(_new_metric)
-
-        # format histogram stats
-        for key, histogram in dict_item_iter(self._histograms):
-            snapshot = histogram.get_snapshot()
-            for suffix, val in (("avg", histogram.get_mean()),
-                                ("max", histogram.get_max()),
-                                ("min", histogram.get_min()),
-                                ("std_dev", histogram.get_std_dev()),
-                                ("75_percentile", snapshot.get_75th_percentile()),
-                                ("98_percentile", snapshot.get_98th_percentile()),
-                                ("99_percentile", snapshot.get_99th_percentile()),
-                                ("999_percentile", snapshot.get_999th_percentile())):
-                k = "_".join([key, suffix])
-                _new_metric = {
-                    "type": "float",
-                    "name": k,
-                    "value": val,
-                }
-                metrics.append(_new_metric)
-
-        # format counter stats
-        for key, counter in dict_item_iter(self._counters):
-            k = "_".join([key, "count"])
-            val = counter.get_count()
-            _new_metric = {
-                "type": "int",
-                "name": k,
-                "value": val
-            }
-            metrics.append(_new_metric)
+        Use it bare, as C{@hist_calls}, to update I{"<function>_calls"}, or
+        as C{@hist_calls(name="...")} to pick the name of the histogram.
 
-        # alphabetize
-        metrics.sort(key=lambda x: x["name"])
+        @param fn: the function to be decorated
+        @type fn: C{func}
+        @param name: the name of the histogram
+        @type name: C{str}
+
+        @return: the decorated function
+        @rtype: C{func}
+        """
+        if fn is None:
+            return lambda fn: self.hist_calls(fn, name)
+        update = self.histogram(name or "%s_calls" % fn.__name__).update
+        if iscoroutinefunction(fn):
+            return coroutines.hist_coroutine(fn, update)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            rtn = fn(*args, **kwargs)
+            if type(rtn) in (int, float):
+                update(rtn)
+            return rtn
+        return wrapper
+
+    def time_calls(self, fn=None, name=None):
+        """
+        Decorator to time the execution of the function, in nanoseconds on
+        the clock of the registry. The timer is looked up once, when the
+        function is decorated. Coroutines are timed until they return, and
+        async generators until they are exhausted, including the time they
+        spend suspended.
+
+        Use it bare, as C{@time_calls}, to update I{"<function>_calls"}, or
+        as C{@time_calls(name="...")} to pick the name of the timer.
+
+        @param fn: the function to be decorated
+        @type fn: C{func}
+        @param name: the name of the timer
+        @type name: C{str}
+
+        @return: the decorated function
+        @rtype: C{func}
+        """
+        if fn is None:
+            return lambda fn: self.time_calls(fn, name)
+        timer = self.timer(name or "%s_calls" % fn.__name__)
+        update = timer.update
+        clock = timer.clock.nanoseconds
+        if iscoroutinefunction(fn):
+            return coroutines.time_coroutine(fn, update, clock)
+        if isasyncgenfunction(fn):
+            return coroutines.time_async_generator(fn, update, clock)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                update(clock() - start)
+        return wrapper
+
+    def metrics(self):
+        """
+        Returns every metric of the registry, ordered by key, kind and
+        labels, from an index which is kept sorted as metrics are created,
+        so the children of a L{MetricFamily} come together.
+
+        @return: C{list} of C{(key, kind, metric, labels)} C{tuple}s, where
+                 I{kind} is one of C{"counter"}, C{"gauge"},
+                 C{"histogram"}, C{"meter"} and C{"timer"}, and I{labels}
+                 the C{(name, value)} pairs of a child of a family, or
+                 C{()}
+        """
+        kinds = self._kinds
+        metrics = []
+        for key, kind, labels in list(self._index):
+            # A metric evicted since the index was copied is left out.
+            metric = kinds[kind].get((key, labels) if labels else key)
+            if metric is not None:
+                metrics.append((key, kind, metric, labels))
         return metrics
 
+    def evict_idle(self):
+        """
+        Drops the metrics which have not been updated for the
+        I{idle_timeout} of the registry, if it has one, and counts them
+        under C{"yunomi_dropped_metrics"}. A metric is idle when the number
+        of its updates, e.g. of the times a L{Gauge} was set, has not
+        changed since an earlier call. Updates only pay an increment for
+        this, but a call reads every metric, e.g. for seconds at hundreds of
+        thousands of them; call it from a thread of its own, every minute
+        or so, as L{PrometheusExporter} does. A L{CallbackGauge} is never
+        evicted.
+
+        The registry only keeps a weak reference to an evicted metric. One
+        still held, e.g. by a decorator or as the child of a family, and
+        updated since is registered again by the next call, with everything
+        it recorded in the meantime; so is one looked up again by its key.
+
+        @rtype: C{int}
+        @return: the number of metrics dropped
+        """
+        if self._idle_timeout is None:
+            return 0
+        now = self._clock.seconds()
+        deadline = now - self._idle_timeout
+        kinds, activity = self._kinds, self._activity
+        with self._lock:
+            for (kind, name), (metric_ref, seen) in list(
+                    self._evicted.items()):
+                metric = metric_ref()
+                if metric is None:
+                    del self._evicted[(kind, name)]
+                elif metric._generation() != seen:
+                    if isinstance(name, tuple):
+                        self._revive(kind, name[0], name[1])
+                    else:
+                        self._revive(kind, name, ())
+
+        idle = []
+        for key, kind, labels in list(self._index):
+            if key == DROPPED_KEY:
+                continue
+            name = (key, labels) if labels else key
+            metric = kinds[kind].get(name)
+            if metric is None or isinstance(metric, CallbackGauge):
+                continue
+            count = metric._generation()
+            seen = activity.get((kind, name))
+            if seen is None or seen[0] != count:
+                activity[(kind, name)] = (count, now)
+            elif seen[1] <= deadline:
+                idle.append((key, kind, labels, metric, count))
+
+        dropped, removed, evicted = {}, set(), {}
+        with self._lock:
+            for key, kind, labels, metric, count in idle:
+                # Skip the metrics updated since they were read.
+                if metric._generation() != count:
+                    continue
+                name = (key, labels) if labels else key
+                del kinds[kind][name]
+                del activity[(kind, name)]
+                self._evicted[(kind, name)] = (ref(metric), count)
+                if key == OVERFLOW_KEY % (kind,):
+                    self._exempt[kind] -= 1
+                removed.add((key, kind, labels))
+                if labels:
+                    evicted.setdefault((kind, key), set()).add(id(metric))
+                dropped[kind] = dropped.get(kind, 0) + 1
+            if removed:
+                self._index = [entry for entry in self._index
+                               if entry not in removed]
+                self._labeled.clear()
+            for (kind, key), metric_ids in dict_item_iter(evicted):
+                family = self._families[kind].get(key)
+                if family is not None:
+                    children = family._children
+                    for values, child in list(children.items()):
+                        if id(child) in metric_ids:
+                            del children[values]
+            for families in self._families.values():
+                for key, family in list(families.items()):
+                    if not family._children:
+                        del families[key]
+        for kind, n in dict_item_iter(dropped):
+            self.counter(DROPPED_KEY,
+                         labels=(("kind", kind), ("reason", "idle"))).inc(n)
+        return sum(dropped.values())
+
+    def serialize(self):
+        """
+        Encodes the full state of every metric of the registry compactly,
+        e.g. to ship it to another host; see L{yunomi.core.serialization}.
+        The gauges whose value is not a number are skipped, and counted
+        under L{DROPPED_KEY} with the reason C{"error"}.
 
-_global_registry = MetricsRegistry()
+        @rtype: C{bytes}
+        @return: the encoded registry, see L{MetricsRegistry.deserialize}
+        """
+        skipped = []
+        data = serialization.serialize(self.metrics(), skipped)
+        for key, kind, labels in skipped:
+            self.counter(DROPPED_KEY,
+                         labels=(("kind", kind), ("reason", "error"))).inc()
+        return data
+
+    @classmethod
+    def deserialize(klass, data, clock=None):
+        """
+        Creates a registry of the metrics encoded by
+        L{MetricsRegistry.serialize}.
 
-counter = _global_registry.counter
-histogram = _global_registry.histogram
-meter = _global_registry.meter
-timer = _global_registry.timer
-dump_metrics = _global_registry.dump_metrics
+        @type data: C{bytes}, C{bytearray} or C{memoryview}
+        @param data: the encoded registry
+        @param clock: the clock of the new registry, see L{MetricsRegistry}
 
-def count_calls(fn):
-    """
-    Decorator to track the number of times a function is called.
+        @rtype: L{MetricsRegistry}
+        @raise ValueError: if I{data} is not an encoded registry
+        """
+        registry = klass(clock=clock)
+        for key, kind, metric, labels in serialization.deserialize(
+                data, registry._clock):
+            registry._add(kind, key, lambda: metric, labels)
+        return registry
 
-    @param fn: the function to be decorated
-    @type fn: C{func}
+    def merge(self, other):
+        """
+        Adds the metrics of another registry, e.g. one decoded from another
+        process or host with L{MetricsRegistry.deserialize}, to the metrics
+        of the same key and kind in this one, creating the ones it does not
+        have yet, with the same labels: counts, the values of gauges and the
+        rates of meters add up, and histograms and timers combine their
+        statistics exactly and merge their samples, see L{Histogram.merge}.
+        The metrics of I{other} are left alone. To fold many encoded
+        registries, see L{RegistryAggregator}.
+
+        @type other: L{MetricsRegistry}
+        @param other: the registry to merge into this one
+
+        @raise ValueError: if two histograms or timers of the same key have
+                           different kinds of samples, or a gauge would be
+                           merged into a L{CallbackGauge}
+        """
+        for key, kind, metric, labels in other.metrics():
+            self._merge(key, kind, metric, labels)
 
-    @return: the decorated function
-    @rtype: C{func}
-    """
-    @wraps(fn)
-    def wrapper(*args):
-        counter("%s_calls" % fn.__name__).inc()
-        try:
-            return fn(*args)
-        except:
-            raise
-    return wrapper
-
-def meter_calls(fn):
-    """
-    Decorator to the rate at which a function is called.
+    def _merge(self, key, kind, metric, labels=(), adopt=False):
+        """
+        Merges a metric into the metric of the same key, kind and labels,
+        creating an empty one like it if there is none; with I{adopt},
+        I{metric} itself is registered instead, when nothing else can refer
+        to it.
+        """
+        existing = self._kinds[kind].get((key, labels) if labels else key)
+        if existing is None:
+            if adopt:
+                existing = self._add(kind, key, lambda: metric, labels)
+                if existing is metric:
+                    return
+            else:
+                existing = self._add(
+                    kind, key, lambda: self._empty_like(kind, metric), labels)
+        existing.merge(metric)
 
-    @param fn: the function to be decorated
-    @type fn: C{func}
+    def _empty_like(self, kind, metric):
+        """
+        Creates an empty metric of this registry to merge I{metric} into,
+        with the same kind of sample for histograms and timers.
+        """
+        if kind == "counter":
+            return Counter()
+        if kind == "gauge":
+            return Gauge()
+        if kind == "meter":
+            return self._new_meter(metric.get_event_type())
+        if kind == "histogram":
+            return self._empty_histogram(metric)
+        return Timer(self._scheduler, None, self._clock,
+                     self._new_meter("calls"),
+                     self._empty_histogram(metric.histogram))
+
+    def _empty_histogram(self, histogram):
+        """
+        Creates an empty L{Histogram} with a sample like the one of
+        I{histogram}.
+        """
+        if isinstance(histogram, StripedHistogram):
+            return Histogram(histogram.sample_factory())
+        # Histogram() clears the copy, which gets its own values.
+        return Histogram(copy(histogram.sample))
 
-    @return: the decorated function
-    @rtype: C{func}
-    """
-    @wraps(fn)
-    def wrapper(*args):
-        meter("%s_calls" % fn.__name__).mark()
-        try:
-            return fn(*args)
-        except:
-            raise
-    return wrapper
-
-def hist_calls(fn):
-    """
-    Decorator to check the distribution of return values of a function.
+    def iter_metrics(self, suffixes=None):
+        """
+        Formats the metrics into dicts like L{dump_metrics}, but yields them
+        one at a time, ordered by key, labels and then by suffix, see
+        L{metrics}.
+        Only the stats whose suffixes are in I{suffixes} are computed, and a
+        snapshot is only taken if one of them is a percentile.
 
-    @param fn: the function to be decorated
-    @type fn: C{func}
+        @param suffixes: the suffixes of the stats to compute, e.g.
+                         C{("count", "99_percentile")}; defaults to all of them
+        @type suffixes: C{set} of C{str}
 
-    @return: the decorated function
-    @rtype: C{func}
-    """
-    @wraps(fn)
-    def wrapper(*args):
-        _histogram = histogram("%s_calls" % fn.__name__)
-        try:
-            rtn = fn(*args)
-            if type(rtn) in (int, float):
-                _histogram.update(rtn)
-            return rtn
-        except:
-            raise
-    return wrapper
+        @return: an iterator of C{dict} of metrics
+        """
+        stats = {}
+        for kind, kind_stats in dict_item_iter(_STATS):
+            stats[kind] = [stat for stat in kind_stats
+                           if suffixes is None or stat[0] in suffixes]
+
+        for key, kind, metric, labels in self.metrics():
+            metric_type = _TYPES[kind]
+            snapshot = None
+            for suffix, from_snapshot, getter in stats[kind]:
+                if from_snapshot:
+                    if snapshot is None:
+                        snapshot = metric.get_snapshot()
+                    value = getattr(snapshot, getter)()
+                else:
+                    value = getattr(metric, getter)()
+                stat = {
+                    "type": metric_type,
+                    "name": "_".join([key, suffix]),
+                    "value": value,
+                }
+                if labels:
+                    stat["labels"] = dict(labels)
+                yield stat
 
-def time_calls(fn):
-    """
-    Decorator to time the execution of the function.
+    def dump_metrics(self):
+        """
+        Formats all the metrics into dicts, and returns a list of all of them.
+        The dicts of the children of a L{MetricFamily} also have their
+        C{"labels"}, as a C{dict}.
 
-    @param fn: the function to be decorated
-    @type fn: C{func}
+        @return: C{list} of C{dict} of metrics
+        """
+        metrics = list(self.iter_metrics())
 
-    @return: the decorated function
-    @rtype: C{func}
-    """
-    @wraps(fn)
-    def wrapper(*args):
-        _timer = timer("%s_calls" % fn.__name__)
-        start = time()
-        try:
-            return fn(*args)
-        except:
-            raise
-        finally:
-            _timer.update(time() - start)
-    return wrapper
+        # alphabetize
+        metrics.sort(key=lambda x: x["name"])
+        return metrics
+
+
+_global_registry = MetricsRegistry()
+
+counter = _global_registry.counter
+gauge = _global_registry.gauge
+histogram = _global_registry.histogram
+meter = _global_registry.meter
+timer = _global_registry.timer
+dump_metrics = _global_registry.dump_metrics
+iter_metrics = _global_registry.iter_metrics
+count_calls = _global_registry.count_calls
+meter_calls = _global_registry.meter_calls
+hist_calls = _global_registry.hist_calls
+time_calls = _global_registry.time_calls
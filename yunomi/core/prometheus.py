@@ -0,0 +1,397 @@
+from __future__ import division, absolute_import
+
+import re
+from math import isnan
+from threading import Lock, Thread
+
+from yunomi.clock import NANOSECONDS_PER_SECOND
+from yunomi.compat import BaseHTTPRequestHandler, HTTPServer, ThreadingMixIn
+from yunomi.core.gauge import is_number
+from yunomi.core.metrics_registry import DROPPED_KEY
+
+TEXT_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_CONTENT_TYPE = ("application/openmetrics-text; version=1.0.0; "
+                            "charset=utf-8")
+
+# The quantiles of the summaries of histograms and timers.
+QUANTILES = (0.5, 0.75, 0.95, 0.98, 0.99, 0.999)
+
+# The suffixes of the names of the samples and families each kind of metric
+# is rendered as, which no other metric may render under.
+_SUFFIXES = {
+    "counter": ("",),
+    "gauge": ("",),
+    "meter": ("", "_total", "_rate"),
+    "histogram": ("", "_sum", "_count"),
+    "timer": ("_seconds", "_seconds_sum", "_seconds_count"),
+}
+
+_INVALID_NAME_CHARACTERS = re.compile(r"[^a-zA-Z0-9_:]")
+_INVALID_LABEL_CHARACTERS = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def metric_name(key, prefix=""):
+    """
+    Returns a valid Prometheus metric name for a key, replacing the
+    characters which are not allowed with underscores.
+
+    @type key: C{str}
+    @param key: the key of a metric
+    @type prefix: C{str}
+    @param prefix: a prefix for the name, e.g. the name of the service
+
+    @rtype: C{str}
+    """
+    name = _INVALID_NAME_CHARACTERS.sub("_", prefix + key)
+    if not name or name[0].isdigit():
+        name = "_" + name
+    return name
+
+
+def label_name(name):
+    """
+    Returns a valid Prometheus label name, replacing the characters which
+    are not allowed with underscores.
+
+    @type name: C{str}
+    @param name: the name of a label
+
+    @rtype: C{str}
+    """
+    name = _INVALID_LABEL_CHARACTERS.sub("_", name)
+    if not name or name[0].isdigit():
+        name = "_" + name
+    return name
+
+
+def _labels(labels, extra=None):
+    """
+    Formats labels, and an extra formatted one, as a label set, or nothing
+    when there are none.
+    """
+    pairs = ['%s="%s"' % (label_name(name), value.replace("\\", "\\\\")
+                          .replace("\n", "\\n").replace('"', '\\"'))
+             for name, value in labels]
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{%s}" % ",".join(pairs)
+
+
+def _format(value):
+    """
+    Formats a sample value, as bytes ending a line.
+    """
+    if isinstance(value, float):
+        if value - value == 0.0:
+            return b"%r\n" % value
+        if isnan(value):
+            return b"NaN\n"
+        return b"+Inf\n" if value > 0 else b"-Inf\n"
+    return b"%d\n" % value
+
+
+class PrometheusExporter(object):
+    """
+    Renders the metrics of a L{MetricsRegistry} in the Prometheus text
+    exposition format, or in the OpenMetrics one:
+
+      - counters are exposed as gauges, since they can be decremented, and
+        gauges as gauges, a L{CallbackGauge} calling its function;
+      - meters as a C{<name>_total} counter of events, and a
+        C{<name>_rate} gauge of their moving averages, labeled by window;
+      - histograms as summaries of their quantiles, sum and count;
+      - timers as summaries too, named C{<name>_seconds}, converting their
+        nanosecond durations to seconds.
+
+    The children of a L{MetricFamily} are exposed with their labels, as the
+    samples of one family. Keys which only differ by the characters a name
+    cannot hold, like C{"a.b"} and C{"a_b"}, or whose names clash once
+    suffixed, like a counter C{"x_total"} and a meter C{"x"}, would render
+    two families of one name, which fails the whole scrape; only the first
+    of them in key order is rendered, and each one skipped is counted under
+    C{"yunomi_dropped_metrics"}, with the reason C{"collision"}.
+
+    The lines preceding each value, from the metadata to the name and labels
+    of each sample, are formatted once per metric and cached as bytes, and
+    every scrape renders into the same buffer, so a scrape mostly formats
+    numbers. The idle metrics of the registry are evicted from a thread of
+    their own, see L{MetricsRegistry.evict_idle}, which reads every metric
+    and would otherwise hold up the scrape.
+    """
+    def __init__(self, registry, prefix="", evict_interval=60):
+        """
+        Creates a new L{PrometheusExporter}.
+
+        @type registry: L{MetricsRegistry}
+        @param registry: the registry whose metrics are exposed
+        @type prefix: C{str}
+        @param prefix: a prefix for the names of all the metrics, e.g.
+                       C{"myservice_"}
+        @type evict_interval: C{int} or C{float}
+        @param evict_interval: the least number of seconds, on the clock of
+                               the registry, between two evictions of its
+                               idle metrics, which a scrape starts in a
+                               daemon thread when the last one is that old;
+                               C{None} never evicts, e.g. to call
+                               L{MetricsRegistry.evict_idle} from elsewhere
+        """
+        self.registry = registry
+        self.prefix = prefix
+        self.evict_interval = evict_interval
+        self._next_eviction = None
+        self._evicting = None
+        self._families = ({}, {})
+        self._collisions = set()
+        self._buffer = bytearray()
+        self._pending = bytearray()
+        self._lock = Lock()
+
+    def _evict(self):
+        """
+        Starts evicting the idle metrics of the registry in a daemon thread,
+        unless it did less than I{evict_interval} seconds ago or is still
+        at it.
+        """
+        if self.evict_interval is None:
+            return
+        now = self.registry._clock.seconds()
+        with self._lock:
+            if self._next_eviction is not None and now < self._next_eviction:
+                return
+            if self._evicting is not None and self._evicting.is_alive():
+                return
+            self._next_eviction = now + self.evict_interval
+            thread = self._evicting = Thread(target=self.registry.evict_idle,
+                                             name="yunomi-eviction")
+        thread.daemon = True
+        thread.start()
+
+    def _family(self, key, kind, labels, openmetrics):
+        """
+        Formats the bytes preceding the values of a metric, and the headers
+        of its family, and caches them with the method rendering its values
+        and the names the family renders under.
+        """
+        name = metric_name(key, self.prefix)
+        headers, lines = getattr(self, "_%s_family" % kind)(
+            name, labels, openmetrics)
+        family = self._families[openmetrics][(key, kind, labels)] = (
+            getattr(self, "_render_%s" % kind),
+            [header.encode("utf-8") for header in headers],
+            [line.encode("utf-8") for line in lines],
+            frozenset([name + suffix for suffix in _SUFFIXES[kind]]))
+        return family
+
+    def _counter_family(self, name, labels, openmetrics):
+        return (("# TYPE %s gauge\n" % name, ""),
+                ["%s%s " % (name, _labels(labels))])
+
+    def _gauge_family(self, name, labels, openmetrics):
+        return (("# TYPE %s gauge\n" % name, ""),
+                ["%s%s " % (name, _labels(labels))])
+
+    def _meter_family(self, name, labels, openmetrics):
+        if openmetrics:
+            header = "# TYPE %s counter\n" % name
+        else:
+            header = "# TYPE %s_total counter\n" % name
+        lines = ["%s_total%s " % (name, _labels(labels))]
+        lines.extend(["%s_rate%s " % (name, _labels(
+            labels, 'window="%s"' % window))
+            for window in ("1m", "5m", "15m")])
+        return (header, "# TYPE %s_rate gauge\n" % name), lines
+
+    def _histogram_family(self, name, labels, openmetrics):
+        lines = ["%s%s " % (name, _labels(labels, 'quantile="%r"' % quantile))
+                 for quantile in QUANTILES]
+        lines.extend(["%s_sum%s " % (name, _labels(labels)),
+                      "%s_count%s " % (name, _labels(labels))])
+        return ("# TYPE %s summary\n" % name, ""), lines
+
+    def _timer_family(self, name, labels, openmetrics):
+        return self._histogram_family(name + "_seconds", labels, openmetrics)
+
+    def _render_counter(self, buffer, lines, counter, pending):
+        buffer += lines[0]
+        buffer += _format(counter.get_count())
+
+    def _render_gauge(self, buffer, lines, gauge, pending):
+        # The value was read, and checked, by render.
+        buffer += lines[0]
+        buffer += _format(gauge)
+
+    def _render_meter(self, buffer, lines, meter, pending):
+        total, m1, m5, m15 = lines
+        buffer += total
+        buffer += _format(meter.get_count())
+        # The rates are a family of their own, which follows the totals of
+        # every child.
+        pending += m1
+        pending += _format(meter.get_one_minute_rate())
+        pending += m5
+        pending += _format(meter.get_five_minute_rate())
+        pending += m15
+        pending += _format(meter.get_fifteen_minute_rate())
+
+    def _render_histogram(self, buffer, lines, histogram, pending, scale=1):
+        snapshot = histogram.get_snapshot()
+        for line, quantile in zip(lines, QUANTILES):
+            buffer += line
+            buffer += _format(snapshot.get_value(quantile) / scale)
+        buffer += lines[-2]
+        buffer += _format(histogram.get_sum() / scale)
+        buffer += lines[-1]
+        buffer += _format(histogram.get_count())
+
+    def _render_timer(self, buffer, lines, timer, pending):
+        self._render_histogram(buffer, lines, timer, pending,
+                               NANOSECONDS_PER_SECOND)
+
+    def render(self, openmetrics=False):
+        """
+        Renders all the metrics of the registry, ordered by key, and starts
+        evicting its idle ones when I{evict_interval} has passed, without
+        waiting for it. The children of a L{MetricFamily} are rendered
+        together, as one family of samples differing by their labels. A
+        metric whose names collide with those of an earlier one is skipped,
+        and counted the first time. A gauge whose value is not a number,
+        like C{None}, is skipped and counted with the reason C{"error"} on
+        every scrape.
+
+        @type openmetrics: C{bool}
+        @param openmetrics: whether to render the OpenMetrics format rather
+                            than the Prometheus text format
+
+        @rtype: C{bytes}
+        @return: the exposition, in UTF-8
+        """
+        self._evict()
+        metrics = self.registry.metrics()
+        families = self._families[openmetrics]
+        with self._lock:
+            buffer, pending = self._buffer, self._pending
+            del buffer[:]
+            del pending[:]
+            last_key = last_kind = None
+            skipping = False
+            rendered, collisions, skipped = set(), set(), []
+            for key, kind, metric, labels in metrics:
+                if kind == "gauge":
+                    metric = metric.get_value()
+                    if not is_number(metric):
+                        skipped.append((key, kind, labels))
+                        continue
+                family = families.get((key, kind, labels))
+                if family is None:
+                    family = self._family(key, kind, labels, openmetrics)
+                render, headers, lines, names = family
+                if key != last_key or kind != last_kind:
+                    last_key, last_kind = key, kind
+                    skipping = not rendered.isdisjoint(names)
+                    if skipping:
+                        collisions.add((key, kind))
+                        continue
+                    rendered.update(names)
+                    buffer += pending
+                    del pending[:]
+                    buffer += headers[0]
+                    pending += headers[1]
+                elif skipping:
+                    continue
+                render(buffer, lines, metric, pending)
+            buffer += pending
+            new_collisions = collisions - self._collisions
+            self._collisions = collisions
+            if len(families) > len(metrics):
+                # Forget the lines of the metrics the registry dropped.
+                live = set([(key, kind, labels)
+                            for key, kind, _, labels in metrics])
+                for name in list(families):
+                    if name not in live:
+                        del families[name]
+            if openmetrics:
+                buffer += b"# EOF\n"
+            exposition = bytes(buffer)
+        for key, kind in new_collisions:
+            self.registry.counter(DROPPED_KEY, labels=(
+                ("kind", kind), ("reason", "collision"))).inc()
+        for key, kind, labels in skipped:
+            self.registry.counter(DROPPED_KEY, labels=(
+                ("kind", kind), ("reason", "error"))).inc()
+        return exposition
+
+    def content_type(self, openmetrics=False):
+        """
+        Returns the HTTP content type of the format rendered by L{render}.
+
+        @type openmetrics: C{bool}
+        @param openmetrics: whether the format is OpenMetrics
+
+        @rtype: C{str}
+        """
+        if openmetrics:
+            return OPENMETRICS_CONTENT_TYPE
+        return TEXT_CONTENT_TYPE
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the exposition of a L{PrometheusExporter} on C{GET /metrics}, in
+    the OpenMetrics format when the scraper accepts it.
+    """
+    exporter = None
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        accept = self.headers.get("Accept") or ""
+        openmetrics = "application/openmetrics-text" in accept
+        body = self.exporter.render(openmetrics)
+        self.send_response(200)
+        self.send_header("Content-Type",
+                         self.exporter.content_type(openmetrics))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    An HTTP server handling each scrape in a thread of its own.
+    """
+    daemon_threads = True
+
+
+def start_http_server(exporter, port=0, host="127.0.0.1"):
+    """
+    Serves an exporter on C{http://<host>:<port>/metrics}, from a daemon
+    thread.
+
+    @type exporter: L{PrometheusExporter}
+    @param exporter: the exporter to serve
+    @type port: C{int}
+    @param port: the port to listen on; 0 picks a free one, which is then
+                 C{server.server_address[1]}
+    @type host: C{str}
+    @param host: the address to listen on
+
+    @rtype: L{MetricsHTTPServer}
+    @return: the server, to C{shutdown()} and C{server_close()} when done
+    """
+    handler = type("MetricsHandler", (MetricsHandler, object),
+                   {"exporter": exporter})
+    server = MetricsHTTPServer((host, port), handler)
+    thread = Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+__all__ = ["PrometheusExporter", "MetricsHandler", "MetricsHTTPServer",
+           "start_http_server", "metric_name"]
@@ -0,0 +1,456 @@
+from __future__ import division, absolute_import
+
+import sys
+from array import array
+from itertools import chain
+from struct import Struct
+
+from yunomi.compat import _PY3, int64_typecode, xrange
+from yunomi.core.columnar_meter import ColumnarMeter
+from yunomi.core.counter import Counter
+from yunomi.core.gauge import Gauge, is_number
+from yunomi.core.histogram import Histogram, StripedHistogram
+from yunomi.core.meter import Meter
+from yunomi.core.timer import Timer
+from yunomi.stats.ddsketch import DDSketch
+from yunomi.stats.exp_decay_sample import ExponentiallyDecayingSample
+from yunomi.stats.hdr_sample import HdrSample
+from yunomi.stats.sliding_time_window_sample import SlidingTimeWindowSample
+from yunomi.stats.sliding_window_sample import SlidingWindowSample
+from yunomi.stats.uniform_sample import UniformSample
+from yunomi.stats.varint import (decode_varint, decode_varints,
+                                 encode_varint, zigzag)
+
+MAGIC = b"YNMS"
+FORMAT_VERSION = 1
+
+_HEADER = Struct("<4sB")
+_DOUBLE = Struct("<d")
+_EWMA = Struct("<ddB")
+# min, max, sum, mean and sum of squares of deviations of a histogram.
+_HISTOGRAM = Struct("<5d")
+
+KINDS = {"counter": 1, "histogram": 2, "meter": 3, "timer": 4, "gauge": 5}
+_KIND_NAMES = dict([(code, kind) for kind, code in KINDS.items()])
+# Set on the kind of a metric which has labels, which follow its key.
+_LABELED = 0x80
+
+# The codes of the samples, in the order they are checked: subclasses first.
+(_UNIFORM, _SLIDING_WINDOW, _SLIDING_TIME_WINDOW, _EXP_DECAY, _HDR,
+ _DDSKETCH) = (1, 2, 3, 4, 5, 6)
+
+_SWAP = sys.byteorder != "little"
+
+
+def _pack_doubles(buf, values):
+    """
+    Appends a length and packed little-endian doubles to I{buf}.
+    """
+    values = array("d", values)
+    if _SWAP:
+        values.byteswap()
+    encode_varint(buf, len(values))
+    buf += values.tobytes() if _PY3 else values.tostring()
+
+
+def _unpack_doubles(view, offset):
+    """
+    Reads doubles written by L{_pack_doubles} into an C{array}, without
+    making Python objects of them on the way. They are copied once, from a
+    slice of the buffer which copies nothing, since the sample they are
+    decoded for owns and writes its array.
+    """
+    n, offset = decode_varint(view, offset)
+    end = offset + 8 * n
+    values = array("d")
+    if _PY3:
+        values.frombytes(view[offset:end])
+    else:
+        values.fromstring(bytes(view[offset:end]))
+    if _SWAP:
+        values.byteswap()
+    return values, end
+
+
+def _encode_signed(buf, n):
+    encode_varint(buf, zigzag(n))
+
+
+class _Encoder(object):
+    """
+    The state of the encoding of a registry: the body, and the names it
+    refers to by index.
+    """
+    def __init__(self):
+        self.body = bytearray()
+        self.names = []
+        self.indexes = {}
+
+    def name(self, name):
+        index = self.indexes.get(name)
+        if index is None:
+            index = self.indexes[name] = len(self.names)
+            self.names.append(name)
+        encode_varint(self.body, index)
+
+    def counter(self, counter):
+        _encode_signed(self.body, counter.get_count())
+
+    def gauge(self, value):
+        self.body += _DOUBLE.pack(value)
+
+    def meter(self, meter):
+        buf = self.body
+        if isinstance(meter, ColumnarMeter):
+            now = meter.store.clock.nanoseconds()
+        else:
+            now = meter.clock.nanoseconds()
+        count, start_time, rates = meter._state()
+        self.name(meter.get_event_type())
+        _encode_signed(buf, count)
+        _encode_signed(buf, now - start_time)
+        for rate, uncounted, initialized, last_tick in rates:
+            buf += _EWMA.pack(rate, uncounted, 1 if initialized else 0)
+            _encode_signed(buf, now - last_tick)
+
+    def histogram(self, histogram):
+        if isinstance(histogram, StripedHistogram):
+            histogram = histogram.merged()
+        buf = self.body
+        encode_varint(buf, histogram.count)
+        buf += _HISTOGRAM.pack(histogram.min_, histogram.max_, histogram.sum_,
+                               histogram.mean, histogram.sum_of_squares)
+        self.sample(histogram.sample)
+
+    def timer(self, timer):
+        self.histogram(timer.histogram)
+        self.meter(timer.meter)
+
+    def sample(self, sample):
+        buf = self.body
+        if isinstance(sample, SlidingTimeWindowSample):
+            buf.append(_SLIDING_TIME_WINDOW)
+            now = sample.clock.nanoseconds()
+            sample._evict(now)
+            values, times = sample._live()
+            buf += _DOUBLE.pack(sample.window)
+            encode_varint(buf, sample.count)
+            _pack_doubles(buf, values)
+            # The ages of the values, oldest first, as deltas.
+            previous = now
+            for time in times:
+                _encode_signed(buf, previous - time)
+                previous = time
+        elif isinstance(sample, SlidingWindowSample):
+            buf.append(_SLIDING_WINDOW)
+            encode_varint(buf, sample.reservoir_size)
+            encode_varint(buf, sample.count)
+            _pack_doubles(buf, sample._ordered())
+        elif isinstance(sample, UniformSample):
+            buf.append(_UNIFORM)
+            encode_varint(buf, sample.reservoir_size)
+            encode_varint(buf, sample.count)
+            _pack_doubles(buf, sample.values)
+        elif isinstance(sample, ExponentiallyDecayingSample):
+            buf.append(_EXP_DECAY)
+            encode_varint(buf, sample.reservoir_size)
+            buf += _DOUBLE.pack(sample.alpha)
+            encode_varint(buf, sample.count)
+            buf += _DOUBLE.pack(sample.clock.seconds() - sample.start_time)
+            buf += _DOUBLE.pack(sample.next_scale_time - sample.start_time)
+            # The (priority, value) pairs of the heap, in heap order.
+            _pack_doubles(buf, chain.from_iterable(sample.values))
+        elif isinstance(sample, HdrSample):
+            buf.append(_HDR)
+            encode_varint(buf, sample.significant_figures)
+            buf += _DOUBLE.pack(sample.lowest_discernible_value)
+            buf += _DOUBLE.pack(sample.highest_trackable_value)
+            encode_varint(buf, sample.zero_count)
+            for counts in sample.counts, sample.negative_counts or []:
+                indexes = [index for index, count in enumerate(counts)
+                           if count]
+                encode_varint(buf, len(indexes))
+                previous = 0
+                for index in indexes:
+                    encode_varint(buf, index - previous)
+                    encode_varint(buf, counts[index])
+                    previous = index
+        elif isinstance(sample, DDSketch):
+            buf.append(_DDSKETCH)
+            sketch = sample.serialize()
+            encode_varint(buf, len(sketch))
+            buf += sketch
+        else:
+            # Any other sample is kept as the values of its snapshot.
+            buf.append(_UNIFORM)
+            values = sample.get_snapshot().get_values()
+            encode_varint(buf, max(len(values), 1))
+            encode_varint(buf, len(values))
+            _pack_doubles(buf, values)
+
+    def encode(self, metrics, skipped):
+        """
+        Encodes C{(key, kind, metric, labels)} tuples, see
+        L{MetricsRegistry.metrics}, but for the gauges whose value is not a
+        number, which are appended to I{skipped}, if given.
+        """
+        body = self.body
+        n = 0
+        for key, kind, metric, labels in metrics:
+            if kind == "gauge":
+                # Gauges are encoded as their value, read before anything
+                # of them is written.
+                metric = metric.get_value()
+                if not is_number(metric):
+                    if skipped is not None:
+                        skipped.append((key, kind, labels))
+                    continue
+            if labels:
+                body.append(KINDS[kind] | _LABELED)
+                self.name(key)
+                encode_varint(body, len(labels))
+                for name, value in labels:
+                    self.name(name)
+                    self.name(value)
+            else:
+                body.append(KINDS[kind])
+                self.name(key)
+            getattr(self, kind)(metric)
+            n += 1
+        buf = bytearray(_HEADER.pack(MAGIC, FORMAT_VERSION))
+        encode_varint(buf, len(self.names))
+        for name in self.names:
+            encoded = name.encode("utf-8")
+            encode_varint(buf, len(encoded))
+            buf += encoded
+        encode_varint(buf, n)
+        buf += body
+        return bytes(buf)
+
+
+class _Decoder(object):
+    """
+    The state of the decoding of a registry: the buffer, the offset of the
+    next field, and the name table.
+    """
+    def __init__(self, data, clock):
+        # Python 2's memoryview indexes to 1-character strings.
+        self.view = memoryview(data) if _PY3 else bytearray(data)
+        self.clock = clock
+        magic, version = _HEADER.unpack_from(self.view, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a serialized registry")
+        if version != FORMAT_VERSION:
+            raise ValueError(
+                "Unknown registry format {0}".format(version))
+        self.offset = _HEADER.size
+        n = self.varint()
+        view = self.view
+        names = self.names = []
+        for _ in xrange(n):
+            length = self.varint()
+            offset = self.offset
+            end = self.offset = offset + length
+            names.append(bytes(view[offset:end]).decode("utf-8"))
+
+    def varint(self):
+        # decode_varint, inline: this is the most frequent call.
+        view = self.view
+        offset = self.offset
+        byte = view[offset]
+        offset += 1
+        n = byte & 0x7f
+        shift = 7
+        while byte >= 0x80:
+            byte = view[offset]
+            offset += 1
+            n |= (byte & 0x7f) << shift
+            shift += 7
+        self.offset = offset
+        return n
+
+    def varints(self, n):
+        values, self.offset = decode_varints(self.view, self.offset, n)
+        return values
+
+    def signed(self):
+        # unzigzag, inline.
+        n = self.varint()
+        return (n >> 1) ^ -(n & 1)
+
+    def unpack(self, struct):
+        values = struct.unpack_from(self.view, self.offset)
+        self.offset += struct.size
+        return values
+
+    def double(self):
+        return self.unpack(_DOUBLE)[0]
+
+    def doubles(self):
+        values, self.offset = _unpack_doubles(self.view, self.offset)
+        return values
+
+    def name(self):
+        return self.names[self.varint()]
+
+    def counter(self):
+        counter = Counter()
+        counter.inc(self.signed())
+        return counter
+
+    def gauge(self):
+        return Gauge(self.double())
+
+    def meter(self):
+        meter = Meter(self.name(), clock=self.clock)
+        now = self.clock.nanoseconds()
+        meter._count = self.signed()
+        meter.start_time = now - self.signed()
+        for rate in meter._m1_rate, meter._m5_rate, meter._m15_rate:
+            rate._rate, rate._uncounted, initialized = self.unpack(_EWMA)
+            rate.initialized = bool(initialized)
+            rate._last_tick = now - self.signed()
+        return meter
+
+    def histogram(self):
+        # Not Histogram(sample), which would clear the decoded sample.
+        histogram = Histogram.__new__(Histogram)
+        histogram._updates = 0
+        histogram.count = self.varint()
+        stats = self.unpack(_HISTOGRAM)
+        histogram.sample = self.sample()
+        (histogram.min_, histogram.max_, histogram.sum_, histogram.mean,
+         histogram.sum_of_squares) = stats
+        return histogram
+
+    def timer(self):
+        histogram = self.histogram()
+        return Timer(None, None, self.clock, self.meter(), histogram)
+
+    def sample(self):
+        code = self.view[self.offset]
+        self.offset += 1
+        if code == _UNIFORM:
+            sample = UniformSample(self.varint())
+            sample.count = self.varint()
+            sample.values = self.doubles()
+        elif code == _SLIDING_WINDOW:
+            sample = SlidingWindowSample(self.varint())
+            sample.count = self.varint()
+            sample.values = self.doubles()
+        elif code == _SLIDING_TIME_WINDOW:
+            sample = SlidingTimeWindowSample(self.double(), self.clock)
+            sample.count = self.varint()
+            values = self.doubles()
+            n = len(values)
+            time = self.clock.nanoseconds()
+            times = []
+            for age in self.varints(n):
+                time -= (age >> 1) ^ -(age & 1)
+                times.append(time)
+            times = array(int64_typecode, times)
+            capacity = sample.MIN_CAPACITY
+            while capacity < n:
+                capacity *= 2
+            sample.values = values + array("d", [0.0]) * (capacity - n)
+            sample.times = times + array(int64_typecode, [0]) * (capacity - n)
+            sample._length = n
+        elif code == _EXP_DECAY:
+            reservoir_size = self.varint()
+            sample = ExponentiallyDecayingSample(reservoir_size, self.double(),
+                                                 self.clock)
+            sample.count = self.varint()
+            sample.start_time = self.clock.seconds() - self.double()
+            sample.next_scale_time = sample.start_time + self.double()
+            pairs = iter(self.doubles())
+            sample.values = list(zip(pairs, pairs))
+        elif code == _HDR:
+            significant_figures = self.varint()
+            sample = HdrSample(significant_figures, self.double(),
+                               self.double())
+            sample.zero_count = self.varint()
+            sample.count = sample.zero_count
+            for negative in False, True:
+                n = self.varint()
+                if negative and n:
+                    sample.negative_counts = [0] * sample._bucket_count
+                counts = (sample.negative_counts if negative
+                          else sample.counts)
+                # Pairs of the gap to the next bucket and its count.
+                pairs = self.varints(2 * n)
+                index = 0
+                for i in xrange(0, 2 * n, 2):
+                    index += pairs[i]
+                    counts[index] = pairs[i + 1]
+                sample.count += sum(pairs[1::2])
+        elif code == _DDSKETCH:
+            length = self.varint()
+            end = self.offset + length
+            sample = DDSketch.deserialize(bytes(self.view[self.offset:end]))
+            self.offset = end
+        else:
+            raise ValueError("Unknown sample {0}".format(code))
+        return sample
+
+    def decode(self):
+        """
+        Yields the C{(key, kind, metric, labels)} of every metric.
+        """
+        for _ in xrange(self.varint()):
+            code = self.view[self.offset]
+            self.offset += 1
+            kind = _KIND_NAMES[code & ~_LABELED]
+            key = self.name()
+            labels = ()
+            if code & _LABELED:
+                labels = tuple([(self.name(), self.name())
+                                for _ in xrange(self.varint())])
+            yield key, kind, getattr(self, kind)(), labels
+
+
+def serialize(metrics, skipped=None):
+    """
+    Encodes metrics compactly, with their full state. The encoding starts
+    with a table of all the names, which the metrics refer to by index,
+    then each metric, with its labels if it has any: counts are zigzag
+    varints, times are the varint ages of timestamps at the time of
+    encoding, so they can be decoded against another clock, and the values
+    of samples are packed little-endian doubles, or bucket counts for
+    L{HdrSample} and L{DDSketch}. Gauges are encoded as the double of their
+    current value, which a L{CallbackGauge} computes; one whose value is
+    not a number, like C{None}, is skipped.
+
+    @param metrics: C{(key, kind, metric, labels)} tuples, see
+                    L{MetricsRegistry.metrics}
+    @type skipped: C{list}
+    @param skipped: a list which the C{(key, kind, labels)} of each metric
+                    skipped is appended to
+
+    @rtype: C{bytes}
+    @return: the encoded metrics, see L{deserialize}
+    """
+    return _Encoder().encode(metrics, skipped)
+
+
+def deserialize(data, clock):
+    """
+    Decodes metrics encoded by L{serialize}, reading the packed values
+    straight from a C{memoryview} of I{data}. Counters, gauges, meters,
+    histograms and timers are decoded as L{Counter}, L{Gauge}, L{Meter},
+    L{Histogram} and L{Timer}, whatever they were encoded from; a
+    L{StripedHistogram} is decoded as the L{Histogram} of
+    L{StripedHistogram.merged}.
+
+    @type data: C{bytes}, C{bytearray} or C{memoryview}
+    @param data: the encoded metrics
+    @param clock: the clock of the decoded metrics, which their timestamps
+                  are set back from
+
+    @return: an iterator of C{(key, kind, metric, labels)} C{tuple}s
+
+    @raise ValueError: if I{data} is not in a known format
+    """
+    return _Decoder(data, clock).decode()
+
+
+__all__ = ["serialize", "deserialize", "MAGIC", "FORMAT_VERSION"]
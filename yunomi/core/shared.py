@@ -0,0 +1,635 @@
+from __future__ import division, absolute_import
+
+import errno
+import os
+from mmap import mmap
+from struct import Struct
+
+try:
+    from fcntl import flock, LOCK_EX, LOCK_UN
+except ImportError:
+    flock = None
+
+from yunomi.clock import as_clock
+from yunomi.compat import xrange
+from yunomi.core.counter import Counter
+from yunomi.core.meter import Meter
+from yunomi.core.metrics_registry import MetricsRegistry
+
+_CELL = Struct("=q")
+
+
+class _StructCells(object):
+    """
+    The cells of a buffer, for Pythons whose C{memoryview} cannot be cast to
+    an array of C{int64}.
+    """
+    __slots__ = ("_buf",)
+
+    def __init__(self, buf):
+        self._buf = buf
+
+    def __getitem__(self, index):
+        return _CELL.unpack_from(self._buf, index * _CELL.size)[0]
+
+    def __setitem__(self, index, value):
+        _CELL.pack_into(self._buf, index * _CELL.size, value)
+
+    def release(self):
+        pass
+
+
+def _cells(buf):
+    """
+    Returns a view of I{buf} as an array of native C{int64} cells, which are
+    read and written in place, without copying.
+    """
+    try:
+        return memoryview(buf).cast("q")
+    except (NameError, AttributeError):
+        return _StructCells(buf)
+
+
+class SharedMemoryStore(object):
+    """
+    A memory-mapped file holding the counts of the counters and meters of a
+    group of pre-forked worker processes, for L{SharedMetricsRegistry} and
+    L{SharedMetricsCollector}.
+
+    The file has a fixed layout of 64-bit cells: a header, the pid of the
+    process holding each worker slot, a table of metric names, and then a row
+    of counts for each worker, plus one row keeping the counts of workers
+    which have exited. A worker only ever writes its own row, one cell per
+    update, so workers never lock or talk to each other to count, and a
+    collector sums the rows straight from the mapping.
+
+    Claiming a worker slot and naming a new metric lock the file with
+    C{flock}, where it is available.
+    """
+    FORMAT_VERSION = 1
+    MAGIC = b"YNMI"
+    NAME_SIZE = 128
+    KINDS = {"counter": 1, "meter": 2}
+    _HEADER = Struct("<4sHHIIq")
+    _NAME_HEADER = Struct("<BB")
+
+    def __init__(self, path, clock=None):
+        """
+        Opens the store in the file at I{path}, created with
+        L{SharedMemoryStore.create}.
+
+        @type path: C{str}
+        @param path: the path of the file
+        @param clock: the clock, or a function returning seconds, which the
+                      store was created with; defaults to
+                      L{yunomi.clock.DEFAULT_CLOCK}
+        @raise ValueError: if the file is not a store in a known format
+        """
+        self.path = path
+        self.clock = as_clock(clock)
+        self._file = open(path, "r+b")
+        self._map = mmap(self._file.fileno(), 0)
+        magic, version, _, workers, max_metrics, created = \
+            self._HEADER.unpack_from(self._map)
+        if magic != self.MAGIC:
+            self.close()
+            raise ValueError("{0} is not a shared metrics file".format(path))
+        if version != self.FORMAT_VERSION:
+            self.close()
+            raise ValueError("Unknown shared metrics format {0}".format(
+                version))
+        self.workers = workers
+        self.max_metrics = max_metrics
+        self.created = created
+        self._names_offset = self._HEADER.size + workers * _CELL.size
+        values_offset = self._names_offset + max_metrics * self.NAME_SIZE
+        self._first_row = values_offset // _CELL.size
+        self._pid_cells = self._HEADER.size // _CELL.size
+        self._indexes = {}
+        self.cells = _cells(self._map)
+
+    @classmethod
+    def create(klass, path, workers, max_metrics=1024, clock=None):
+        """
+        Creates an empty store, replacing any file at I{path}. It should be
+        created by the master process before forking the workers.
+
+        @type path: C{str}
+        @param path: the path of the file
+        @type workers: C{int}
+        @param workers: the number of worker slots
+        @type max_metrics: C{int}
+        @param max_metrics: the number of counters and meters which can be
+                            named in the store
+        @param clock: the clock, or a function returning seconds, whose time
+                      is recorded as the creation time of the store
+
+        @rtype: L{SharedMemoryStore}
+        """
+        created = as_clock(clock).nanoseconds()
+        size = (klass._HEADER.size + workers * _CELL.size +
+                max_metrics * klass.NAME_SIZE +
+                (workers + 1) * max_metrics * _CELL.size)
+        with open(path, "wb") as f:
+            f.write(klass._HEADER.pack(klass.MAGIC, klass.FORMAT_VERSION, 0,
+                                       workers, max_metrics, created))
+            f.truncate(size)
+        return klass(path, clock)
+
+    def close(self):
+        """
+        Unmaps the file. The metrics of the store must not be used anymore.
+        """
+        if getattr(self, "cells", None) is not None:
+            self.cells.release()
+            self.cells = None
+        self._map.close()
+        self._file.close()
+
+    def _lock(self):
+        if flock is not None:
+            flock(self._file.fileno(), LOCK_EX)
+
+    def _unlock(self):
+        if flock is not None:
+            flock(self._file.fileno(), LOCK_UN)
+
+    def cell(self, worker, index):
+        """
+        Returns the position in L{SharedMemoryStore.cells} of the count of a
+        metric in the row of a worker.
+
+        @type worker: C{int}
+        @param worker: the worker slot, or L{SharedMemoryStore.workers} for
+                       the row of the exited workers
+        @type index: C{int}
+        @param index: the index of the metric, see
+                      L{SharedMemoryStore.metric_index}
+        @rtype: C{int}
+        """
+        return self._first_row + worker * self.max_metrics + index
+
+    def claim_worker(self):
+        """
+        Claims a free worker slot for the current process. The slot of a
+        process which has exited is free again; its counts are moved to the
+        row of the exited workers, so the sums never go backwards.
+
+        @rtype: C{int}
+        @return: the worker slot
+        @raise ValueError: if every slot is held by a running process
+        """
+        cells = self.cells
+        self._lock()
+        try:
+            for worker in xrange(self.workers):
+                pid = cells[self._pid_cells + worker]
+                if pid and _is_running(pid):
+                    continue
+                retired = self.cell(self.workers, 0)
+                row = self.cell(worker, 0)
+                for index in xrange(self.max_metrics):
+                    count = cells[row + index]
+                    if count:
+                        cells[row + index] = 0
+                        cells[retired + index] += count
+                cells[self._pid_cells + worker] = os.getpid()
+                return worker
+        finally:
+            self._unlock()
+        raise ValueError("All {0} worker slots of {1} are taken".format(
+            self.workers, self.path))
+
+    def names(self):
+        """
+        Returns the metrics named in the store so far.
+
+        @return: a C{list} of C{(kind, key, index)}
+        """
+        kinds = dict((code, kind) for kind, code in self.KINDS.items())
+        names = []
+        for index in xrange(self.max_metrics):
+            offset = self._names_offset + index * self.NAME_SIZE
+            code, length = self._NAME_HEADER.unpack_from(self._map, offset)
+            if not length:
+                break
+            start = offset + self._NAME_HEADER.size
+            key = self._map[start:start + length].decode("utf-8")
+            names.append((kinds[code], key, index))
+        return names
+
+    def metric_index(self, kind, key):
+        """
+        Returns the index of a metric, naming it in the store if no worker
+        has yet.
+
+        @type kind: C{str}
+        @param kind: C{"counter"} or C{"meter"}
+        @type key: C{str}
+        @param key: name of the metric
+        @rtype: C{int}
+        @raise ValueError: if the store is full or the key is too long
+        """
+        index = self._indexes.get((kind, key))
+        if index is not None:
+            return index
+        code = self.KINDS[kind]
+        encoded = key.encode("utf-8")
+        if len(encoded) > self.NAME_SIZE - self._NAME_HEADER.size:
+            raise ValueError("Metric name {0!r} is too long".format(key))
+        self._lock()
+        try:
+            for other_kind, other_key, index in self.names():
+                self._indexes[(other_kind, other_key)] = index
+            index = self._indexes.get((kind, key))
+            if index is None:
+                index = len(self._indexes)
+                if index >= self.max_metrics:
+                    raise ValueError("All {0} metrics of {1} are named".format(
+                        self.max_metrics, self.path))
+                # The name goes in before its header, so that readers never
+                # see a partly written name.
+                offset = self._names_offset + index * self.NAME_SIZE
+                start = offset + self._NAME_HEADER.size
+                self._map[start:start + len(encoded)] = encoded
+                self._NAME_HEADER.pack_into(self._map, offset, code,
+                                            len(encoded))
+                self._indexes[(kind, key)] = index
+        finally:
+            self._unlock()
+        return index
+
+    def add(self, index, n):
+        """
+        Adds to the count of a metric in the row of the exited workers, for
+        a process which holds no worker slot, e.g. a collector.
+
+        @type index: C{int}
+        @param index: the index of the metric
+        @type n: C{int}
+        @param n: the amount to add
+        """
+        cell = self.cell(self.workers, index)
+        self._lock()
+        try:
+            self.cells[cell] += n
+        finally:
+            self._unlock()
+
+    def sum(self, index):
+        """
+        Returns the count of a metric, summed over all the workers.
+
+        @type index: C{int}
+        @param index: the index of the metric
+        @rtype: C{int}
+        """
+        cells = self.cells
+        first = self.cell(0, index)
+        step = self.max_metrics
+        return sum([cells[first + row * step]
+                    for row in xrange(self.workers + 1)])
+
+
+def _store_key(key, labels):
+    """
+    Returns the name of a metric in a L{SharedMemoryStore}: its key,
+    followed by the names and values of its labels, each after a NUL.
+    """
+    if not labels:
+        return key
+    return key + "".join(["\0%s\0%s" % pair for pair in labels])
+
+
+def _parse_store_key(name):
+    """
+    Returns the key and the labels of a name made by L{_store_key}.
+    """
+    parts = name.split("\0")
+    return parts[0], tuple(zip(parts[1::2], parts[2::2]))
+
+
+def _is_running(pid):
+    """
+    Returns whether a process with the given pid exists.
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class SharedCounter(Counter):
+    """
+    A L{Counter} whose count is the cell of its worker in a
+    L{SharedMemoryStore}. Creating one leaves the cell alone, so a counter
+    created again, e.g. after it was evicted, carries on from the count of
+    the worker; only L{SharedMemoryStore.claim_worker} zeroes the cells, when
+    it hands out a slot.
+    """
+    __slots__ = ("_cells", "_cell")
+
+    def __init__(self, store, cell):
+        """
+        Creates a new L{SharedCounter}, at the count of its cell.
+
+        @type store: L{SharedMemoryStore}
+        @param store: the store holding the count
+        @type cell: C{int}
+        @param cell: the position of the count, see L{SharedMemoryStore.cell}
+        """
+        self._cells = store.cells
+        self._cell = cell
+        self._updates = 0
+
+    def _get_count(self):
+        return self._cells[self._cell]
+
+    def _set_count(self, count):
+        self._cells[self._cell] = count
+
+    _count = property(_get_count, _set_count)
+
+
+class SharedMeter(Meter):
+    """
+    A L{Meter} whose count is the cell of its worker in a
+    L{SharedMemoryStore}. Its rates are the rates of its worker alone. Like
+    a L{SharedCounter}, creating one leaves the count of its cell alone.
+    """
+    __slots__ = ("_cells", "_cell")
+
+    def __init__(self, store, cell, scheduler=None, clock=None):
+        """
+        Creates a new L{SharedMeter}, at the count of its cell; its mean
+        rate runs from the creation of the store when the count is not 0.
+
+        @type store: L{SharedMemoryStore}
+        @param store: the store holding the count
+        @type cell: C{int}
+        @param cell: the position of the count, see L{SharedMemoryStore.cell}
+        @type scheduler: L{TickScheduler}
+        @param scheduler: an optional scheduler which ticks the moving averages
+        @param clock: the clock of the meter
+        """
+        self._cells = store.cells
+        self._cell = cell
+        count = self._count
+        Meter.__init__(self, "", scheduler, clock)
+        if count:
+            self._count = count
+            self.start_time = store.created
+
+    def _get_count(self):
+        return self._cells[self._cell]
+
+    def _set_count(self, count):
+        self._cells[self._cell] = count
+
+    _count = property(_get_count, _set_count)
+
+
+class SummedCounter(Counter):
+    """
+    A L{Counter} whose count is summed over all the workers of a
+    L{SharedMemoryStore}; what the collector counts itself goes into the row
+    of the exited workers. A reset moves the zero of the count to the
+    current sum, as L{StripedCounter} does.
+    """
+    __slots__ = ("_store", "_index", "_reset_count")
+
+    def __init__(self, store, index):
+        """
+        Creates a new L{SummedCounter}.
+
+        @type store: L{SharedMemoryStore}
+        @param store: the store holding the counts
+        @type index: C{int}
+        @param index: the index of the metric
+        """
+        self._store = store
+        self._index = index
+        self._reset_count = 0
+
+    @property
+    def _count(self):
+        return self._store.sum(self._index) - self._reset_count
+
+    def inc(self, n = 1):
+        """
+        Counts into the row of the exited workers, for the counts of the
+        collector itself, e.g. of the metrics its exporter drops, so that
+        they are part of the sum.
+
+        @type n: C{int}
+        @param n: the amount to be incremented
+        """
+        self._store.add(self._index, n)
+
+    def dec(self, n = 1):
+        """
+        Decrements the count; see L{inc}.
+
+        @type n: C{int}
+        @param n: the amount to be decremented
+        """
+        self._store.add(self._index, -n)
+
+    def merge(self, other):
+        """
+        Adds the count of another counter; see L{inc}.
+
+        @type other: L{Counter} or L{StripedCounter}
+        @param other: the counter to merge into this one
+        """
+        self._store.add(self._index, other.get_count())
+
+    def clear(self):
+        """
+        Resets the count back to 0, from the current sum of the workers.
+        """
+        self._reset_count = self._store.sum(self._index)
+
+    def get_snapshot_and_reset(self):
+        """
+        Returns the count and resets it back to 0, for reporting the count of
+        each interval; the workers' cells are left alone.
+
+        @rtype: C{int}
+        @return: the count since the last reset
+        """
+        total = self._store.sum(self._index)
+        count, self._reset_count = total - self._reset_count, total
+        return count
+
+
+class SummedMeter(Meter):
+    """
+    A read-only L{Meter} whose count is summed over all the workers of a
+    L{SharedMemoryStore}. Its moving averages are fed with the increase of
+    the count each time it is read, so the workers only ever write counts.
+    """
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index, clock=None):
+        """
+        Creates a new L{SummedMeter}.
+
+        @type store: L{SharedMemoryStore}
+        @param store: the store holding the counts
+        @type index: C{int}
+        @param index: the index of the metric
+        @param clock: the clock of the meter, which should be the clock the
+                      store was created with
+        """
+        self._store = store
+        self._index = index
+        Meter.__init__(self, "", None, clock)
+
+    def clear(self):
+        """
+        Restarts the moving averages from the current count.
+        """
+        Meter.clear(self)
+        self.start_time = self._store.created
+        self._count = self._store.sum(self._index)
+
+    def _catch_up(self):
+        """
+        Marks the increase of the count since it was last read.
+        """
+        count = self._store.sum(self._index)
+        if count > self._count:
+            Meter.mark(self, count - self._count)
+        else:
+            self._count = count
+
+    def get_count(self):
+        self._catch_up()
+        return Meter.get_count(self)
+
+    def get_fifteen_minute_rate(self):
+        self._catch_up()
+        return Meter.get_fifteen_minute_rate(self)
+
+    def get_five_minute_rate(self):
+        self._catch_up()
+        return Meter.get_five_minute_rate(self)
+
+    def get_one_minute_rate(self):
+        self._catch_up()
+        return Meter.get_one_minute_rate(self)
+
+    def get_mean_rate(self):
+        self._catch_up()
+        return Meter.get_mean_rate(self)
+
+
+class SharedMetricsRegistry(MetricsRegistry):
+    """
+    The registry of a pre-forked worker process, whose counters and meters,
+    labeled or not, live in a L{SharedMemoryStore} for a
+    L{SharedMetricsCollector} to sum over all the workers. Histograms,
+    timers and gauges stay local to the process.
+
+    Create it in each worker after the fork, e.g. in the C{post_fork} hook of
+    gunicorn.
+    """
+    def __init__(self, store, clock=None, scheduler=None, max_metrics=None,
+                 idle_timeout=None):
+        """
+        Creates a new L{SharedMetricsRegistry}, claiming a worker slot of
+        I{store}.
+
+        @type store: L{SharedMemoryStore}
+        @param store: the store holding the counts
+        @param clock: the clock of the metrics, see L{MetricsRegistry}
+        @type scheduler: L{TickScheduler}
+        @param scheduler: an optional scheduler which ticks the rates of all
+                          the meters and timers created by this registry
+        @param max_metrics: the most metrics of each kind the registry
+                            keeps, see L{MetricsRegistry}
+        @param idle_timeout: the number of seconds after which
+                             L{MetricsRegistry.evict_idle} drops a metric,
+                             see L{MetricsRegistry}; the count of a shared
+                             counter or meter stays in its cell
+        """
+        MetricsRegistry.__init__(self, clock, scheduler,
+                                 max_metrics=max_metrics,
+                                 idle_timeout=idle_timeout)
+        self.store = store
+        self.worker = store.claim_worker()
+
+    def _cell(self, kind, key, labels=()):
+        return self.store.cell(self.worker, self.store.metric_index(
+            kind, _store_key(key, labels)))
+
+    def _create(self, kind, key, labels, factory):
+        """
+        Creates counters and meters in the cells of the worker, whatever
+        their factory; shared counters have one writer per process, so they
+        are never striped.
+        """
+        if kind == "counter":
+            return SharedCounter(self.store, self._cell(kind, key, labels))
+        if kind == "meter":
+            return SharedMeter(self.store, self._cell(kind, key, labels),
+                               self._scheduler, self._clock)
+        return factory()
+
+
+class SharedMetricsCollector(MetricsRegistry):
+    """
+    A registry summing the counters and meters of all the workers sharing a
+    L{SharedMemoryStore}, to be read by a single process, e.g. the one
+    serving scrapes. The metrics named by any worker show up in
+    L{SharedMetricsCollector.metrics}, with their labels, and so in its
+    dumps and exports.
+    """
+    def __init__(self, store, clock=None):
+        """
+        Creates a new L{SharedMetricsCollector}.
+
+        @type store: L{SharedMemoryStore}
+        @param store: the store holding the counts
+        @param clock: the clock of the meters, which should be the clock the
+                      store was created with
+        """
+        MetricsRegistry.__init__(self, clock)
+        self.store = store
+
+    def refresh(self):
+        """
+        Adds the metrics named by the workers since the last refresh.
+        """
+        kinds = self._kinds
+        for kind, name, index in self.store.names():
+            key, labels = _parse_store_key(name)
+            if ((key, labels) if labels else key) not in kinds[kind]:
+                self._add(kind, key, None, labels)
+
+    def _create(self, kind, key, labels, factory):
+        """
+        Creates the sums of the counters and meters of the workers, whatever
+        their factory.
+        """
+        index = self.store.metric_index(kind, _store_key(key, labels))
+        if kind == "counter":
+            return SummedCounter(self.store, index)
+        if kind == "meter":
+            return SummedMeter(self.store, index, self._clock)
+        return factory()
+
+    def metrics(self):
+        """
+        L{MetricsRegistry.metrics}, after a L{refresh}.
+        """
+        self.refresh()
+        return MetricsRegistry.metrics(self)
+
+
+__all__ = [
+    "SharedMemoryStore", "SharedCounter", "SharedMeter", "SummedCounter",
+    "SummedMeter", "SharedMetricsRegistry", "SharedMetricsCollector"
+]
@@ -1,22 +1,80 @@
 from __future__ import division, absolute_import
 
-from yunomi.stats.snapshot import Snapshot
+from yunomi.clock import as_clock
+from yunomi.compat import _ASYNC, is_array
 from yunomi.core.histogram import Histogram
 from yunomi.core.meter import Meter
 
+if _ASYNC:
+    from yunomi.core.coroutines import AsyncContextManager as _ContextBase
+else:
+    _ContextBase = object
+
+
+class TimerContext(_ContextBase):
+    """
+    A context manager which updates a L{Timer} with the time spent in its
+    block, in nanoseconds on the clock of the timer. From Python 3.6 on it
+    can be used with C{async with} too. See L{Timer.time}.
+    """
+    __slots__ = ("_timer", "_start")
+
+    def __init__(self, timer):
+        """
+        Creates a new L{TimerContext} for I{timer}.
+
+        @type timer: L{Timer}
+        @param timer: the timer to update
+        """
+        self._timer = timer
+        self._start = None
+
+    def __enter__(self):
+        self._start = self._timer.clock.nanoseconds()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._timer.update(self._timer.clock.nanoseconds() - self._start)
+        return False
+
 
 class Timer(object):
     """
     A timer metric which aggregates timing durations and provides duration
-    statistics, plus throughput statistics via L{Meter}.
+    statistics, plus throughput statistics via L{Meter}. The durations it
+    measures itself are integer nanoseconds.
     """
+    __slots__ = ("clock", "histogram", "meter", "__weakref__")
 
-    def __init__(self):
+    def __init__(self, scheduler=None, sample=None, clock=None, meter=None,
+                 histogram=None):
         """
         Creates a new L{Timer} instance.
-        """
-        self.histogram = Histogram.get_biased()
-        self.meter = Meter("calls")
+
+        @type scheduler: L{TickScheduler}
+        @param scheduler: an optional scheduler which ticks the L{Meter}
+        @param sample: the sample behind the L{Histogram}, e.g. an
+                       L{HdrSample}; defaults to the biased sample of
+                       L{Histogram.get_biased}
+        @param clock: the clock, or a function returning seconds, shared
+                      with the L{Meter} and the default sample; defaults to
+                      L{yunomi.clock.DEFAULT_CLOCK}
+        @param meter: the meter of the calls, e.g. a L{ColumnarMeter};
+                      defaults to a new L{Meter}
+        @param histogram: the histogram of the durations, e.g. a
+                          L{StripedHistogram}; takes precedence over
+                          I{sample}
+        """
+        self.clock = as_clock(clock)
+        if histogram is not None:
+            self.histogram = histogram
+        elif sample is None:
+            self.histogram = Histogram.get_biased(self.clock)
+        else:
+            self.histogram = Histogram(sample)
+        if meter is None:
+            meter = Meter("calls", scheduler, self.clock)
+        self.meter = meter
 
     def clear(self):
         """
@@ -24,17 +82,84 @@ class Timer(object):
         """
         self.histogram.clear()
 
+    def get_snapshot_and_reset(self):
+        """
+        Returns the durations recorded since the last reset and resets the
+        L{Histogram}, see L{Histogram.get_snapshot_and_reset}, and the count
+        of the L{Meter}.
+
+        @rtype: L{Histogram} or L{StripedHistogram}
+        @return: the durations of the interval
+        """
+        self.meter.get_snapshot_and_reset()
+        return self.histogram.get_snapshot_and_reset()
+
+    def merge(self, other):
+        """
+        Adds the durations and calls of another timer, e.g. one decoded from
+        another process, to this one; see L{Histogram.merge} and
+        L{Meter.merge}.
+
+        @type other: L{Timer}
+        @param other: the timer to merge into this one
+
+        @raise ValueError: if the histograms have different kinds of samples
+        """
+        self.histogram.merge(other.histogram)
+        self.meter.merge(other.meter)
+
+    def _generation(self):
+        """
+        Returns the number of updates so far, which only grows, for
+        L{MetricsRegistry.evict_idle}.
+        """
+        return self.histogram._generation() + self.meter._generation()
+
     def update(self, duration):
         """
         Updates the L{Histogram} and marks the L{Meter}.
 
         @type duration: C{int}
-        @param duration: the duration of an event
+        @param duration: the duration of an event, in nanoseconds when it is
+                         measured by the timer
         """
         if duration >= 0:
             self.histogram.update(duration)
             self.meter.mark()
 
+    def time(self):
+        """
+        Returns a context manager which times its block, raising or not,
+        into this timer::
+
+            with timer.time():
+                handle(request)
+
+        Each call creates a small L{TimerContext}, whereas
+        L{MetricsRegistry.time_calls} reads the clock directly, so decorated
+        calls create none.
+
+        @rtype: L{TimerContext}
+        """
+        return TimerContext(self)
+
+    def update_many(self, durations):
+        """
+        Updates the L{Histogram} with a batch of durations and marks the
+        L{Meter} once for all of them. Like L{update}, negative durations are
+        ignored.
+
+        @type durations: iterable of C{int} or C{float}, or a NumPy array
+        @param durations: the durations of a batch of events
+        """
+        if is_array(durations):
+            durations = durations[durations >= 0]
+        else:
+            durations = [duration for duration in durations if duration >= 0]
+        if len(durations):
+            self.histogram.update_many(durations)
+            self.meter.mark(len(durations))
+
     def get_count(self):
         """
         L{Histogram.get_count}
@@ -99,8 +224,7 @@ class Timer(object):
         """
         L{Histogram.get_snapshot}
         """
-        values = self.histogram.get_snapshot().get_values()
-        return Snapshot(values)
+        return self.histogram.get_snapshot()
 
     def get_event_type(self):
         """
@@ -0,0 +1,225 @@
+from __future__ import division, absolute_import
+
+from math import ceil, log
+from struct import Struct
+
+from yunomi.compat import xrange, dict_item_iter, is_array
+from yunomi.stats.snapshot import BucketSnapshot
+from yunomi.stats.varint import (decode_varint, encode_varint, unzigzag,
+                                 zigzag)
+
+
+class DDSketch(object):
+    """
+    A mergeable quantile sketch with relative-error guarantees. Values are
+    counted in logarithmically sized buckets, so every quantile is reported to
+    within I{relative_accuracy} of a value in the stream, and sketches from
+    different processes can be merged into one which gives exactly the same
+    answers as a single sketch of all the values.
+
+    @see: <a href="http://www.vldb.org/pvldb/vol12/p2195-masson.pdf">
+          Masson et al. DDSketch: A Fast and Fully-Mergeable Quantile Sketch
+          with Relative-Error Guarantees. PVLDB 12(12) (2019)</a>
+    """
+    __slots__ = ("relative_accuracy", "max_buckets", "count", "zero_count",
+                 "positive", "negative", "_gamma", "_log_gamma", "_snapshot",
+                 "_snapshot_count")
+    FORMAT_VERSION = 1
+    _HEADER = Struct("<Bd")
+    MIN_INDEXABLE_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048):
+        """
+        Creates a new L{DDSketch}.
+
+        @type relative_accuracy: C{float}
+        @param relative_accuracy: the bound on the relative error of the
+                                  reported quantiles, in M{(0...1)}
+        @type max_buckets: C{int}
+        @param max_buckets: the number of buckets kept for each sign; beyond
+                            it the buckets of the smallest magnitudes are
+                            collapsed together
+        """
+        assert 0 < relative_accuracy < 1,\
+            "{0} is not in (0...1)".format(relative_accuracy)
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = log(self._gamma)
+        self.clear()
+
+    def clear(self):
+        """
+        Clears the sketch.
+        """
+        self.count = 0
+        self.zero_count = 0
+        self.positive = {}
+        self.negative = {}
+        self._snapshot = None
+
+    def size(self):
+        """
+        Returns the number of values counted.
+
+        @rtype: C{int}
+        @return: the size of the sketch
+        """
+        return self.count
+
+    def _key(self, magnitude):
+        """
+        Returns the bucket key for a positive magnitude.
+        """
+        return int(ceil(log(magnitude) / self._log_gamma))
+
+    def _value(self, key):
+        """
+        Returns the value reported for a bucket key, which is within
+        I{relative_accuracy} of every magnitude counted in the bucket.
+        """
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def update(self, value):
+        """
+        Counts a value in the sketch.
+
+        @type value: C{int} or C{float}
+        @param value: the new value to be added
+        """
+        self.count += 1
+        if value > self.MIN_INDEXABLE_VALUE:
+            store = self.positive
+        elif value < -self.MIN_INDEXABLE_VALUE:
+            store = self.negative
+            value = -value
+        else:
+            self.zero_count += 1
+            return
+        key = self._key(value)
+        store[key] = store.get(key, 0) + 1
+        if len(store) > self.max_buckets:
+            self._collapse(store)
+
+    def update_many(self, values):
+        """
+        Counts a batch of values in the sketch.
+
+        @type values: iterable of C{int} or C{float}, or a NumPy array
+        @param values: the new values to be added
+        """
+        if is_array(values):
+            values = values.tolist()
+        for value in values:
+            self.update(value)
+
+    def _collapse(self, store):
+        """
+        Folds the buckets of the smallest magnitudes of I{store} into one, so
+        that it holds no more than I{max_buckets} buckets.
+        """
+        keys = sorted(store)
+        excess = len(keys) - self.max_buckets
+        target = keys[excess]
+        for key in keys[:excess]:
+            store[target] += store.pop(key)
+
+    def merge(self, other):
+        """
+        Adds the counts of another L{DDSketch} with the same accuracy to this
+        one.
+
+        @type other: L{DDSketch}
+        @param other: the sketch to merge into this one
+
+        @raise ValueError: if the two sketches have different accuracies
+        """
+        if self.relative_accuracy != other.relative_accuracy:
+            raise ValueError("Cannot merge DDSketches with different "
+                             "relative accuracies")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for store, other_store in ((self.positive, other.positive),
+                                   (self.negative, other.negative)):
+            for key, count in dict_item_iter(other_store):
+                store[key] = store.get(key, 0) + count
+            if len(store) > self.max_buckets:
+                self._collapse(store)
+
+    def get_snapshot(self):
+        """
+        Creates a statistical snapshot from the current bucket counts. The
+        snapshot is reused until the sketch is updated again.
+
+        @rtype: L{BucketSnapshot}
+        """
+        count = self.count
+        if self._snapshot is None or self._snapshot_count != count:
+            self._snapshot = self._build_snapshot()
+            self._snapshot_count = count
+        return self._snapshot
+
+    def _build_snapshot(self):
+        """
+        Builds a L{BucketSnapshot} of the non-empty buckets.
+        """
+        buckets = []
+        for key in sorted(self.negative, reverse=True):
+            buckets.append((-self._value(key), self.negative[key]))
+        if self.zero_count:
+            buckets.append((0.0, self.zero_count))
+        for key in sorted(self.positive):
+            buckets.append((self._value(key), self.positive[key]))
+        return BucketSnapshot(buckets)
+
+    def serialize(self):
+        """
+        Encodes the sketch compactly: the accuracy, then for each sign the
+        bucket keys, delta-encoded, and their counts, all as varints.
+
+        @rtype: C{bytes}
+        @return: the encoded sketch, see L{DDSketch.deserialize}
+        """
+        buf = bytearray(self._HEADER.pack(self.FORMAT_VERSION,
+                                          self.relative_accuracy))
+        encode_varint(buf, self.max_buckets)
+        encode_varint(buf, self.zero_count)
+        for store in self.positive, self.negative:
+            encode_varint(buf, len(store))
+            previous = 0
+            for key in sorted(store):
+                encode_varint(buf, zigzag(key - previous))
+                encode_varint(buf, store[key])
+                previous = key
+        return bytes(buf)
+
+    @classmethod
+    def deserialize(klass, data):
+        """
+        Decodes a sketch encoded with L{DDSketch.serialize}.
+
+        @type data: C{bytes}
+        @param data: the encoded sketch
+
+        @rtype: L{DDSketch}
+        @raise ValueError: if I{data} is in an unknown format
+        """
+        data = bytearray(data)
+        version, relative_accuracy = klass._HEADER.unpack_from(data)
+        if version != klass.FORMAT_VERSION:
+            raise ValueError("Unknown DDSketch format {0}".format(version))
+        offset = klass._HEADER.size
+        max_buckets, offset = decode_varint(data, offset)
+        sketch = klass(relative_accuracy, max_buckets)
+        sketch.zero_count, offset = decode_varint(data, offset)
+        sketch.count = sketch.zero_count
+        for store in sketch.positive, sketch.negative:
+            length, offset = decode_varint(data, offset)
+            key = 0
+            for _ in xrange(length):
+                delta, offset = decode_varint(data, offset)
+                count, offset = decode_varint(data, offset)
+                key += unzigzag(delta)
+                store[key] = count
+                sketch.count += count
+        return sketch
@@ -1,7 +1,8 @@
 from __future__ import division, absolute_import
 
 from math import exp
-from time import time
+
+from yunomi.clock import NANOSECONDS_PER_SECOND, as_clock
 
 
 class EWMA(object):
@@ -11,9 +12,12 @@ class EWMA(object):
     @see: <a href="http://www.teamquest.com/pdfs/whitepaper/ldavg1.pdf">UNIX Load Average Part 1: How It Works</a>
     @see: <a href="http://www.teamquest.com/pdfs/whitepaper/ldavg2.pdf">UNIX Load Average Part 2: Not Your Average Average</a>
     """
+    __slots__ = ("initialized", "scheduled", "clock", "_period", "_interval",
+                 "_interval_ns", "_uncounted", "_rate", "_last_tick",
+                 "__weakref__")
     INTERVAL = 5
 
-    def __init__(self, period, interval=None):
+    def __init__(self, period, interval=None, clock=None):
         """
         Create a new EWMA with a specific smoothing constant.
 
@@ -21,46 +25,54 @@ class EWMA(object):
         @param period: the time it takes to reach a given significance level
         @type interval: C{int}
         @param interval: the expected tick interval, defaults to 5s
+        @param clock: the clock, or a function returning seconds; defaults to
+                      L{yunomi.clock.DEFAULT_CLOCK}
         """
         self.initialized = False
+        self.scheduled = False
+        self.clock = as_clock(clock)
         self._period = period
         self._interval = (interval or EWMA.INTERVAL)
+        self._interval_ns = int(self._interval * NANOSECONDS_PER_SECOND)
         self._uncounted = 0.0
         self._rate = 0.0
-        self._last_tick = time()
+        self._last_tick = self.clock.nanoseconds()
 
     @classmethod
-    def one_minute_EWMA(klass):
+    def one_minute_EWMA(klass, clock=None):
         """
         Creates a new EWMA which is equivalent to the UNIX one minute load
         average.
 
+        @param clock: the clock of the L{EWMA}
         @rtype: L{EWMA}
         @return: a one-minute EWMA
         """
-        return klass(60)
+        return klass(60, clock=clock)
 
     @classmethod
-    def five_minute_EWMA(klass):
+    def five_minute_EWMA(klass, clock=None):
         """
         Creates a new EWMA which is equivalent to the UNIX five minute load
         average.
 
+        @param clock: the clock of the L{EWMA}
         @rtype: L{EWMA}
         @return: a five-minute EWMA
         """
-        return klass(300)
+        return klass(300, clock=clock)
 
     @classmethod
-    def fifteen_minute_EWMA(klass):
+    def fifteen_minute_EWMA(klass, clock=None):
         """
         Creates a new EWMA which is equivalent to the UNIX fifteen minute load
         average.
 
+        @param clock: the clock of the L{EWMA}
         @rtype: L{EWMA}
         @return: a fifteen-minute EWMA
         """
-        return klass(900)
+        return klass(900, clock=clock)
 
     def update(self, value):
         """
@@ -71,13 +83,21 @@ class EWMA(object):
         """
         self._uncounted += value
 
-    def tick(self):
+    def tick(self, now=None):
         """
         Mark the passage of time and decay the current rate accordingly.
+
+        @type now: C{int}
+        @param now: the current time in nanoseconds, so a batch of L{EWMA}s
+                    can be ticked with a single clock read; defaults to
+                    reading the clock
         """
-        prev = self._last_tick
-        now = time()
-        interval = now - prev
+        if now is None:
+            now = self.clock.nanoseconds()
+        elapsed = now - self._last_tick
+        if elapsed <= 0:
+            return
+        interval = elapsed / NANOSECONDS_PER_SECOND
 
         instant_rate = self._uncounted / interval
         self._uncounted = 0
@@ -92,13 +112,16 @@ class EWMA(object):
 
     def get_rate(self):
         """
-        Returns the rate in counts per second. Calls L{EWMA.tick} when the
-        elapsed time is greater than L{EWMA.INTERVAL}.
+        Returns the rate in counts per second. Unless the L{EWMA} is
+        I{scheduled}, i.e. ticked by a L{TickScheduler}, calls L{EWMA.tick}
+        when the elapsed time is greater than L{EWMA.INTERVAL}.
 
         @rtype: C{float}
         @return: the rate
         """
-        if time() - self._last_tick >= self._interval:
+        if self.scheduled:
+            return self._rate
+        if self.clock.nanoseconds() - self._last_tick >= self._interval_ns:
             self.tick()
         return self._rate
 
@@ -1,9 +1,12 @@
 from __future__ import division, absolute_import
 
+from heapq import heapify, heappush, heapreplace, nlargest
 from math import exp
-from time import time
 from random import random
+from threading import Lock
 
+from yunomi.clock import as_clock
+from yunomi.compat import numpy, is_array
 from yunomi.stats.snapshot import Snapshot
 
 
@@ -14,17 +17,23 @@ class ExponentiallyDecayingSample(object):
     statistically representative sample, exponentially biased towards newer
     entries.
 
+    The reservoir is kept as a min-heap of C{(priority, value)} pairs, so the
+    lowest-priority entry is always at the front and replacing it on an update
+    into a full reservoir costs M{O(log n)}. Updates, merges and rescales
+    hold a lock, so that L{rescale} can run on another thread than the
+    updates.
+
     @see: <a href="http://www.research.att.com/people/Cormode_Graham/library/publications/CormodeShkapenyukSrivastavaXu09.pdf">
           Cormode et al. Forward Decay: A Practical Time Decay Model for
           Streaming Systems. ICDE '09: Proceedings of the 2009 IEEE
           International Conference on Data Engineering (2009)</a>
     """
+    __slots__ = ("reservoir_size", "alpha", "clock", "count", "values",
+                 "start_time", "next_scale_time", "_snapshot",
+                 "_snapshot_count", "_lock")
     RESCALE_THRESHOLD = 3600
-    count = 0
-    values = {}
-    next_scale_time = 0
 
-    def __init__(self, reservoir_size, alpha, clock=time):
+    def __init__(self, reservoir_size, alpha, clock=None):
         """
         Creates a new L{ExponentiallyDecayingSample}.
 
@@ -34,24 +43,44 @@ class ExponentiallyDecayingSample(object):
         @type alpha: C{float}
         @param alpha: the exponential decay factor; the higher this is, the more
                       biased the sample will be towards newer values
-        @type clock: C{function}
-        @param clock: the function used to return the current time, default to
-                      seconds since the epoch; to be used with other time
-                      units, or with the twisted clock for our testing purposes
+        @param clock: the clock, or a function returning seconds, e.g. the
+                      twisted clock for our testing purposes; defaults to
+                      L{yunomi.clock.DEFAULT_CLOCK}
         """
         self.reservoir_size = reservoir_size
         self.alpha = alpha
-        self.clock = clock
+        self.clock = as_clock(clock)
+        self._lock = Lock()
         self.clear()
 
+    def __copy__(self):
+        """
+        Returns a shallow copy of the sample, with a lock of its own.
+        """
+        copied = ExponentiallyDecayingSample.__new__(self.__class__)
+        copied.reservoir_size = self.reservoir_size
+        copied.alpha = self.alpha
+        copied.clock = self.clock
+        copied._lock = Lock()
+        with self._lock:
+            copied.count = self.count
+            copied.values = self.values
+            copied.start_time = self.start_time
+            copied.next_scale_time = self.next_scale_time
+        copied._snapshot = None
+        return copied
+
     def clear(self):
         """
         Clears the values in the sample and resets the clock.
         """
-        self.count = 0
-        self.values = {}
-        self.start_time = self.clock()
-        self.next_scale_time = self.clock() + self.RESCALE_THRESHOLD
+        with self._lock:
+            self.count = 0
+            self.values = []
+            self._snapshot = None
+            self.start_time = self.clock.seconds()
+            self.next_scale_time = (self.clock.seconds() +
+                                    self.RESCALE_THRESHOLD)
 
     def size(self):
         """
@@ -71,39 +100,142 @@ class ExponentiallyDecayingSample(object):
         @type value: C{int} or C{float}
         @param value: the value to be added
         @type timestamp: C{int}
-        @param timestamp: the epoch timestamp of I{value} in seconds
+        @param timestamp: the timestamp of I{value} in seconds, on the clock
+                          of the sample
+        """
+        if not timestamp:
+            timestamp = self.clock.seconds()
+        with self._lock:
+            self._rescale_if_needed()
+            priority = self._weight(timestamp - self.start_time) / random()
+            self.count += 1
+
+            if self.count <= self.reservoir_size:
+                heappush(self.values, (priority, value))
+            elif self.values[0][0] < priority:
+                heapreplace(self.values, (priority, value))
+
+    def update_many(self, values, timestamp=None):
+        """
+        Adds a batch of values, all with the same timestamp, to the sample.
+        The result is the same as calling L{update} for each of them, but only
+        the values whose priorities could still make it into the reservoir
+        are pushed into it. The priorities are drawn in one vectorized step
+        when I{values} is a NumPy array.
+
+        @type values: iterable of C{int} or C{float}, or a NumPy array
+        @param values: the values to be added
+        @type timestamp: C{int}
+        @param timestamp: the timestamp of I{values} in seconds, on the clock
+                          of the sample
         """
         if not timestamp:
-            timestamp = self.clock()
-        self._rescale_if_needed()
-        priority = self._weight(timestamp - self.start_time) / random()
-        self.count += 1
-
-        if self.count <= self.reservoir_size:
-            self.values[priority] = value
-        else:
-            first = min(self.values)
-            if first < priority:
-                if priority not in self.values:
-                    self.values[priority] = value
-                    while first not in self.values:
-                        first = min(self.values)
-                    del self.values[first]
+            timestamp = self.clock.seconds()
+        size = self.reservoir_size
+        if not is_array(values):
+            values = list(values)
+        n = len(values)
+
+        with self._lock:
+            self._rescale_if_needed()
+            weight = self._weight(timestamp - self.start_time)
+            if is_array(values):
+                priorities = weight / (1.0 - numpy.random.random(n))
+                if n > size:
+                    # Anything outside the batch's own top reservoir_size
+                    # priorities could never stay in the reservoir.
+                    top = numpy.argpartition(priorities, n - size)[n - size:]
+                    priorities, values = priorities[top], values[top]
+                candidates = zip(priorities.tolist(), values.tolist())
+            else:
+                candidates = [(weight / random(), value) for value in values]
+                if n > size:
+                    candidates = nlargest(size, candidates)
+
+            self.count += n
+            reservoir = self.values
+            for candidate in candidates:
+                if len(reservoir) < size:
+                    heappush(reservoir, candidate)
+                elif reservoir[0][0] < candidate[0]:
+                    heapreplace(reservoir, candidate)
+
+    def merge(self, other):
+        """
+        Merges the values of another L{ExponentiallyDecayingSample} with the
+        same I{alpha}, e.g. of another process, into this one. A priority is
+        the weight of its value relative to the landmark of its sample, so
+        the priorities of I{other} are moved to the landmark of this sample,
+        and the merged reservoir keeps the highest priorities of both, which
+        is what a single sample of both streams would have kept. Only the
+        values of I{other} which make it into the reservoir are pushed into
+        it. The two samples have to be on the same clock.
+
+        @type other: L{ExponentiallyDecayingSample}
+        @param other: the sample to merge into this one
+
+        @raise ValueError: if the two samples have different I{alpha}s
+        """
+        if self.alpha != other.alpha:
+            raise ValueError("Cannot merge ExponentiallyDecayingSamples with "
+                             "different alphas")
+        with other._lock:
+            other_count, other_values = other.count, list(other.values)
+            other_start, other_next = other.start_time, other.next_scale_time
+        if not other_count:
+            return
+        with self._lock:
+            if not self.values:
+                self.start_time = other_start
+                self.next_scale_time = other_next
+            factor = exp(self.alpha * (other_start - self.start_time))
+            reservoir = self.values
+            size = self.reservoir_size
+            free = size - len(reservoir)
+            candidates = other_values
+            if free:
+                taken = candidates[:free]
+                if factor != 1.0:
+                    taken = [(priority * factor, value)
+                             for priority, value in taken]
+                reservoir.extend(taken)
+                heapify(reservoir)
+                candidates = candidates[free:]
+            if candidates:
+                # Only the candidates above the lowest priority are moved
+                # to this landmark, rather than all of them.
+                lowest = reservoir[0][0]
+                for candidate in [(priority * factor, value)
+                                  for priority, value in candidates
+                                  if priority * factor > lowest]:
+                    if reservoir[0][0] < candidate[0]:
+                        heapreplace(reservoir, candidate)
+            self.count += other_count
+            self._snapshot = None
 
     def _rescale_if_needed(self):
         """
-        Checks the current time and rescales the sample if it time to do so.
+        Checks the current time and rescales the sample if it time to do so;
+        the lock must be held.
         """
-        now = self.clock()
+        now = self.clock.seconds()
         next_ = self.next_scale_time
         if now >= next_:
             self._rescale(now, next_)
 
     def get_snapshot(self):
         """
-        Creates a statistical snapshot from the current set of values.
+        Creates a statistical snapshot from the current set of values. The
+        snapshot is reused until the sample is updated or rescaled again.
+
+        @rtype: L{Snapshot}
         """
-        return Snapshot(self.values.values())
+        with self._lock:
+            count = self.count
+            if self._snapshot is None or self._snapshot_count != count:
+                self._snapshot = Snapshot([value for _, value in self.values])
+                self._snapshot_count = count
+            return self._snapshot
 
     def _weight(self, t):
         """
@@ -112,9 +244,24 @@ class ExponentiallyDecayingSample(object):
         """
         return exp(self.alpha * t)
 
+    def rescale(self):
+        """
+        Rescales the sample right away and pushes the next scheduled rescale
+        out by I{RESCALE_THRESHOLD}. Calling this periodically from a
+        background thread, or from a reactor's C{LoopingCall}, more often than
+        I{RESCALE_THRESHOLD} means L{update} never has to pay for a rescale.
+        It holds the lock of the sample, so the updates of other threads
+        wait for it, and are all either before or after it.
+        """
+        with self._lock:
+            self._rescale(self.clock.seconds(), self.next_scale_time)
+
     def _rescale(self, now, next_):
         """
-        Rescales the I{values}, assigning new priorities for each value.
+        Rescales the I{values}, multiplying every priority by the same factor.
+        Scaling by a positive factor keeps the heap ordered, so this is a
+        single pass over the reservoir; the new reservoir is built aside and
+        swapped in with one assignment. The lock must be held.
 
         @type now: C{int}
         @param now: the time right now
@@ -124,11 +271,23 @@ class ExponentiallyDecayingSample(object):
         if self.next_scale_time == next_:
             self.next_scale_time = now + self.RESCALE_THRESHOLD
             old_start_time = self.start_time
-            self.start_time = self.clock()
+            self.start_time = self.clock.seconds()
 
-            for key in sorted(self.values.keys()):
-                value = self.values[key]
-                del self.values[key]
-                self.values[key * exp(-self.alpha * (self.start_time - old_start_time))] = value
+            factor = exp(-self.alpha * (self.start_time - old_start_time))
+            # Priorities which underflow to zero are indistinguishable, so
+            # only the highest of them survives.
+            values = []
+            underflowed = None
+            for key, value in self.values:
+                new_key = key * factor
+                if new_key:
+                    values.append((new_key, value))
+                elif underflowed is None or underflowed[0] < key:
+                    underflowed = (key, value)
+            if underflowed is not None:
+                values.append((0.0, underflowed[1]))
+                heapify(values)
+            self.values = values
 
             self.count = len(self.values)
+            self._snapshot = None
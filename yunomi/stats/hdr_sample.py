@@ -0,0 +1,201 @@
+from __future__ import division, absolute_import
+
+from math import ceil, frexp, ldexp, log
+
+from yunomi.compat import xrange, numpy, is_array
+from yunomi.stats.snapshot import BucketSnapshot
+
+
+class HdrSample(object):
+    """
+    A fixed-size, log-linear bucketed recording of a stream of values, in the
+    spirit of Gil Tene's HdrHistogram. Every power of two is split into the
+    same number of linear sub-buckets, so recording a value is M{O(1)} and
+    every value is reported to within a bounded relative error.
+
+    Unlike the reservoir samples, every value is counted, so high quantiles
+    stay accurate however many values are recorded, and two recordings with
+    the same layout can be merged without losing anything.
+
+    @see: <a href="http://hdrhistogram.org/">HdrHistogram</a>
+    """
+    __slots__ = ("significant_figures", "lowest_discernible_value",
+                 "highest_trackable_value", "count", "counts",
+                 "negative_counts", "zero_count", "_min_exponent",
+                 "_max_exponent", "_sub_buckets", "_bucket_count", "_snapshot",
+                 "_snapshot_count")
+
+    def __init__(self, significant_figures=2, lowest_discernible_value=1e-9,
+                 highest_trackable_value=1e13):
+        """
+        Creates a new L{HdrSample}.
+
+        @type significant_figures: C{int}
+        @param significant_figures: the number of significant decimal figures
+                                    to which each value is kept
+        @type lowest_discernible_value: C{float}
+        @param lowest_discernible_value: the smallest magnitude told apart
+                                         from zero
+        @type highest_trackable_value: C{float}
+        @param highest_trackable_value: the largest magnitude recorded
+                                        accurately, by default hours in
+                                        nanoseconds; larger values are
+                                        counted in the highest bucket
+        """
+        self.significant_figures = significant_figures
+        self.lowest_discernible_value = lowest_discernible_value
+        self.highest_trackable_value = highest_trackable_value
+        self._sub_buckets = 2 ** int(ceil(log(10 ** significant_figures, 2)))
+        self._min_exponent = frexp(lowest_discernible_value)[1]
+        self._max_exponent = frexp(highest_trackable_value)[1]
+        self._bucket_count = ((self._max_exponent - self._min_exponent + 1) *
+                              self._sub_buckets)
+        self.clear()
+
+    def clear(self):
+        """
+        Clears the sample, setting all counts to zero.
+        """
+        self.count = 0
+        self.zero_count = 0
+        self.counts = [0] * self._bucket_count
+        self.negative_counts = None
+        self._snapshot = None
+
+    def size(self):
+        """
+        Returns the number of values recorded.
+
+        @rtype: C{int}
+        @return: the size of the sample
+        """
+        return self.count
+
+    def _index(self, magnitude):
+        """
+        Returns the index of the bucket a magnitude at least as big as
+        I{lowest_discernible_value} is counted in.
+        """
+        mantissa, exponent = frexp(magnitude)
+        index = ((exponent - self._min_exponent) * self._sub_buckets +
+                 int((mantissa - 0.5) * 2 * self._sub_buckets))
+        if index >= self._bucket_count:
+            return self._bucket_count - 1
+        return index
+
+    def _value(self, index):
+        """
+        Returns the value reported for the bucket at I{index}, the middle of
+        its range.
+        """
+        exponent, sub_bucket = divmod(index, self._sub_buckets)
+        mantissa = 0.5 + (sub_bucket + 0.5) / (2 * self._sub_buckets)
+        return ldexp(mantissa, exponent + self._min_exponent)
+
+    def update(self, value):
+        """
+        Counts a value in its bucket.
+
+        @type value: C{int} or C{float}
+        @param value: the new value to be added
+        """
+        self.count += 1
+        if value >= 0:
+            if value < self.lowest_discernible_value:
+                self.zero_count += 1
+            else:
+                self.counts[self._index(value)] += 1
+        elif -value < self.lowest_discernible_value:
+            self.zero_count += 1
+        else:
+            if self.negative_counts is None:
+                self.negative_counts = [0] * self._bucket_count
+            self.negative_counts[self._index(-value)] += 1
+
+    def update_many(self, values):
+        """
+        Counts a batch of values in their buckets. The bucket indices are
+        computed in one vectorized step when I{values} is a NumPy array.
+
+        @type values: iterable of C{int} or C{float}, or a NumPy array
+        @param values: the new values to be added
+        """
+        if not is_array(values):
+            for value in values:
+                self.update(value)
+            return
+
+        self.count += len(values)
+        magnitudes = numpy.abs(values).astype(float)
+        discernible = magnitudes >= self.lowest_discernible_value
+        self.zero_count += int(len(values) - discernible.sum())
+        mantissas, exponents = numpy.frexp(magnitudes[discernible])
+        indices = ((exponents - self._min_exponent) * self._sub_buckets +
+                   ((mantissas - 0.5) * 2 * self._sub_buckets).astype(int))
+        indices = numpy.minimum(indices, self._bucket_count - 1)
+        negative = values[discernible] < 0
+        for counts, selected in ((self.counts, indices[~negative]),
+                                 (self.negative_counts, indices[negative])):
+            if not len(selected):
+                continue
+            if counts is None:
+                counts = self.negative_counts = [0] * self._bucket_count
+            added = numpy.bincount(selected, minlength=self._bucket_count)
+            for index in numpy.nonzero(added)[0].tolist():
+                counts[index] += int(added[index])
+
+    def merge(self, other):
+        """
+        Adds the counts of another L{HdrSample} with the same layout to this
+        one.
+
+        @type other: L{HdrSample}
+        @param other: the sample to merge into this one
+
+        @raise ValueError: if the two samples have different layouts
+        """
+        if ((self.significant_figures, self.lowest_discernible_value,
+             self.highest_trackable_value) !=
+                (other.significant_figures, other.lowest_discernible_value,
+                 other.highest_trackable_value)):
+            raise ValueError("Cannot merge HdrSamples with different layouts")
+        self.count += other.count
+        self.zero_count += other.zero_count
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        if other.negative_counts is not None:
+            if self.negative_counts is None:
+                self.negative_counts = list(other.negative_counts)
+            else:
+                self.negative_counts = [a + b for a, b in
+                                        zip(self.negative_counts,
+                                            other.negative_counts)]
+
+    def get_snapshot(self):
+        """
+        Creates a statistical snapshot from the current bucket counts. The
+        snapshot is reused until the sample is updated again.
+
+        @rtype: L{BucketSnapshot}
+        """
+        count = self.count
+        if self._snapshot is None or self._snapshot_count != count:
+            self._snapshot = self._build_snapshot()
+            self._snapshot_count = count
+        return self._snapshot
+
+    def _build_snapshot(self):
+        """
+        Builds a L{BucketSnapshot} of the non-empty buckets.
+        """
+        buckets = []
+        if self.negative_counts is not None:
+            for index in xrange(self._bucket_count - 1, -1, -1):
+                if self.negative_counts[index]:
+                    buckets.append((-self._value(index),
+                                    self.negative_counts[index]))
+        if self.zero_count:
+            buckets.append((0.0, self.zero_count))
+        for index in xrange(self._bucket_count):
+            if self.counts[index]:
+                buckets.append((self._value(index), self.counts[index]))
+        return BucketSnapshot(buckets)
@@ -0,0 +1,200 @@
+from __future__ import division, absolute_import
+
+from array import array
+
+from yunomi.clock import NANOSECONDS_PER_SECOND, as_clock
+from yunomi.compat import int64_typecode, is_array
+from yunomi.stats.snapshot import Snapshot
+
+
+class SlidingTimeWindowSample(object):
+    """
+    A sample of all the values of a stream from the last I{window} seconds,
+    e.g. to report the 99th percentile of the last minute.
+
+    The values and their timestamps are kept in a pair of ring buffers, which
+    double when they are full and halve when they are a quarter full. Values
+    are evicted from the oldest end as they fall out of the window, so updates
+    and evictions are M{O(1)} amortized. The size of the sample is not
+    bounded; it is the number of values recorded during the window.
+    """
+    __slots__ = ("window", "clock", "count", "values", "times", "_head",
+                 "_length", "_window_ns", "_snapshot", "_snapshot_key")
+    MIN_CAPACITY = 16
+
+    def __init__(self, window=60, clock=None):
+        """
+        Creates a new L{SlidingTimeWindowSample}.
+
+        @type window: C{int} or C{float}
+        @param window: the number of seconds a value is kept for
+        @param clock: the clock, or a function returning seconds; defaults to
+                      L{yunomi.clock.DEFAULT_CLOCK}
+        """
+        self.window = window
+        self.clock = as_clock(clock)
+        self._window_ns = int(window * NANOSECONDS_PER_SECOND)
+        self.clear()
+
+    def clear(self):
+        """
+        Clears the sample.
+        """
+        self.values = array("d", [0.0]) * self.MIN_CAPACITY
+        self.times = array(int64_typecode, [0]) * self.MIN_CAPACITY
+        self.count = 0
+        self._head = 0
+        self._length = 0
+        self._snapshot = None
+
+    def _live(self):
+        """
+        Returns the values and timestamps in the window, oldest first.
+        """
+        head, end = self._head, self._head + self._length
+        capacity = len(self.values)
+        if end <= capacity:
+            return self.values[head:end], self.times[head:end]
+        end -= capacity
+        return (self.values[head:] + self.values[:end],
+                self.times[head:] + self.times[:end])
+
+    def _resize(self, capacity):
+        """
+        Moves the values in the window to ring buffers of a new capacity.
+        """
+        values, times = self._live()
+        padding = capacity - len(values)
+        self.values = values + array("d", [0.0]) * padding
+        self.times = times + array(int64_typecode, [0]) * padding
+        self._head = 0
+
+    def _evict(self, now):
+        """
+        Drops the values which are older than the window.
+        """
+        cutoff = now - self._window_ns
+        times = self.times
+        capacity = len(times)
+        head, length = self._head, self._length
+        while length and times[head] <= cutoff:
+            head += 1
+            if head == capacity:
+                head = 0
+            length -= 1
+        self._head, self._length = head, length
+        if capacity > self.MIN_CAPACITY and length < capacity // 4:
+            self._resize(capacity // 2)
+
+    def size(self):
+        """
+        Returns the number of values in the window.
+
+        @rtype: C{int}
+        @return: the size of the sample
+        """
+        self._evict(self.clock.nanoseconds())
+        return self._length
+
+    def update(self, value):
+        """
+        Adds a value to the sample, with the current time.
+
+        @type value: C{int} or C{float}
+        @param value: the new value to be added
+        """
+        now = self.clock.nanoseconds()
+        self._evict(now)
+        capacity = len(self.values)
+        if self._length == capacity:
+            self._resize(capacity * 2)
+            capacity *= 2
+        index = self._head + self._length
+        if index >= capacity:
+            index -= capacity
+        self.values[index] = value
+        self.times[index] = now
+        self._length += 1
+        self.count += 1
+
+    def update_many(self, values):
+        """
+        Adds a batch of values to the sample, all with the current time.
+
+        @type values: iterable of C{int} or C{float}, or a NumPy array
+        @param values: the new values to be added
+        """
+        values = values.tolist() if is_array(values) else list(values)
+        n = len(values)
+        if not n:
+            return
+        now = self.clock.nanoseconds()
+        self._evict(now)
+        capacity = len(self.values)
+        if self._length + n > capacity:
+            while self._length + n > capacity:
+                capacity *= 2
+            self._resize(capacity)
+
+        start = self._head + self._length
+        if start >= capacity:
+            start -= capacity
+        first = values[:capacity - start]
+        rest = values[len(first):]
+        self.values[start:start + len(first)] = array("d", first)
+        self.times[start:start + len(first)] = array(int64_typecode,
+                                                     [now]) * len(first)
+        self.values[:len(rest)] = array("d", rest)
+        self.times[:len(rest)] = array(int64_typecode, [now]) * len(rest)
+        self._length += n
+        self.count += n
+
+    def merge(self, other):
+        """
+        Merges the values of another L{SlidingTimeWindowSample}, e.g. one
+        decoded from another process by
+        L{yunomi.core.serialization.deserialize}, into this one. The values
+        of both windows are interleaved by timestamp, so the two samples
+        have to be on the same clock; values older than the window of this
+        sample are dropped.
+
+        @type other: L{SlidingTimeWindowSample}
+        @param other: the sample to merge into this one
+        """
+        if not other.count:
+            return
+        other._evict(other.clock.nanoseconds())
+        other_values, other_times = other._live()
+        values, times = self._live()
+        if not times or not other_times or times[-1] <= other_times[0]:
+            values += other_values
+            times += other_times
+        else:
+            # Two sorted runs, which the sort merges in one linear pass.
+            merged = sorted(zip(times + other_times, values + other_values))
+            times = array(int64_typecode, [time for time, _ in merged])
+            values = array("d", [value for _, value in merged])
+        n = len(values)
+        capacity = self.MIN_CAPACITY
+        while capacity < n:
+            capacity *= 2
+        self.values = values + array("d", [0.0]) * (capacity - n)
+        self.times = times + array(int64_typecode, [0]) * (capacity - n)
+        self._head = 0
+        self._length = n
+        self.count += other.count
+        self._evict(self.clock.nanoseconds())
+
+    def get_snapshot(self):
+        """
+        Creates a statistical snapshot of the values in the window. The
+        snapshot is reused until a value is added or evicted.
+
+        @rtype: L{Snapshot}
+        """
+        self._evict(self.clock.nanoseconds())
+        key = (self.count, self._length)
+        if self._snapshot is None or self._snapshot_key != key:
+            self._snapshot = Snapshot(self._live()[0])
+            self._snapshot_key = key
+        return self._snapshot
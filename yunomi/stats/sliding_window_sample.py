@@ -0,0 +1,142 @@
+from __future__ import division, absolute_import
+
+from array import array
+
+from yunomi.compat import is_array
+from yunomi.stats.snapshot import Snapshot
+from yunomi.stats.uniform_sample import merge_shares
+
+
+class SlidingWindowSample(object):
+    """
+    A sample of the last I{reservoir_size} values of a stream, kept in a ring
+    buffer of doubles. An update overwrites the oldest value in M{O(1)}.
+    """
+    __slots__ = ("reservoir_size", "values", "count", "_position",
+                 "_snapshot", "_snapshot_count")
+
+    def __init__(self, reservoir_size=1028):
+        """
+        Creates a new L{SlidingWindowSample}.
+
+        @type reservoir_size: C{int}
+        @param reservoir_size: the number of most recent values to keep
+        """
+        self.reservoir_size = reservoir_size
+        self.clear()
+
+    def clear(self):
+        """
+        Clears the sample.
+        """
+        self.values = array("d")
+        self.count = 0
+        self._position = 0
+        self._snapshot = None
+
+    def size(self):
+        """
+        Returns the size of the sample, which is never bigger than
+        I{reservoir_size}.
+
+        @rtype: C{int}
+        @return: the size of the sample
+        """
+        return len(self.values)
+
+    def update(self, value):
+        """
+        Adds a value to the sample, in place of the oldest one once the sample
+        is full.
+
+        @type value: C{int} or C{float}
+        @param value: the new value to be added
+        """
+        self.count += 1
+        ring = self.values
+        if len(ring) < self.reservoir_size:
+            ring.append(value)
+        else:
+            ring[self._position] = value
+            self._position = (self._position + 1) % self.reservoir_size
+
+    def update_many(self, values):
+        """
+        Adds a batch of values to the sample, with the same result as calling
+        L{update} for each of them; only the last I{reservoir_size} of them
+        are copied in.
+
+        @type values: iterable of C{int} or C{float}, or a NumPy array
+        @param values: the new values to be added
+        """
+        if not is_array(values):
+            values = list(values)
+        n = len(values)
+        if not n:
+            return
+        self.count += n
+        size = self.reservoir_size
+        if n >= size:
+            values = values[n - size:]
+            if is_array(values):
+                values = values.tolist()
+            self.values = array("d", values)
+            self._position = 0
+            return
+
+        if is_array(values):
+            values = values.tolist()
+        ring = self.values
+        free = size - len(ring)
+        if free > 0:
+            ring.extend(values[:free])
+            values = values[free:]
+        if values:
+            position = self._position
+            first = values[:size - position]
+            ring[position:position + len(first)] = array("d", first)
+            rest = values[len(first):]
+            ring[:len(rest)] = array("d", rest)
+            self._position = (position + len(values)) % size
+
+    def _ordered(self):
+        """
+        Returns the values of the ring, oldest first.
+        """
+        position = self._position
+        return self.values[position:] + self.values[:position]
+
+    def merge(self, other):
+        """
+        Merges the values of another L{SlidingWindowSample}, e.g. of another
+        process, into this one. Without timestamps the two windows cannot be
+        interleaved, so each contributes its most recent values in
+        proportion to the count of its stream, as in L{UniformSample.merge},
+        and the values of I{other} are taken as the newer ones.
+
+        @type other: L{SlidingWindowSample}
+        @param other: the sample to merge into this one
+        """
+        if not other.count:
+            return
+        kept, taken = merge_shares(self.reservoir_size, len(self.values),
+                                   self.count, len(other.values), other.count)
+        ours, theirs = self._ordered(), other._ordered()
+        self.values = (ours[len(ours) - kept:] +
+                       theirs[len(theirs) - taken:])
+        self._position = 0
+        self.count += other.count
+        self._snapshot = None
+
+    def get_snapshot(self):
+        """
+        Creates a statistical snapshot of the values in the window. The
+        snapshot is reused until the sample is updated again.
+
+        @rtype: L{Snapshot}
+        """
+        count = self.count
+        if self._snapshot is None or self._snapshot_count != count:
+            self._snapshot = Snapshot(self.values)
+            self._snapshot_count = count
+        return self._snapshot
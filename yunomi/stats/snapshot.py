@@ -1,5 +1,6 @@
 from __future__ import division, absolute_import
 
+from heapq import nlargest, nsmallest
 from math import floor
 
 
@@ -7,22 +8,58 @@ class Snapshot(object):
     """
     A statistical snapshot of a set of values.
     """
+    __slots__ = ("values", "_sorted", "_quantiles")
     MEDIAN_Q = 0.5
     P75_Q = 0.75
     P95_Q = 0.95
     P98_Q = .98
     P99_Q = .99
     P999_Q = .999
+    SELECTION_RATIO = 8
 
     def __init__(self, values):
         """
-        Create a new L{Snapshot} with the given values.
+        Create a new L{Snapshot} with the given values. The values are only
+        sorted once more than one quantile is asked for; a single quantile is
+        found by selection instead.
 
         @type values: C{dict}
         @param values: an unordered set of values in the sample
         """
         self.values = list(values)
-        self.values.sort()
+        self._sorted = False
+        self._quantiles = {}
+
+    def _sort(self):
+        """
+        Sorts the values, if they are not sorted yet.
+        """
+        if not self._sorted:
+            self.values.sort()
+            self._sorted = True
+
+    def _order_statistics(self, index):
+        """
+        Returns the values which would be at I{index} and I{index + 1} if the
+        values were sorted. Unless the values are sorted already, the side of
+        the distribution the two values are in is selected with a heap
+        instead, when that side is small; that is the case for the high
+        percentiles dashboards usually want.
+
+        @type index: C{int}
+        @param index: a 0-based index, smaller than the index of the last value
+        """
+        values = self.values
+        n = len(values)
+        if not self._sorted and not self._quantiles:
+            if (index + 2) * self.SELECTION_RATIO <= n:
+                lower, upper = nsmallest(index + 2, values)[-2:]
+                return lower, upper
+            if (n - index) * self.SELECTION_RATIO <= n:
+                upper, lower = nlargest(n - index, values)[-2:]
+                return lower, upper
+        self._sort()
+        return values[index], values[index + 1]
 
     def get_value(self, quantile):
         """
@@ -36,19 +73,22 @@ class Snapshot(object):
         """
         assert quantile >= 0.0 and quantile <= 1.0,\
             "{0} is not in [0...1]".format(quantile)
+        if quantile in self._quantiles:
+            return self._quantiles[quantile]
         if len(self.values) == 0:
             return 0.0
 
         pos = quantile * (len(self.values) + 1)
 
         if pos < 1:
-            return self.values[0]
-        if pos >= len(self.values):
-            return self.values[len(self.values) -1]
-
-        lower = self.values[int(pos) - 1]
-        upper = self.values[int(pos)]
-        return lower + (pos - floor(pos)) * (upper - lower)
+            value = self.values[0] if self._sorted else min(self.values)
+        elif pos >= len(self.values):
+            value = self.values[-1] if self._sorted else max(self.values)
+        else:
+            lower, upper = self._order_statistics(int(pos) - 1)
+            value = lower + (pos - floor(pos)) * (upper - lower)
+        self._quantiles[quantile] = value
+        return value
 
     def size(self):
         """
@@ -111,6 +151,7 @@ class Snapshot(object):
         @rtype: C{list}
         @return: a copy of the list of values
         """
+        self._sort()
         return self.values[:]
 
     def dump(output):
@@ -121,6 +162,91 @@ class Snapshot(object):
         """
         assert type(output) == file, "Argument must be of 'file' type"
 
+        self._sort()
         for value in self.values:
             output.write("{0}\n".format(value))
         output.close()
+
+
+class BucketSnapshot(Snapshot):
+    """
+    A statistical snapshot of a set of values which were recorded into
+    buckets, given as the representative value and the number of values of
+    each bucket. Quantiles are found with a single walk over the buckets, so
+    nothing is ever sorted.
+    """
+    __slots__ = ("buckets", "count")
+
+    def __init__(self, buckets):
+        """
+        Create a new L{BucketSnapshot} with the given buckets.
+
+        @type buckets: C{list} of C{tuple}
+        @param buckets: C{(value, count)} pairs, in increasing order of value
+        """
+        self.buckets = [(value, count) for value, count in buckets if count]
+        self.count = sum([count for _, count in self.buckets])
+
+    def get_value(self, quantile):
+        """
+        Returns the value at the given quantile.
+
+        @type quantile: C{float}
+        @param quantile: a given quantile in M{[0...1]}
+
+        @rtype: C{int} or C{float}
+        @return: the value in the distribution at the specified I{quantile}
+        """
+        assert quantile >= 0.0 and quantile <= 1.0,\
+            "{0} is not in [0...1]".format(quantile)
+        if self.count == 0:
+            return 0.0
+
+        pos = quantile * (self.count + 1)
+
+        if pos < 1:
+            return self.buckets[0][0]
+        if pos >= self.count:
+            return self.buckets[-1][0]
+
+        lower, upper = self._values_at(int(pos))
+        return lower + (pos - floor(pos)) * (upper - lower)
+
+    def _values_at(self, rank):
+        """
+        Returns the values at the given 1-based rank and the one after it.
+        """
+        seen = 0
+        lower = None
+        for value, count in self.buckets:
+            seen += count
+            if lower is None:
+                if seen >= rank:
+                    lower = value
+                    if seen > rank:
+                        return lower, value
+            else:
+                return lower, value
+        return lower, lower
+
+    def size(self):
+        """
+        Return the size of the given distribution.
+
+        @rtype: C{int}
+        @return: the size of the given distribution
+        """
+        return self.count
+
+    def get_values(self):
+        """
+        Returns the distribution of values, each bucket's value repeated as
+        many times as it was recorded.
+
+        @rtype: C{list}
+        @return: a list of the values
+        """
+        values = []
+        for value, count in self.buckets:
+            values.extend([value] * count)
+        return values
@@ -0,0 +1,102 @@
+from __future__ import division, absolute_import
+
+from threading import Event, Lock, Thread
+from weakref import WeakKeyDictionary
+
+from yunomi.clock import as_clock
+from yunomi.stats.ewma import EWMA
+
+
+class TickScheduler(object):
+    """
+    Ticks every registered L{EWMA} together, once every I{interval} seconds,
+    with a single clock read. Scheduled L{EWMA}s never tick when they are
+    read, so reading a rate is just an attribute load.
+
+    The ticks can come from a daemon thread, see L{TickScheduler.start}, or
+    from an event loop calling L{TickScheduler.tick}, e.g. with Twisted's
+    C{LoopingCall(scheduler.tick).start(EWMA.INTERVAL)}.
+    """
+
+    def __init__(self, interval=EWMA.INTERVAL, clock=None):
+        """
+        Creates a new L{TickScheduler}.
+
+        @type interval: C{int}
+        @param interval: the number of seconds between ticks, defaults to
+                         L{EWMA.INTERVAL}
+        @param clock: the clock, or a function returning seconds, which
+                      should be the clock of the registered L{EWMA}s;
+                      defaults to L{yunomi.clock.DEFAULT_CLOCK}
+        """
+        self.interval = interval
+        self.clock = as_clock(clock)
+        self._ewmas = WeakKeyDictionary()
+        self._lock = Lock()
+        self._stopping = Event()
+        self._thread = None
+
+    def register(self, ewma):
+        """
+        Starts ticking an L{EWMA}. The scheduler only keeps a weak reference
+        to it, so discarded L{EWMA}s do not have to be unregistered.
+
+        @type ewma: L{EWMA}
+        @param ewma: the moving average to tick
+        """
+        with self._lock:
+            self._ewmas[ewma] = True
+        ewma.scheduled = True
+
+    def unregister(self, ewma):
+        """
+        Stops ticking an L{EWMA}, which goes back to ticking when it is read.
+
+        @type ewma: L{EWMA}
+        @param ewma: the moving average to stop ticking
+        """
+        with self._lock:
+            self._ewmas.pop(ewma, None)
+        ewma.scheduled = False
+
+    def tick(self):
+        """
+        Ticks all the registered L{EWMA}s with the current time.
+        """
+        now = self.clock.nanoseconds()
+        with self._lock:
+            ewmas = list(self._ewmas.keys())
+        for ewma in ewmas:
+            ewma.tick(now)
+
+    def start(self):
+        """
+        Starts a daemon thread which calls L{TickScheduler.tick} every
+        I{interval} seconds until L{TickScheduler.stop} is called.
+        """
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = Thread(target=self._run, name="yunomi-tick-scheduler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the thread started by L{TickScheduler.start}, if any.
+        """
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        """
+        The body of the ticking thread.
+        """
+        while True:
+            self._stopping.wait(self.interval)
+            if self._stopping.is_set():
+                return
+            self.tick()
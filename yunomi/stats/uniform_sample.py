@@ -1,20 +1,60 @@
 from __future__ import division, absolute_import
 
-from random import randint
+from array import array
+from random import randint, random, sample as random_sample
 
-from yunomi.compat import xrange
+from yunomi.compat import numpy, is_array, xrange
 from yunomi.stats.snapshot import Snapshot
 
 
+def merge_shares(size, kept, count, other_kept, other_count):
+    """
+    Returns how many of the values of each of two reservoirs a merged
+    reservoir of at most I{size} values keeps. Each reservoir contributes in
+    proportion to the count of its stream, so every value of the merged
+    reservoir stands for as many values of the merged stream; the merged
+    reservoir is smaller than I{size} when a reservoir holds too few values
+    for its share.
+
+    @type size: C{int}
+    @param size: the size of the merged reservoir
+    @type kept: C{int}
+    @param kept: the number of values in the first reservoir
+    @type count: C{int}
+    @param count: the number of values the first reservoir has seen
+    @type other_kept: C{int}
+    @param other_kept: the number of values in the second reservoir
+    @type other_count: C{int}
+    @param other_count: the number of values the second reservoir has seen
+
+    @rtype: C{tuple}
+    @return: the number of values kept from each reservoir
+    """
+    total = count + other_count
+    if not total:
+        return 0, 0
+    target = size
+    for n, seen in (kept, count), (other_kept, other_count):
+        if seen:
+            target = min(target, n * total // seen)
+    other_share = min(other_kept, int(round(target * other_count / total)))
+    return min(kept, target - other_share), other_share
+
+
 class UniformSample(object):
     """
     A random sample of a stream of {@code long}s. Uses Vitter's Algorithm R to
     produce a statistically representative sample.
 
+    The reservoir is an C{array} of doubles, which grows up to
+    I{reservoir_size} as values come in, so a sample takes 8 bytes per value
+    and nothing for the values it has not seen yet.
+
     @see: <a href="http://www.cs.umd.edu/~samir/498/vitter.pdf">Random Sampling with a Reservoir</a>
     """
+    __slots__ = ("reservoir_size", "values", "count", "_snapshot",
+                 "_snapshot_count")
     BITS_PER_LONG = 63
-    values = []
 
     def __init__(self, reservoir_size):
         """
@@ -23,28 +63,26 @@ class UniformSample(object):
         @type reservoir_size: C{int}
         @param reservoir_size: the number of params to keep in the sampling reservoir
         """
-        self.values = [0 for x in xrange(reservoir_size)]
+        self.reservoir_size = reservoir_size
         self.clear()
 
     def clear(self):
         """
-        Clears the sample, setting all values to zero.
+        Clears the sample.
         """
-        self.values = [0 for x in xrange(len(self.values))]
+        self.values = array("d")
         self.count = 0
+        self._snapshot = None
 
     def size(self):
         """
         Returns the size of the uniform sample. The size will never be bigger
-        than the reservoir_size (ie. the size of the list of values).
+        than the reservoir_size.
 
         @rtype: C{int}
         @return: the size of the sample
         """
-        
-        if self.count > len(self.values):
-            return len(self.values)
-        return self.count
+        return len(self.values)
 
     def update(self, value):
         """
@@ -54,13 +92,83 @@ class UniformSample(object):
         @param value: the new value to be added
         """
         self.count += 1
-        if self.count <= len(self.values):
-            self.values[self.count - 1] = value
+        if self.count <= self.reservoir_size:
+            self.values.append(value)
         else:
             r = UniformSample.next_long(self.count)
-            if r < len(self.values):
+            if r < self.reservoir_size:
                 self.values[r] = value
 
+    def update_many(self, values):
+        """
+        Updates the sample with a batch of values, with the same result as
+        calling L{update} for each of them. The random indices are drawn in
+        one vectorized step when I{values} is a NumPy array.
+
+        @type values: iterable of C{int} or C{float}, or a NumPy array
+        @param values: the new values to be added
+        """
+        if not is_array(values):
+            values = list(values)
+        reservoir = self.values
+        size = self.reservoir_size
+        count = self.count
+
+        free = min(max(size - count, 0), len(values))
+        if free:
+            fill = values[:free]
+            if is_array(fill):
+                fill = fill.tolist()
+            reservoir.extend(fill)
+            count += free
+            values = values[free:]
+
+        if is_array(values):
+            # Algorithm R replaces a random index in [0, count) for the
+            # count-th value; only the indices inside the reservoir matter.
+            counts = numpy.arange(count + 1, count + len(values) + 1)
+            indices = (numpy.random.random(len(values)) * counts).astype(int)
+            hits = numpy.nonzero(indices < size)[0]
+            for index, value in zip(indices[hits].tolist(),
+                                    values[hits].tolist()):
+                reservoir[index] = value
+            count += len(values)
+        else:
+            for value in values:
+                count += 1
+                index = int(random() * count)
+                if index < size:
+                    reservoir[index] = value
+        self.count = count
+
+    def merge(self, other):
+        """
+        Merges the values of another L{UniformSample}, e.g. of another
+        process, into this one, as if it had sampled both streams. A share of
+        each reservoir is kept, picked at random, see L{merge_shares}; only
+        the values taken from I{other} are copied, into random slots of this
+        reservoir, so merging costs as much as the values taken.
+
+        @type other: L{UniformSample}
+        @param other: the sample to merge into this one
+        """
+        if not other.count:
+            return
+        reservoir = self.values
+        kept, taken = merge_shares(self.reservoir_size, len(reservoir),
+                                   self.count, len(other.values), other.count)
+        picks = random_sample(other.values, taken)
+        dropped = len(reservoir) - kept
+        if dropped > taken:
+            self.values = array("d", random_sample(reservoir, kept) + picks)
+        else:
+            for index, value in zip(
+                    random_sample(xrange(len(reservoir)), dropped), picks):
+                reservoir[index] = value
+            reservoir.extend(picks[dropped:])
+        self.count += other.count
+        self._snapshot = None
+
     @classmethod
     def next_long(klass, n):
         """
@@ -71,9 +179,13 @@ class UniformSample(object):
 
     def get_snapshot(self):
         """
-        Creates a statistical snapshot from the current set of values.
+        Creates a statistical snapshot from the current set of values. The
+        snapshot is reused until the sample is updated again.
+
+        @rtype: L{Snapshot}
         """
-        copy = []
-        for i in xrange(self.size()):
-            copy.append(self.values[i])
-        return Snapshot(copy)
+        count = self.count
+        if self._snapshot is None or self._snapshot_count != count:
+            self._snapshot = Snapshot(self.values)
+            self._snapshot_count = count
+        return self._snapshot
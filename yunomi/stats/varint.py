@@ -0,0 +1,102 @@
+from __future__ import division, absolute_import
+
+from yunomi.compat import xrange
+
+
+def zigzag(n):
+    """
+    Maps a signed integer to an unsigned one, so small magnitudes of either
+    sign have short varint encodings.
+
+    @type n: C{int}
+    @rtype: C{int}
+    """
+    if n < 0:
+        return (-n << 1) - 1
+    return n << 1
+
+
+def unzigzag(n):
+    """
+    Reverses L{zigzag}.
+
+    @type n: C{int}
+    @rtype: C{int}
+    """
+    if n & 1:
+        return -((n + 1) >> 1)
+    return n >> 1
+
+
+def encode_varint(buf, n):
+    """
+    Appends an unsigned integer to I{buf} as a little-endian base-128
+    varint, seven bits per byte.
+
+    @type buf: C{bytearray}
+    @param buf: the buffer to append to
+    @type n: C{int}
+    @param n: a non-negative integer
+    """
+    while n > 0x7f:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def decode_varint(data, offset):
+    """
+    Reads an unsigned varint written by L{encode_varint}.
+
+    @param data: a C{bytearray}, or anything else indexing to C{int}s
+    @type offset: C{int}
+    @param offset: where the varint starts in I{data}
+
+    @rtype: C{tuple}
+    @return: the integer, and the offset just past it
+    """
+    n = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, offset
+        shift += 7
+
+
+def decode_varints(data, offset, n):
+    """
+    Reads a run of I{n} unsigned varints written by L{encode_varint}, in one
+    call rather than one per varint; the one-byte varints of small numbers
+    take a single comparison each.
+
+    @param data: a C{bytearray}, or anything else indexing to C{int}s
+    @type offset: C{int}
+    @param offset: where the first varint starts in I{data}
+    @type n: C{int}
+    @param n: the number of varints
+
+    @rtype: C{tuple}
+    @return: the C{list} of integers, and the offset just past the last one
+    """
+    values = []
+    append = values.append
+    for _ in xrange(n):
+        byte = data[offset]
+        offset += 1
+        if byte < 0x80:
+            append(byte)
+            continue
+        value = byte & 0x7f
+        shift = 7
+        while True:
+            byte = data[offset]
+            offset += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        append(value)
+    return values, offset
@@ -0,0 +1,8 @@
+from __future__ import division, absolute_import
+
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 6):
+    # Uses async def, which earlier Pythons cannot even parse.
+    collect_ignore.append("test_coroutines.py")
@@ -0,0 +1,122 @@
+from __future__ import division, absolute_import
+
+import mock
+from unittest2 import TestCase
+
+from yunomi.compat import xrange
+from yunomi.core import serialization
+from yunomi.core.aggregator import RegistryAggregator
+from yunomi.core.metrics_registry import MetricsRegistry
+from yunomi.stats.hdr_sample import HdrSample
+from yunomi.tests.util import Clock
+
+
+class RegistryMergeTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.registry = MetricsRegistry(clock=self.clock)
+        self.other = MetricsRegistry(clock=self.clock)
+
+    def test_merge_adds_to_existing_metrics(self):
+        self.registry.counter("jobs").inc(2)
+        self.other.counter("jobs").inc(3)
+        self.registry.meter("requests").mark(4)
+        self.other.meter("requests").mark(6)
+        self.registry.merge(self.other)
+
+        self.assertEqual(self.registry.counter("jobs").get_count(), 5)
+        self.assertEqual(self.registry.meter("requests").get_count(), 10)
+        self.assertEqual(self.other.counter("jobs").get_count(), 3)
+
+    def test_merge_creates_the_missing_metrics(self):
+        self.other.timer("latency", sample=HdrSample).update_many(
+            [10, 20, 30])
+        self.other.histogram("sizes", striped=True).update_many([1, 2, 3])
+        self.registry.merge(self.other)
+
+        timer = self.registry.timer("latency")
+        self.assertIsInstance(timer.histogram.sample, HdrSample)
+        self.assertIsNot(timer, self.other.timer("latency"))
+        self.assertEqual(timer.get_count(), 3)
+        self.assertEqual(timer.meter.get_count(), 3)
+        self.assertEqual(self.registry.histogram("sizes").get_mean(), 2)
+        self.assertEqual([key for key, _, _, _ in self.registry.metrics()],
+                         ["latency", "sizes"])
+
+        self.registry.timer("latency").update(40)
+        self.assertEqual(self.other.timer("latency").get_count(), 3)
+
+    def test_merge_refuses_other_samples(self):
+        self.registry.histogram("sizes").update(1)
+        self.other.histogram("sizes", sample=HdrSample).update(1)
+        self.assertRaises(ValueError, self.registry.merge, self.other)
+
+
+class RegistryAggregatorTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.advance(100)
+        self.aggregator = RegistryAggregator(self.clock)
+
+    def worker(self, n):
+        registry = MetricsRegistry(clock=self.clock)
+        registry.counter("jobs").inc(n)
+        registry.gauge("queue", callback=lambda: n)
+        registry.meter("requests").mark(n)
+        registry.histogram("sizes").update_many(xrange(n * 100,
+                                                       (n + 1) * 100))
+        registry.timer("latency").update(n)
+        return registry.serialize()
+
+    def test_folds_the_encoded_registries(self):
+        expected = MetricsRegistry(clock=self.clock)
+        for n in xrange(20):
+            self.aggregator.add(self.worker(n))
+            expected.histogram("sizes").update_many(xrange(n * 100,
+                                                           (n + 1) * 100))
+        self.assertEqual(self.aggregator.inputs, 20)
+
+        registry = self.aggregator.flush()
+        self.assertEqual(registry.counter("jobs").get_count(), 190)
+        self.assertEqual(registry.gauge("queue").get_value(), 190)
+        self.assertEqual(registry.meter("requests").get_count(), 190)
+        self.assertEqual(registry.timer("latency").get_count(), 20)
+        self.assertEqual(registry.timer("latency").get_max(), 19)
+
+        sizes, expected = registry.histogram("sizes"), expected.histogram(
+            "sizes")
+        self.assertEqual(sizes.get_count(), 2000)
+        self.assertEqual(sizes.get_sum(), expected.get_sum())
+        self.assertAlmostEqual(sizes.get_mean(), expected.get_mean())
+        self.assertAlmostEqual(sizes.get_std_dev(), expected.get_std_dev())
+        self.assertTrue(sizes.get_snapshot().size() <= 1028)
+
+    def test_flush_starts_a_new_interval(self):
+        self.aggregator.add(self.worker(3))
+        first = self.aggregator.flush()
+        self.aggregator.add(self.worker(4))
+        second = self.aggregator.flush()
+
+        self.assertEqual(first.counter("jobs").get_count(), 3)
+        self.assertEqual(second.counter("jobs").get_count(), 4)
+        self.assertEqual(self.aggregator.inputs, 0)
+        self.assertEqual(self.aggregator.registry.metrics(), [])
+
+    def test_decodes_without_the_lock(self):
+        deserialize = serialization.deserialize
+
+        def decode(data, clock):
+            for metric in deserialize(data, clock):
+                self.assertFalse(self.aggregator._lock.locked())
+                yield metric
+
+        with mock.patch.object(serialization, "deserialize", decode):
+            self.aggregator.add(self.worker(3))
+        self.assertEqual(self.aggregator.flush().counter("jobs").get_count(),
+                         3)
+
+    def test_refuses_what_is_not_a_registry(self):
+        self.assertRaises(ValueError, self.aggregator.add, b"nonsense")
+        self.assertEqual(self.aggregator.inputs, 0)
@@ -0,0 +1,29 @@
+from __future__ import division, absolute_import
+
+from unittest2 import TestCase
+
+from yunomi.clock import DEFAULT_CLOCK, FunctionClock, as_clock
+from yunomi.tests.util import Clock
+
+
+class ClockTests(TestCase):
+
+    def test_default_clock_is_monotonic(self):
+        first = DEFAULT_CLOCK.nanoseconds()
+        second = DEFAULT_CLOCK.nanoseconds()
+        self.assertIsInstance(first, int)
+        self.assertTrue(second >= first)
+        self.assertAlmostEqual(DEFAULT_CLOCK.seconds(), second / 1e9, places=0)
+
+    def test_as_clock_defaults_to_the_default_clock(self):
+        self.assertIs(as_clock(None), DEFAULT_CLOCK)
+
+    def test_as_clock_keeps_clocks(self):
+        clock = Clock()
+        self.assertIs(as_clock(clock), clock)
+
+    def test_as_clock_wraps_functions_returning_seconds(self):
+        clock = as_clock(lambda: 1.5)
+        self.assertIsInstance(clock, FunctionClock)
+        self.assertEqual(clock.seconds(), 1.5)
+        self.assertEqual(clock.nanoseconds(), 1500000000)
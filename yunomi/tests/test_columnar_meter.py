@@ -0,0 +1,205 @@
+from __future__ import division, absolute_import
+
+from threading import Thread
+
+import mock
+from unittest2 import TestCase, skipIf
+
+from yunomi.compat import xrange, numpy
+from yunomi.core.columnar_meter import ColumnarMeterStore
+from yunomi.core.meter import Meter
+from yunomi.core.metrics_registry import MetricsRegistry
+from yunomi.stats.tick_scheduler import TickScheduler
+from yunomi.tests.util import Clock
+
+
+class ColumnarMeterTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.store = ColumnarMeterStore(self.clock)
+
+    def test_a_blank_meter(self):
+        meter = self.store.meter("requests")
+        self.assertEqual(meter.get_event_type(), "requests")
+        self.assertEqual(meter.get_count(), 0)
+        self.assertEqual(meter.get_mean_rate(), 0.0)
+        self.assertEqual(meter.get_one_minute_rate(), 0.0)
+
+    def test_meters_have_their_own_rows(self):
+        meters = [self.store.meter() for i in xrange(3)]
+        for n, meter in enumerate(meters):
+            meter.mark(n)
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual([meter.get_count() for meter in meters], [0, 1, 2])
+
+    def test_mean_rate_one_per_second(self):
+        meter = self.store.meter()
+        for i in xrange(10):
+            meter.mark()
+            self.clock.advance(1)
+        self.assertAlmostEqual(meter.get_mean_rate(), 1)
+
+    def test_mean_rate_is_zero_before_time_passes(self):
+        meter = self.store.meter()
+        meter.mark(3)
+        self.assertEqual(meter.get_mean_rate(), 0.0)
+
+    def test_rates_are_the_rates_of_a_meter(self):
+        meter = self.store.meter()
+        meter.mark(3)
+        self.clock.advance(5)
+
+        for one, five, fifteen in [(0.6, 0.6, 0.6),
+                                   (0.22072766, 0.49123845, 0.56130419),
+                                   (0.08120117, 0.40219203, 0.52510399),
+                                   (0.02987224, 0.32928698, 0.49123845)]:
+            self.assertAlmostEqual(meter.get_one_minute_rate(), one)
+            self.assertAlmostEqual(meter.get_five_minute_rate(), five)
+            self.assertAlmostEqual(meter.get_fifteen_minute_rate(), fifteen)
+            self.clock.advance(60)
+
+    def test_clear(self):
+        meter = self.store.meter()
+        meter.mark(3)
+        self.clock.advance(5)
+        meter.get_one_minute_rate()
+        meter.clear()
+        self.assertEqual(meter.get_count(), 0)
+        self.assertEqual(meter.get_one_minute_rate(), 0.0)
+
+    def test_scheduled_store_ticks_every_row_at_once(self):
+        scheduler = TickScheduler(clock=self.clock)
+        store = ColumnarMeterStore(self.clock, scheduler)
+        meters = [store.meter(), store.meter()]
+        for meter in meters:
+            meter.mark(3)
+        self.clock.advance(5)
+        for meter in meters:
+            self.assertEqual(meter.get_one_minute_rate(), 0.0)
+
+        scheduler.tick()
+        for meter in meters:
+            self.assertAlmostEqual(meter.get_one_minute_rate(), 0.6)
+
+    def test_registry_keeps_meters_and_timers_in_the_store(self):
+        registry = MetricsRegistry(self.clock, meter_store=self.store)
+        registry.meter("meter").mark()
+        registry.timer("timer").update(1)
+        self.clock.advance(1)
+        self.assertEqual(len(self.store), 2)
+        self.assertEqual(registry.timer("timer").meter.get_event_type(),
+                         "calls")
+        self.assertEqual(len(registry.dump_metrics()), 4 + 12)
+
+    @skipIf(numpy is None, "NumPy is not installed")
+    def test_vectorized_tick_matches_the_tick_of_each_row(self):
+        stores = [ColumnarMeterStore(self.clock),
+                  ColumnarMeterStore(self.clock)]
+        meters = [[store.meter() for i in xrange(100)] for store in stores]
+        for store_meters in meters:
+            for n, meter in enumerate(store_meters[:50]):
+                meter.mark(n)
+        self.clock.advance(5)
+        for store, store_meters in zip(stores, meters):
+            store._tick_row(0, self.clock.nanoseconds())
+            for n, meter in enumerate(store_meters):
+                meter.mark(2 * n)
+        self.clock.advance(5)
+        now = self.clock.nanoseconds()
+
+        stores[0]._tick_rows(now)
+        stores[1]._tick_vectorized(now)
+        for column in ("m1_rates", "m5_rates", "m15_rates", "ticked",
+                       "initialized", "last_ticks"):
+            for expected, actual in zip(getattr(stores[0], column),
+                                        getattr(stores[1], column)):
+                self.assertAlmostEqual(expected, actual)
+        stores[1].meter()
+
+    def test_tick_reads_the_clock_once(self):
+        clock = mock.Mock(wraps=self.clock)
+        store = ColumnarMeterStore(clock)
+        for i in xrange(store.VECTORIZE_THRESHOLD * 2):
+            store.meter().mark()
+        clock.reset_mock()
+        self.clock.advance(5)
+        store.tick()
+        self.assertEqual(clock.nanoseconds.call_count, 1)
+        self.assertAlmostEqual(store.m1_rates[0], 0.2)
+
+    def test_marks_during_a_tick_are_counted_by_the_next_one(self):
+        meter = self.store.meter()
+        meter.mark(3)
+        self.clock.advance(5)
+        self.store._lock.acquire()
+        try:
+            # Marks take no lock, so they go through while a tick runs.
+            marker = Thread(target=meter.mark, args=(2,))
+            marker.start()
+            marker.join()
+            self.assertEqual(meter.get_count(), 5)
+        finally:
+            self.store._lock.release()
+
+        self.store.tick()
+        self.assertAlmostEqual(self.store.m1_rates[0], 1.0)
+        self.assertEqual(self.store.ticked[0], 5)
+        meter.mark()
+        self.assertEqual(meter._state()[2][0][1], 1)
+
+    def test_column_tick_matches_the_tick_of_each_row(self):
+        stores = [ColumnarMeterStore(self.clock),
+                  ColumnarMeterStore(self.clock)]
+        for store in stores:
+            for n in xrange(10):
+                store.meter().mark(n)
+        self.clock.advance(5)
+        for store in stores:
+            store._tick_rows(self.clock.nanoseconds())
+            for row in xrange(10):
+                store.mark(row, 2 * row)
+        self.clock.advance(5)
+        now = self.clock.nanoseconds()
+
+        stores[0]._tick_rows(now)
+        for row in xrange(10):
+            stores[1]._tick_row(row, now)
+        for column in ("m1_rates", "m5_rates", "m15_rates", "ticked",
+                       "last_ticks"):
+            for expected, actual in zip(getattr(stores[0], column),
+                                        getattr(stores[1], column)):
+                self.assertAlmostEqual(expected, actual)
+
+    def test_get_snapshot_and_reset(self):
+        meter = self.store.meter()
+        other = self.store.meter()
+        meter.mark(3)
+        other.mark()
+        self.clock.advance(5)
+        self.assertEqual(meter.get_snapshot_and_reset(), 3)
+        self.assertEqual(meter.get_count(), 0)
+        self.assertEqual(other.get_count(), 1)
+        self.assertAlmostEqual(meter.get_one_minute_rate(), 0.6)
+
+        meter.mark(4)
+        self.clock.advance(2)
+        self.assertAlmostEqual(meter.get_mean_rate(), 2)
+
+    def test_merge_a_meter_into_a_row_and_back(self):
+        meter = self.store.meter()
+        other = Meter(clock=self.clock)
+        meter.mark(3)
+        other.mark(2)
+        self.clock.advance(5)
+        other.get_one_minute_rate()
+        meter.merge(other)
+
+        self.assertEqual(meter.get_count(), 5)
+        self.assertAlmostEqual(meter.get_one_minute_rate(), 0.6 + 0.4)
+
+        merged = Meter(clock=self.clock)
+        merged.merge(meter)
+        self.assertEqual(merged.get_count(), 5)
+        self.assertAlmostEqual(merged.get_five_minute_rate(),
+                               meter.get_five_minute_rate())
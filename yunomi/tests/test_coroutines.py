@@ -0,0 +1,158 @@
+from __future__ import division, absolute_import
+
+from inspect import isasyncgenfunction, iscoroutinefunction
+
+import mock
+from unittest2 import TestCase
+
+from yunomi.core.metrics_registry import MetricsRegistry
+from yunomi.core.timer import Timer
+from yunomi.tests.util import Clock
+
+
+class Suspend(object):
+    """
+    An awaitable which suspends the awaiting coroutine once.
+    """
+    def __await__(self):
+        yield
+
+
+def run(coro):
+    """
+    Runs a coroutine to completion without an event loop.
+    """
+    try:
+        while True:
+            coro.send(None)
+    except StopIteration as e:
+        return e.value
+
+
+async def collect(agen):
+    return [item async for item in agen]
+
+
+class CoroutineDecoratorTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.registry = MetricsRegistry(clock=self.clock)
+
+    def test_count_and_meter_calls(self):
+        @self.registry.count_calls
+        @self.registry.meter_calls
+        async def fetch(n):
+            await Suspend()
+            return n
+
+        self.assertTrue(iscoroutinefunction(fetch))
+        self.assertEqual(run(fetch(3)), 3)
+        self.assertEqual(run(fetch(n=4)), 4)
+        self.assertEqual(self.registry.counter("fetch_calls").get_count(), 2)
+        self.assertEqual(self.registry.meter("fetch_calls").get_count(), 2)
+
+    def test_hist_calls_uses_awaited_results(self):
+        @self.registry.hist_calls
+        async def fetch(n):
+            await Suspend()
+            return n
+
+        run(fetch(3))
+        run(fetch(5))
+        self.assertEqual(self.registry.histogram("fetch_calls").get_sum(), 8)
+
+    def test_time_calls_includes_the_time_suspended(self):
+        @self.registry.time_calls
+        async def fetch():
+            await Suspend()
+            self.clock.advance(2.0)
+            return 1
+
+        self.assertTrue(iscoroutinefunction(fetch))
+        self.assertEqual(run(fetch()), 1)
+        timer = self.registry.timer("fetch_calls")
+        self.assertEqual(timer.get_count(), 1)
+        self.assertEqual(timer.get_max(), 2000000000)
+
+    def test_time_calls_times_errors(self):
+        @self.registry.time_calls
+        async def fetch():
+            self.clock.advance(1.0)
+            raise ValueError()
+
+        self.assertRaises(ValueError, run, fetch())
+        self.assertEqual(self.registry.timer("fetch_calls").get_max(),
+                         1000000000)
+
+    def test_async_generators(self):
+        @self.registry.count_calls
+        @self.registry.time_calls
+        async def stream(n):
+            for i in range(n):
+                await Suspend()
+                self.clock.advance(1.0)
+                yield i
+
+        self.assertTrue(isasyncgenfunction(stream))
+        self.assertEqual(run(collect(stream(3))), [0, 1, 2])
+        self.assertEqual(self.registry.counter("stream_calls").get_count(), 1)
+        self.assertEqual(self.registry.timer("stream_calls").get_max(),
+                         3000000000)
+
+    def test_async_generators_pass_on_asend_athrow_and_aclose(self):
+        events = []
+
+        @self.registry.count_calls
+        @self.registry.time_calls
+        async def echo():
+            try:
+                value = yield "ready"
+                while True:
+                    try:
+                        value = yield value * 2
+                    except ValueError:
+                        value = yield "recovered"
+            finally:
+                self.clock.advance(1.0)
+                events.append("closed")
+
+        async def talk():
+            generator = echo()
+            replies = [await generator.__anext__(),
+                       await generator.asend(2),
+                       await generator.athrow(ValueError()),
+                       await generator.asend(5)]
+            await generator.aclose()
+            return replies
+
+        self.assertEqual(run(talk()), ["ready", 4, "recovered", 10])
+        self.assertEqual(events, ["closed"])
+        self.assertEqual(self.registry.timer("echo_calls").get_max(),
+                         1000000000)
+
+    def test_time_calls_reads_the_clock_without_a_timer_context(self):
+        @self.registry.time_calls
+        def handle():
+            self.clock.advance(1.0)
+
+        with mock.patch.object(Timer, "time") as time:
+            handle()
+        self.assertFalse(time.called)
+        self.assertEqual(self.registry.timer("handle_calls").get_count(), 1)
+
+
+class TimerContextTests(TestCase):
+
+    def test_async_with(self):
+        clock = Clock()
+        timer = Timer(clock=clock)
+
+        async def handle():
+            async with timer.time():
+                await Suspend()
+                clock.advance(2.5)
+
+        run(handle())
+        self.assertEqual(timer.get_count(), 1)
+        self.assertEqual(timer.get_max(), 2500000000)
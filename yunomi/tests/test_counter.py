@@ -1,8 +1,11 @@
 from __future__ import division, absolute_import
 
+from threading import Thread
+
 from unittest2 import TestCase
 
-from yunomi.core.counter import Counter
+from yunomi.compat import xrange
+from yunomi.core.counter import Counter, StripedCounter
 
 
 class CounterTests(TestCase):
@@ -34,3 +37,136 @@ class CounterTests(TestCase):
     def test_is_zero_after_being_cleared(self):
         self._counter.clear()
         self.assertEqual(self._counter.get_count(), 0)
+
+    def test_get_snapshot_and_reset(self):
+        counter = Counter()
+        counter.inc(5)
+        self.assertEqual(counter.get_snapshot_and_reset(), 5)
+        self.assertEqual(counter.get_count(), 0)
+        counter.dec(2)
+        self.assertEqual(counter.get_snapshot_and_reset(), -2)
+
+    def test_get_snapshot_and_reset_keeps_later_increments(self):
+        class RacingCounter(Counter):
+            __slots__ = ("value", "racing")
+
+            def __init__(self):
+                self.racing = False
+                Counter.__init__(self)
+
+            def _get_count(self):
+                count = self.value
+                if self.racing:
+                    # Another thread increments right after the read.
+                    self.racing = False
+                    self.value += 1
+                return count
+
+            def _set_count(self, count):
+                self.value = count
+
+            _count = property(_get_count, _set_count)
+
+        counter = RacingCounter()
+        counter.inc(5)
+        counter.racing = True
+        self.assertEqual(counter.get_snapshot_and_reset(), 5)
+        self.assertEqual(counter.get_count(), 1)
+
+    def test_merge(self):
+        counter, other = Counter(), StripedCounter()
+        counter.inc(5)
+        other.inc(3)
+        counter.merge(other)
+        self.assertEqual(counter.get_count(), 8)
+        self.assertEqual(other.get_count(), 3)
+
+
+class StripedCounterTests(TestCase):
+
+    def setUp(self):
+        self._counter = StripedCounter()
+
+    def test_starts_at_zero(self):
+        self.assertEqual(self._counter.get_count(), 0)
+
+    def test_increments_and_decrements(self):
+        self._counter.inc()
+        self._counter.inc(12)
+        self._counter.dec(3)
+        self.assertEqual(self._counter.get_count(), 10)
+
+    def test_is_zero_after_being_cleared(self):
+        self._counter.inc(5)
+        self._counter.clear()
+        self.assertEqual(self._counter.get_count(), 0)
+
+    def test_sums_the_counts_of_all_threads(self):
+        def count():
+            for i in xrange(10000):
+                self._counter.inc()
+            self._counter.dec(10)
+
+        threads = [Thread(target=count) for i in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self._counter.get_count(), 8 * 9990)
+
+    def test_clear_leaves_the_cells_alone(self):
+        thread = Thread(target=self._counter.inc, args=(5,))
+        thread.start()
+        thread.join()
+        self._counter.inc(2)
+        cell = self._counter._local.cell
+        self._counter.clear()
+        self.assertEqual(cell[0], 2)
+        self._counter.inc()
+        self.assertEqual(self._counter.get_count(), 1)
+
+    def test_retires_the_cells_of_dead_threads(self):
+        for i in xrange(3):
+            threads = [Thread(target=self._counter.inc, args=(2,))
+                       for j in xrange(10)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self._counter.inc()
+        self.assertEqual(len(self._counter._cells), 1)
+        self.assertEqual(self._counter.get_count(), 61)
+        self.assertEqual(self._counter._generation(), 31)
+        self.assertEqual(self._counter.get_snapshot_and_reset(), 61)
+        self.assertEqual(self._counter.get_count(), 0)
+
+    def test_get_snapshot_and_reset_loses_no_increments(self):
+        intervals = []
+        done = []
+
+        def count():
+            for i in xrange(10000):
+                self._counter.inc()
+
+        def flush():
+            while not done:
+                intervals.append(self._counter.get_snapshot_and_reset())
+
+        threads = [Thread(target=count) for i in xrange(4)]
+        flusher = Thread(target=flush)
+        flusher.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.append(True)
+        flusher.join()
+        intervals.append(self._counter.get_snapshot_and_reset())
+
+        self.assertEqual(sum(intervals), 40000)
+        self.assertEqual(self._counter.get_count(), 0)
+        self._counter.inc(3)
+        self.assertEqual(self._counter.get_count(), 3)
+        self._counter.clear()
+        self.assertEqual(self._counter.get_count(), 0)
@@ -0,0 +1,104 @@
+from __future__ import division, absolute_import
+
+from random import Random
+
+from unittest2 import TestCase
+
+from yunomi.compat import xrange
+from yunomi.core.histogram import Histogram
+from yunomi.stats.ddsketch import DDSketch
+from yunomi.stats.snapshot import Snapshot
+
+
+class DDSketchTests(TestCase):
+
+    def setUp(self):
+        self.sketch = DDSketch(0.01)
+
+    def _assert_close(self, actual, expected, accuracy=0.01):
+        self.assertTrue(abs(actual - expected) <= accuracy * abs(expected),
+                        "{0} is not within {1} of {2}".format(
+                            actual, accuracy, expected))
+
+    def test_an_empty_sketch(self):
+        snapshot = self.sketch.get_snapshot()
+        self.assertEqual(self.sketch.size(), 0)
+        self.assertAlmostEqual(snapshot.get_99th_percentile(), 0.0)
+
+    def test_quantiles_are_within_the_relative_accuracy(self):
+        values = [i / 100 for i in xrange(1, 10001)]
+        self.sketch.update_many(values)
+        snapshot = self.sketch.get_snapshot()
+        exact = Snapshot(values)
+
+        self.assertEqual(snapshot.size(), 10000)
+        for quantile in (0.0, 0.5, 0.75, 0.98, 0.99, 0.999, 1.0):
+            self._assert_close(snapshot.get_value(quantile),
+                               exact.get_value(quantile))
+
+    def test_zero_and_negative_values(self):
+        for value in (-5, -1, 0, 1, 5):
+            self.sketch.update(value)
+        values = self.sketch.get_snapshot().get_values()
+
+        self.assertEqual(values[2], 0.0)
+        for value, expected in zip(values, (-5, -1, 0, 1, 5)):
+            self._assert_close(value, expected)
+
+    def test_merging_gives_the_same_answers_as_one_sketch(self):
+        random = Random(42)
+        whole = DDSketch(0.01)
+        parts = [DDSketch(0.01) for i in xrange(4)]
+        for i in xrange(4000):
+            value = random.expovariate(1.0)
+            whole.update(value)
+            parts[i % 4].update(value)
+
+        merged = DDSketch(0.01)
+        for part in parts:
+            merged.merge(part)
+
+        self.assertEqual(merged.size(), whole.size())
+        self.assertEqual(merged.positive, whole.positive)
+        self.assertAlmostEqual(merged.get_snapshot().get_99th_percentile(),
+                               whole.get_snapshot().get_99th_percentile())
+
+    def test_merge_needs_the_same_accuracy(self):
+        self.assertRaises(ValueError, self.sketch.merge, DDSketch(0.02))
+
+    def test_buckets_of_the_smallest_magnitudes_are_collapsed(self):
+        sketch = DDSketch(0.01, max_buckets=10)
+        for i in xrange(100):
+            sketch.update(1.1 ** i)
+
+        self.assertEqual(len(sketch.positive), 10)
+        self.assertEqual(sketch.size(), 100)
+        self._assert_close(sketch.get_snapshot().get_value(1.0), 1.1 ** 99)
+
+    def test_serialization_round_trip(self):
+        for value in (-3.5, 0, 0.001, 1, 10, 10, 1e6):
+            self.sketch.update(value)
+        data = self.sketch.serialize()
+        sketch = DDSketch.deserialize(data)
+
+        self.assertIsInstance(data, bytes)
+        self.assertTrue(len(data) < 64)
+        self.assertEqual(sketch.relative_accuracy, 0.01)
+        self.assertEqual(sketch.size(), 7)
+        self.assertEqual(sketch.zero_count, 1)
+        self.assertEqual(sketch.positive, self.sketch.positive)
+        self.assertEqual(sketch.negative, self.sketch.negative)
+
+    def test_deserialize_rejects_unknown_formats(self):
+        data = bytearray(self.sketch.serialize())
+        data[0] = 99
+        self.assertRaises(ValueError, DDSketch.deserialize, bytes(data))
+
+    def test_histogram(self):
+        histogram = Histogram(DDSketch())
+        for i in xrange(1, 1001):
+            histogram.update(i)
+
+        self.assertEqual(histogram.get_count(), 1000)
+        self._assert_close(histogram.get_snapshot().get_99th_percentile(),
+                           990.99)
@@ -1,8 +1,13 @@
 from __future__ import division, absolute_import
 
-from unittest2 import TestCase
+from copy import copy
+from math import exp
+from threading import Thread
 
-from yunomi.compat import xrange
+import mock
+from unittest2 import TestCase, skipIf
+
+from yunomi.compat import xrange, numpy
 from yunomi.stats.exp_decay_sample import ExponentiallyDecayingSample
 from yunomi.tests.util import Clock
 
@@ -68,6 +73,128 @@ class ExponentiallyDecayingSampleTests(TestCase):
         self.assertTrue(sample.get_snapshot().size() == 10)
         self._assert_all_values_between(sample, 3000, 4000)
 
+    @mock.patch("yunomi.stats.exp_decay_sample.random")
+    def test_a_full_reservoir_keeps_the_highest_priorities(self, random_mock):
+        twisted_clock = Clock()
+        sample = ExponentiallyDecayingSample(3, 0.015, twisted_clock.seconds)
+        draws = [0.5, 0.9, 0.1, 0.7, 0.2, 0.95, 0.05]
+        random_mock.side_effect = draws
+        for value in xrange(len(draws)):
+            sample.update(value)
+
+        self.assertEqual(sample.size(), 3)
+        self.assertEqual(sorted(sample.get_snapshot().get_values()), [2, 4, 6])
+
+    def test_rescaling_early_keeps_values_and_postpones_the_next_rescale(self):
+        twisted_clock = Clock()
+        sample = ExponentiallyDecayingSample(100, 0.015, twisted_clock.seconds)
+        for i in xrange(100):
+            sample.update(i)
+            twisted_clock.advance(10)
+        values = sorted(sample.get_snapshot().get_values())
+        priorities = sorted(key for key, _ in sample.values)
+
+        sample.rescale()
+
+        self.assertEqual(sample.start_time, 1000)
+        self.assertEqual(sample.next_scale_time, 1000 + sample.RESCALE_THRESHOLD)
+        self.assertEqual(sorted(sample.get_snapshot().get_values()), values)
+        self.assertEqual(sample.values[0][0], min(key for key, _ in sample.values))
+        for old, new in zip(priorities, sorted(key for key, _ in sample.values)):
+            self.assertAlmostEqual(new, old * exp(-0.015 * 1000))
+
+    @mock.patch("yunomi.stats.exp_decay_sample.random")
+    def test_update_many_keeps_the_highest_priorities(self, random_mock):
+        twisted_clock = Clock()
+        sample = ExponentiallyDecayingSample(3, 0.015, twisted_clock.seconds)
+        draws = [0.5, 0.9, 0.1, 0.7, 0.2, 0.95, 0.05]
+        random_mock.side_effect = draws
+        sample.update_many(xrange(2))
+        sample.update_many(xrange(2, len(draws)))
+
+        self.assertEqual(sample.count, 7)
+        self.assertEqual(sample.size(), 3)
+        self.assertEqual(sorted(sample.get_snapshot().get_values()), [2, 4, 6])
+
+    @mock.patch("yunomi.stats.exp_decay_sample.random")
+    def test_merge_keeps_the_highest_priorities_of_both(self, random_mock):
+        twisted_clock = Clock()
+        sample = ExponentiallyDecayingSample(3, 0.015, twisted_clock.seconds)
+        other = ExponentiallyDecayingSample(3, 0.015, twisted_clock.seconds)
+        twisted_clock.advance(100)
+        # The other sample's landmark is 100s later, so its priorities are
+        # worth exp(1.5) times more on the landmark of this one.
+        other.clear()
+        random_mock.side_effect = [0.5, 0.4, 0.3, 0.1, 0.9, 0.2]
+        sample.update_many(xrange(3), timestamp=100)
+        other.update_many(xrange(3, 6), timestamp=100)
+        sample.merge(other)
+
+        self.assertEqual(sample.count, 6)
+        self.assertEqual(sorted(sample.get_snapshot().get_values()),
+                         [2, 3, 5])
+        self.assertAlmostEqual(max(key for key, _ in sample.values),
+                               exp(1.5) / 0.1)
+
+    def test_merge_into_an_empty_sample_takes_the_landmark(self):
+        twisted_clock = Clock()
+        sample = ExponentiallyDecayingSample(10, 0.015, twisted_clock.seconds)
+        twisted_clock.advance(50)
+        other = ExponentiallyDecayingSample(10, 0.015, twisted_clock.seconds)
+        other.update_many(xrange(5))
+        sample.merge(other)
+
+        self.assertEqual(sample.start_time, 50)
+        self.assertEqual(sorted(sample.values), sorted(other.values))
+
+    def test_merge_refuses_different_alphas(self):
+        sample = ExponentiallyDecayingSample(10, 0.015)
+        other = ExponentiallyDecayingSample(10, 0.5)
+        other.update(1)
+        self.assertRaises(ValueError, sample.merge, other)
+
+    @skipIf(numpy is None, "NumPy is not installed")
+    def test_update_many_with_a_numpy_array(self):
+        sample = ExponentiallyDecayingSample(100, 0.99)
+        sample.update_many(numpy.arange(10))
+        sample.update_many(numpy.arange(10, 1000))
+
+        self.assertEqual(sample.size(), 100)
+        for i in sample.get_snapshot().get_values():
+            self.assertIsInstance(i, int)
+            self.assertTrue(i < 1000 and i >= 0)
+
+    def test_snapshots_are_reused_until_the_next_update_or_rescale(self):
+        twisted_clock = Clock()
+        sample = ExponentiallyDecayingSample(10, 0.015, twisted_clock.seconds)
+        for i in xrange(20):
+            sample.update(i)
+        snapshot = sample.get_snapshot()
+        self.assertIs(sample.get_snapshot(), snapshot)
+
+        sample.update(20)
+        self.assertIsNot(sample.get_snapshot(), snapshot)
+
+        snapshot = sample.get_snapshot()
+        sample.rescale()
+        self.assertIsNot(sample.get_snapshot(), snapshot)
+
+    def test_updates_wait_for_a_rescale_on_another_thread(self):
+        sample = ExponentiallyDecayingSample(10, 0.015)
+        sample._lock.acquire()
+        try:
+            updater = Thread(target=sample.update, args=(1,))
+            updater.start()
+            updater.join(0.1)
+            self.assertTrue(updater.is_alive())
+            self.assertEqual(sample.count, 0)
+        finally:
+            sample._lock.release()
+        updater.join()
+
+        self.assertEqual(sample.count, 1)
+        self.assertIsNot(copy(sample)._lock, sample._lock)
+
     def _assert_all_values_between(self, sample, lower, upper):
         for value in sample.get_snapshot().get_values():
             self.assertTrue(value >= lower and value < upper)
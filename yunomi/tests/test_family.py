@@ -0,0 +1,94 @@
+from __future__ import division, absolute_import
+
+from unittest2 import TestCase
+
+from yunomi.core.family import MetricFamily
+from yunomi.core.metrics_registry import MetricsRegistry
+from yunomi.core.timer import Timer
+from yunomi.tests.util import Clock
+
+
+class MetricFamilyTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.registry = MetricsRegistry(clock=self.clock)
+
+    def test_getters_take_labels(self):
+        labels = (("endpoint", "/"), ("status", 200))
+        timer = self.registry.timer("http", labels=labels)
+        self.assertIsInstance(timer, Timer)
+        self.assertIs(self.registry.timer("http", labels=labels), timer)
+        self.assertIs(self.registry.timer("http", labels={
+            "status": 200, "endpoint": "/"}), timer)
+        self.assertIsNot(self.registry.timer("http", labels=(
+            ("endpoint", "/"), ("status", 500))), timer)
+        self.assertIsNot(self.registry.timer("http"), timer)
+
+    def test_labels_may_be_named_like_options(self):
+        counter = self.registry.counter("jobs", labels={"striped": "yes"})
+        self.assertEqual(type(counter).__name__, "Counter")
+        self.assertEqual(self.registry.metrics()[0][3], (("striped", "yes"),))
+
+    def test_children_are_cached_under_their_values(self):
+        family = self.registry.family("counter", "jobs", ("queue",))
+        self.assertIsInstance(family, MetricFamily)
+        self.assertIs(self.registry.family("counter", "jobs", ("queue",)),
+                      family)
+
+        child = family.labels("default")
+        self.assertIs(family.child({"queue": "default"}), child)
+        self.assertIs(self.registry.counter(
+            "jobs", labels=(("queue", "default"),)), child)
+        self.assertEqual(list(family._children), [("default",)])
+
+    def test_labels_are_strings_in_the_order_of_their_names(self):
+        family = self.registry.family("meter", "requests",
+                                      ("status", "endpoint"))
+        family.labels(200, "/").mark()
+        self.assertEqual(
+            [labels for _, _, _, labels in self.registry.metrics()],
+            [(("status", "200"), ("endpoint", "/"))])
+
+    def test_rejects_other_labels(self):
+        family = self.registry.family("counter", "jobs", ("queue",))
+        self.assertRaises(ValueError, family.labels)
+        self.assertRaises(ValueError, family.labels, "a", "b")
+        self.assertRaises(ValueError, family.child, {"host": "a"})
+        self.assertRaises(ValueError, family.child, (("queue", "a"),
+                                                     ("host", "a")))
+        self.assertRaises(ValueError, self.registry.family, "counter",
+                          "jobs", ("host",))
+        self.assertRaises(ValueError, self.registry.counter, "jobs",
+                          labels={"host": "a"})
+
+    def test_options_apply_to_every_child(self):
+        family = self.registry.family("counter", "jobs", ("queue",),
+                                      striped=True)
+        self.assertEqual(type(family.labels("a")).__name__,
+                         "StripedCounter")
+
+    def test_dumps_carry_the_labels(self):
+        self.registry.counter("jobs", labels=(("queue", "a"),)).inc(2)
+        self.registry.counter("jobs").inc(3)
+        self.assertEqual(self.registry.dump_metrics(), [
+            {"name": "jobs_count", "value": 3, "type": "int"},
+            {"name": "jobs_count", "value": 2, "type": "int",
+             "labels": {"queue": "a"}},
+        ])
+
+    def test_labels_survive_serialization_and_merging(self):
+        self.registry.counter("jobs", labels=(("queue", "a"),)).inc(2)
+        self.registry.timer("http", labels=(("endpoint", "/"),)).update(10)
+        self.clock.advance(1)
+        data = self.registry.serialize()
+
+        registry = MetricsRegistry.deserialize(data, self.clock)
+        self.assertEqual(registry.dump_metrics(),
+                         self.registry.dump_metrics())
+        registry.merge(self.registry)
+        self.assertEqual(registry.counter(
+            "jobs", labels=(("queue", "a"),)).get_count(), 4)
+        self.assertEqual(
+            registry.timer("http", labels=(("endpoint", "/"),)).get_count(), 2)
+        self.assertEqual(len(registry.metrics()), 2)
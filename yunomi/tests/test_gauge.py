@@ -0,0 +1,54 @@
+from __future__ import division, absolute_import
+
+from unittest2 import TestCase
+
+from yunomi.core.gauge import CallbackGauge, Gauge
+from yunomi.tests.util import Clock
+
+
+class GaugeTests(TestCase):
+
+    def test_starts_at_zero(self):
+        self.assertEqual(Gauge().get_value(), 0)
+
+    def test_keeps_the_last_value_set(self):
+        gauge = Gauge()
+        gauge.set(12)
+        gauge.set(3.5)
+        self.assertEqual(gauge.get_value(), 3.5)
+
+    def test_merge_adds_the_values(self):
+        gauge = Gauge(3)
+        gauge.merge(Gauge(4))
+        gauge.merge(CallbackGauge(lambda: 5))
+        self.assertEqual(gauge.get_value(), 12)
+
+
+class CallbackGaugeTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.calls = 0
+
+    def callback(self):
+        self.calls += 1
+        return self.calls * 10
+
+    def test_calls_its_function_on_every_read(self):
+        gauge = CallbackGauge(self.callback)
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(gauge.get_value(), 10)
+        self.assertEqual(gauge.get_value(), 20)
+
+    def test_caches_the_value_for_its_ttl(self):
+        gauge = CallbackGauge(self.callback, ttl=5, clock=self.clock)
+        self.assertEqual(gauge.get_value(), 10)
+        self.clock.advance(4.9)
+        self.assertEqual(gauge.get_value(), 10)
+        self.assertEqual(self.calls, 1)
+        self.clock.advance(0.1)
+        self.assertEqual(gauge.get_value(), 20)
+
+    def test_refuses_merges(self):
+        self.assertRaises(ValueError, CallbackGauge(self.callback).merge,
+                          Gauge(1))
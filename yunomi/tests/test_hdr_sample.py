@@ -0,0 +1,104 @@
+from __future__ import division, absolute_import
+
+from unittest2 import TestCase, skipIf
+
+from yunomi.compat import xrange, numpy
+from yunomi.core.histogram import Histogram
+from yunomi.stats.hdr_sample import HdrSample
+
+
+class HdrSampleTests(TestCase):
+
+    def setUp(self):
+        self.sample = HdrSample()
+
+    def test_an_empty_sample(self):
+        snapshot = self.sample.get_snapshot()
+        self.assertEqual(self.sample.size(), 0)
+        self.assertEqual(snapshot.size(), 0)
+        self.assertAlmostEqual(snapshot.get_99th_percentile(), 0.0)
+
+    def test_values_are_kept_to_the_relative_error(self):
+        for i in xrange(1, 1001):
+            self.sample.update(i / 1000)
+        snapshot = self.sample.get_snapshot()
+
+        self.assertEqual(self.sample.size(), 1000)
+        self.assertEqual(snapshot.size(), 1000)
+        for quantile in (0.5, 0.75, 0.99, 0.999):
+            expected = quantile * 1001 / 1000
+            self.assertAlmostEqual(snapshot.get_value(quantile) / expected,
+                                   1.0, delta=0.005)
+
+    def test_a_sample_of_many_values_keeps_the_tail(self):
+        for i in xrange(100):
+            self.sample.update_many([0.001] * 999)
+            self.sample.update(1.0)
+        snapshot = self.sample.get_snapshot()
+
+        self.assertEqual(snapshot.size(), 100000)
+        self.assertAlmostEqual(snapshot.get_99th_percentile(), 0.001,
+                               delta=0.00001)
+        self.assertAlmostEqual(snapshot.get_value(0.9995), 1.0, delta=0.005)
+
+    def test_zero_and_negative_values(self):
+        for value in (-2.0, -1.0, 0, 1.0, 2.0):
+            self.sample.update(value)
+        values = self.sample.get_snapshot().get_values()
+
+        self.assertEqual(len(values), 5)
+        for value, expected in zip(values, (-2.0, -1.0, 0, 1.0, 2.0)):
+            self.assertAlmostEqual(value, expected, delta=0.01)
+
+    def test_values_above_the_highest_trackable_value_are_capped(self):
+        sample = HdrSample(highest_trackable_value=1000)
+        sample.update(1e6)
+        self.assertTrue(sample.get_snapshot().get_values()[0] < 1100)
+
+    def test_merge(self):
+        other = HdrSample()
+        for i in xrange(1, 501):
+            self.sample.update(i)
+            other.update(i + 500)
+        other.update(-1)
+        self.sample.merge(other)
+        snapshot = self.sample.get_snapshot()
+
+        self.assertEqual(snapshot.size(), 1001)
+        self.assertAlmostEqual(snapshot.get_median() / 500, 1.0, delta=0.005)
+        self.assertAlmostEqual(snapshot.get_value(0.0), -1, delta=0.01)
+
+    def test_merge_needs_the_same_layout(self):
+        self.assertRaises(ValueError, self.sample.merge, HdrSample(3))
+
+    def test_clear(self):
+        self.sample.update(1)
+        self.sample.update(-1)
+        self.sample.clear()
+        self.assertEqual(self.sample.size(), 0)
+        self.assertEqual(self.sample.get_snapshot().get_values(), [])
+
+    @skipIf(numpy is None, "NumPy is not installed")
+    def test_update_many_with_a_numpy_array(self):
+        values = numpy.array([-3.0, 0.0, 1e-12, 0.5, 2.0, 2.0, 1e12])
+        expected = HdrSample()
+        for value in values.tolist():
+            expected.update(value)
+        self.sample.update_many(values)
+
+        self.assertEqual(self.sample.size(), expected.size())
+        self.assertEqual(self.sample.zero_count, expected.zero_count)
+        self.assertEqual(self.sample.counts, expected.counts)
+        self.assertEqual(self.sample.negative_counts, expected.negative_counts)
+
+    def test_histogram(self):
+        histogram = Histogram.get_hdr()
+        for i in xrange(1, 1001):
+            histogram.update(i)
+
+        self.assertEqual(histogram.get_count(), 1000)
+        self.assertEqual(histogram.get_max(), 1000)
+        self.assertAlmostEqual(histogram.get_mean(), 500.5)
+        snapshot = histogram.get_snapshot()
+        self.assertAlmostEqual(snapshot.get_99th_percentile() / 990.99, 1.0,
+                               delta=0.005)
@@ -1,9 +1,13 @@
 from __future__ import division, absolute_import
 
-from unittest2 import TestCase
+from threading import Thread
 
-from yunomi.compat import xrange
-from yunomi.core.histogram import Histogram
+from unittest2 import TestCase, skipIf
+
+from yunomi.compat import xrange, numpy
+from yunomi.core.histogram import Histogram, StripedHistogram
+from yunomi.stats.hdr_sample import HdrSample
+from yunomi.stats.uniform_sample import UniformSample
 
 
 class HistogramTests(TestCase):
@@ -54,3 +58,234 @@ class HistogramTests(TestCase):
             self.assertAlmostEqual(snapshot.get_75th_percentile(), 750.75)
             self.assertAlmostEqual(snapshot.get_99th_percentile(), 990.99)
             self.assertAlmostEqual(snapshot.size(), 1000)
+
+    def _assert_same_stats(self, expected, histogram):
+        self.assertEqual(histogram.get_count(), expected.get_count())
+        self.assertEqual(histogram.get_max(), expected.get_max())
+        self.assertEqual(histogram.get_min(), expected.get_min())
+        self.assertEqual(histogram.get_sum(), expected.get_sum())
+        self.assertAlmostEqual(histogram.get_mean(), expected.get_mean())
+        self.assertAlmostEqual(histogram.get_variance(),
+                               expected.get_variance(), places=6)
+        self.assertEqual(histogram.get_snapshot().size(),
+                         expected.get_snapshot().size())
+
+    def test_update_many_is_equivalent_to_update(self):
+        for factory in Histogram.get_biased, Histogram.get_uniform:
+            expected, histogram = factory(), factory()
+            for i in xrange(1, 2001):
+                expected.update(i % 97)
+            histogram.update_many(i % 97 for i in xrange(1, 1001))
+            histogram.update_many([i % 97 for i in xrange(1001, 2001)])
+            self._assert_same_stats(expected, histogram)
+
+    def test_update_many_with_nothing(self):
+        self.histogram_u.update_many([])
+        self.assertEqual(self.histogram_u.get_count(), 0)
+        self.assertAlmostEqual(self.histogram_u.get_variance(), 0)
+
+    @skipIf(numpy is None, "NumPy is not installed")
+    def test_update_many_with_a_numpy_array(self):
+        for factory in Histogram.get_biased, Histogram.get_uniform:
+            expected, histogram = factory(), factory()
+            for i in xrange(1, 5001):
+                expected.update(float(i % 97))
+            histogram.update(1.0)
+            histogram.update_many(numpy.arange(2, 5001) % 97.0)
+            self._assert_same_stats(expected, histogram)
+            for value in histogram.get_snapshot().get_values():
+                self.assertIsInstance(value, float)
+
+    def test_get_snapshot_and_reset(self):
+        for histogram in (self.histogram_b, self.histogram_u,
+                          Histogram.get_hdr(), Histogram.get_sliding_window()):
+            histogram.update_many(xrange(1, 11))
+            sample = histogram.sample
+            interval = histogram.get_snapshot_and_reset()
+
+            self.assertIs(interval.sample, sample)
+            self.assertIsNot(histogram.sample, sample)
+            self.assertIs(type(histogram.sample), type(sample))
+            self.assertEqual(interval.get_count(), 10)
+            self.assertEqual(interval.get_max(), 10)
+            self.assertAlmostEqual(interval.get_std_dev(), 3.0277, places=4)
+            self.assertEqual(interval.get_snapshot().size(), 10)
+
+            self.assertEqual(histogram.get_count(), 0)
+            self.assertEqual(histogram.get_snapshot().size(), 0)
+            histogram.update(20)
+            self.assertEqual(histogram.get_mean(), 20)
+            self.assertEqual(interval.get_count(), 10)
+
+    def test_merge_is_equivalent_to_updating_one_histogram(self):
+        for factory in Histogram.get_uniform, Histogram.get_hdr:
+            expected, histogram, other = factory(), factory(), factory()
+            expected.update_many(xrange(1, 501))
+            histogram.update_many(xrange(1, 201))
+            other.update_many(xrange(201, 501))
+            histogram.merge(other)
+            self._assert_same_stats(expected, histogram)
+            self.assertEqual(other.get_count(), 300)
+
+    def test_merge_into_an_empty_histogram(self):
+        other = Histogram.get_uniform()
+        other.update_many([3, 5, 10])
+        self.histogram_u.merge(other)
+        self._assert_same_stats(other, self.histogram_u)
+
+    def test_merge_refuses_other_samples(self):
+        other = Histogram.get_hdr()
+        other.update(1)
+        self.assertRaises(ValueError, self.histogram_u.merge, other)
+
+
+class StripedHistogramTests(TestCase):
+
+    def setUp(self):
+        self.histogram = StripedHistogram()
+
+    def record(self, batches, update=None):
+        """
+        Records each batch of values from a thread of its own.
+        """
+        update = update or self.histogram.update
+        threads = [Thread(target=lambda batch=batch: [update(value)
+                                                      for value in batch])
+                   for batch in batches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_empty_histogram(self):
+        self.assertEqual(self.histogram.get_count(), 0)
+        self.assertAlmostEqual(self.histogram.get_max(), 0)
+        self.assertAlmostEqual(self.histogram.get_min(), 0)
+        self.assertAlmostEqual(self.histogram.get_mean(), 0)
+        self.assertAlmostEqual(self.histogram.get_std_dev(), 0)
+        self.assertAlmostEqual(self.histogram.get_sum(), 0)
+        self.assertEqual(self.histogram.get_snapshot().size(), 0)
+
+    def test_merges_the_shards_of_every_thread(self):
+        batches = [xrange(1, 1001), xrange(5000, 5010), [3.5] * 7, [-2]]
+        self.record(batches)
+        values = [value for batch in batches for value in batch]
+        single = Histogram(UniformSample(2000))
+        single.update_many(values)
+
+        self.assertEqual(sum([shard.count
+                              for shard in self.histogram.shards()]), 1018)
+        self.assertEqual(self.histogram.get_count(), single.get_count())
+        self.assertEqual(self.histogram.get_max(), 5009)
+        self.assertEqual(self.histogram.get_min(), -2)
+        self.assertAlmostEqual(self.histogram.get_sum(), single.get_sum())
+        self.assertAlmostEqual(self.histogram.get_mean(), single.get_mean())
+        self.assertAlmostEqual(self.histogram.get_variance(),
+                               single.get_variance())
+        self.assertAlmostEqual(self.histogram.get_std_dev(),
+                               single.get_std_dev())
+        self.assertEqual(self.histogram.get_snapshot().get_values(),
+                         sorted(values))
+
+    def test_update_many(self):
+        self.histogram.update_many(xrange(10))
+        self.histogram.update(10)
+        self.assertEqual(self.histogram.get_count(), 11)
+        self.assertAlmostEqual(self.histogram.get_variance(), 11.0)
+
+    def test_weights_subsampled_reservoirs(self):
+        histogram = StripedHistogram(lambda: UniformSample(100))
+        self.record([[1] * 10000, [2] * 100], histogram.update)
+        values = histogram.get_snapshot().get_values()
+        # Each value of the busy thread stands for 100 recorded values, so
+        # the quiet one keeps a single value to stand for the same.
+        self.assertEqual(values, [1] * 100 + [2])
+
+    def test_merges_mergeable_samples(self):
+        histogram = StripedHistogram(HdrSample)
+        self.record([xrange(1, 101), xrange(101, 201)], histogram.update)
+        snapshot = histogram.get_snapshot()
+        self.assertEqual(snapshot.size(), 200)
+        self.assertAlmostEqual(snapshot.get_median(), 100.5, delta=1)
+
+    def test_reads_concurrent_with_updates(self):
+        errors = []
+
+        def read():
+            try:
+                self.assertTrue(histogram.get_variance() >= 0)
+                histogram.get_std_dev()
+                histogram.get_snapshot_and_reset()
+            except Exception as e:
+                errors.append(e)
+
+        class ReadingSample(UniformSample):
+            def update(self, value):
+                # Another thread reads in the middle of the update.
+                reader = Thread(target=read)
+                reader.start()
+                reader.join()
+                UniformSample.update(self, value)
+
+        histogram = StripedHistogram(lambda: ReadingSample(100))
+        self.record([[1, 5]] * 4, histogram.update)
+        self.assertEqual(errors, [])
+
+    def test_retires_the_shards_of_dead_threads(self):
+        for batch in [xrange(10), xrange(10, 20), xrange(20, 30)]:
+            self.record([batch])
+        self.histogram.update(30)
+        generation = self.histogram._generation()
+
+        # The main thread's shard, and the one of the three dead threads.
+        self.assertEqual(len(self.histogram.shards()), 2)
+        self.assertEqual(self.histogram.get_count(), 31)
+        self.assertEqual(generation, 31)
+
+        self.record([xrange(31, 41)])
+        interval = self.histogram.get_snapshot_and_reset()
+        self.assertEqual(len(self.histogram._cells), 1)
+        self.assertEqual(interval.get_count(), 41)
+        self.assertEqual(interval.get_snapshot().get_values(),
+                         list(range(41)))
+        self.assertEqual(self.histogram.get_count(), 0)
+        self.assertEqual(self.histogram._generation(), 41)
+
+    def test_is_empty_after_being_cleared(self):
+        self.record([xrange(100), xrange(100)])
+        self.histogram.clear()
+        self.assertEqual(self.histogram.get_count(), 0)
+        self.assertEqual(self.histogram.get_snapshot().size(), 0)
+        self.histogram.update(4)
+        self.assertEqual(self.histogram.get_mean(), 4)
+
+    def test_get_snapshot_and_reset(self):
+        self.record([xrange(100), xrange(100, 150)])
+        interval = self.histogram.get_snapshot_and_reset()
+        self.histogram.update(7)
+
+        self.assertEqual(interval.get_count(), 150)
+        self.assertEqual(interval.get_max(), 149)
+        self.assertEqual(interval.get_snapshot().size(), 150)
+        self.assertEqual(self.histogram.get_count(), 1)
+        self.assertEqual(self.histogram.get_snapshot().get_values(), [7])
+
+    def test_get_snapshot_and_reset_loses_no_updates(self):
+        intervals = []
+        done = []
+
+        def flush():
+            while not done:
+                intervals.append(self.histogram.get_snapshot_and_reset())
+
+        flusher = Thread(target=flush)
+        flusher.start()
+        self.record([[1] * 10000] * 4)
+        done.append(True)
+        flusher.join()
+        intervals.append(self.histogram.get_snapshot_and_reset())
+
+        self.assertEqual(sum([interval.get_count()
+                              for interval in intervals]), 40000)
+        self.assertEqual(sum([interval.get_sum()
+                              for interval in intervals]), 40000)
@@ -1,10 +1,12 @@
 from __future__ import division, absolute_import
 
-import mock
+from math import exp
+
 from unittest2 import TestCase
 
 from yunomi.compat import xrange
 from yunomi.core.meter import Meter
+from yunomi.tests.util import Clock
 
 
 class MeterTests(TestCase):
@@ -14,28 +16,30 @@ class MeterTests(TestCase):
         self.assertEqual(self.meter.get_count(), 0)
         self.assertAlmostEqual(self.meter.get_mean_rate(), 0.0)
 
+    def test_meters_have_no_instance_dict(self):
+        self.assertFalse(hasattr(Meter("test"), "__dict__"))
+        self.assertFalse(hasattr(Meter("test")._m1_rate, "__dict__"))
+
     def test_meter_with_three_events(self):
         self.meter = Meter("test")
         self.meter.mark(3)
         self.assertEqual(self.meter.get_count(), 3)
 
-    @mock.patch("yunomi.core.meter.time")
-    def test_mean_rate_one_per_second(self, time_mock):
-        time_mock.return_value = 0.0
-        self.meter = Meter("test")
+    def test_mean_rate_one_per_second(self):
+        clock = Clock()
+        self.meter = Meter("test", clock=clock)
         for i in xrange(10):
             self.meter.mark()
-            time_mock.return_value += 1
+            clock.advance(1)
 
         self.meter._tick()
         self.assertAlmostEqual(self.meter.get_mean_rate(), 1)
 
-    @mock.patch("yunomi.stats.ewma.time")
-    def test_meter_EWMA_rates(self, time_mock):
-        time_mock.return_value = 0.0
-        self.meter = Meter("test")
+    def test_meter_EWMA_rates(self):
+        clock = Clock()
+        self.meter = Meter("test", clock=clock)
         self.meter.mark(3)
-        time_mock.return_value += 5
+        clock.advance(5)
 
         for one, five, fifteen in [(0.6, 0.6, 0.6),
                                    (0.22072766, 0.49123845, 0.56130419),
@@ -50,4 +54,48 @@ class MeterTests(TestCase):
             self.assertAlmostEqual(self.meter.get_one_minute_rate(), one)
             self.assertAlmostEqual(self.meter.get_five_minute_rate(), five)
             self.assertAlmostEqual(self.meter.get_fifteen_minute_rate(), fifteen)
-            time_mock.return_value += 60
+            clock.advance(60)
+
+    def test_get_snapshot_and_reset(self):
+        clock = Clock()
+        meter = Meter("test", clock=clock)
+        meter.mark(3)
+        clock.advance(5)
+        self.assertEqual(meter.get_snapshot_and_reset(), 3)
+        self.assertEqual(meter.get_count(), 0)
+        self.assertAlmostEqual(meter.get_one_minute_rate(), 0.6)
+
+        meter.mark(4)
+        clock.advance(2)
+        self.assertAlmostEqual(meter.get_mean_rate(), 2)
+
+    def test_mean_rate_is_zero_before_time_passes(self):
+        clock = Clock()
+        meter = Meter("test", clock=clock)
+        meter.mark(3)
+        self.assertEqual(meter.get_mean_rate(), 0.0)
+        clock.advance(3)
+        meter.get_snapshot_and_reset()
+        meter.mark()
+        self.assertEqual(meter.get_mean_rate(), 0.0)
+
+    def test_merge_adds_the_counts_and_rates(self):
+        clock = Clock()
+        meter = Meter("test", clock=clock)
+        clock.advance(10)
+        other = Meter("test", clock=clock)
+        meter.mark(3)
+        other.mark(7)
+        clock.advance(5)
+        meter.get_one_minute_rate()
+        other.mark(5)
+        meter.merge(other)
+
+        self.assertEqual(meter.get_count(), 15)
+        self.assertEqual(other.get_count(), 12)
+        self.assertAlmostEqual(meter.get_mean_rate(), 1)
+        # The 3 events were ticked over 15s, and the 12 events of the other
+        # meter, which never ticked, are counted at the next tick.
+        clock.advance(10)
+        self.assertAlmostEqual(meter.get_one_minute_rate(),
+                               0.2 + (1.2 - 0.2) * (1 - exp(-10 / 60)))
@@ -1,9 +1,18 @@
 from __future__ import division, absolute_import
 
+import gc
+import sys
+from threading import Event, Thread
+
 import mock
 from unittest2 import TestCase
 
 from yunomi.compat import xrange
+from yunomi.core.counter import Counter, StripedCounter
+from yunomi.core.histogram import Histogram, StripedHistogram
+from yunomi.stats.exp_decay_sample import ExponentiallyDecayingSample
+from yunomi.stats.hdr_sample import HdrSample
+from yunomi.stats.sliding_time_window_sample import SlidingTimeWindowSample
 from yunomi.core.metrics_registry import (MetricsRegistry, counter, histogram,
                                           meter, timer, count_calls,
                                           meter_calls, hist_calls, time_calls)
@@ -19,6 +28,14 @@ class MetricsRegistryTests(TestCase):
     def test_empty_registry(self):
         self.assertEqual(len(self.registry.dump_metrics()), 0)
 
+    def test_dump_metrics_with_a_frozen_clock(self):
+        registry = MetricsRegistry(clock=lambda: 0.0)
+        registry.meter("meter").mark()
+        registry.timer("timer").update(1)
+        rates = [stat["value"] for stat in registry.dump_metrics()
+                 if stat["name"].endswith("_mean_rate")]
+        self.assertEqual(rates, [0.0, 0.0])
+
     def test_getters_create_metrics(self):
         self.registry.counter("counter")
         self.registry.histogram("histogram")
@@ -42,6 +59,140 @@ class MetricsRegistryTests(TestCase):
             self.assertTrue(stat["name"] in metric_names)
             self.assertEqual(stat["value"], 0)
 
+    def test_gauges(self):
+        sizes = []
+        self.registry.gauge("depth").set(7)
+        callback = self.registry.gauge("pool", callback=lambda: len(sizes),
+                                       ttl=10)
+        self.assertIs(self.registry.gauge("pool"), callback)
+        sizes.append(1)
+        self.assertEqual(self.registry.dump_metrics(), [
+            {"name": "depth_value", "value": 7, "type": "float"},
+            {"name": "pool_value", "value": 1, "type": "float"},
+        ])
+        sizes.append(2)
+        self.assertEqual(callback.get_value(), 1)
+        self.twisted_clock.advance(10)
+        self.assertEqual(callback.get_value(), 2)
+
+    def test_iter_metrics_is_ordered_by_key_then_suffix(self):
+        self.registry.timer("b")
+        self.registry.counter("c")
+        self.registry.meter("a")
+
+        names = [stat["name"] for stat in self.registry.iter_metrics()]
+        self.assertEqual(names[:4], ["a_15m_rate", "a_1m_rate", "a_5m_rate",
+                                     "a_mean_rate"])
+        self.assertEqual(names[4:16], sorted(names[4:16]))
+        self.assertTrue(all(name.startswith("b_") for name in names[4:16]))
+        self.assertEqual(names[16:], ["c_count"])
+        self.assertEqual(sorted(names),
+                         [stat["name"] for stat in self.registry.dump_metrics()])
+
+    def test_iter_metrics_computes_only_the_given_suffixes(self):
+        self.registry.counter("counter").inc(2)
+        histogram = self.registry.histogram("histogram")
+        histogram.update(1)
+
+        with mock.patch.object(Histogram, "get_snapshot") as get_snapshot:
+            stats = list(self.registry.iter_metrics(set(["count", "max"])))
+        self.assertFalse(get_snapshot.called)
+        self.assertEqual(stats, [
+            {"type": "int", "name": "counter_count", "value": 2},
+            {"type": "float", "name": "histogram_max", "value": 1},
+        ])
+
+        stats = list(self.registry.iter_metrics(set(["99_percentile"])))
+        self.assertEqual(stats, [
+            {"type": "float", "name": "histogram_99_percentile", "value": 1},
+        ])
+
+    def test_iter_metrics_is_lazy(self):
+        self.registry.counter("counter")
+        self.registry.timer("timer")
+        stats = self.registry.iter_metrics()
+        self.assertEqual(next(stats)["name"], "counter_count")
+
+    def test_striped_counter(self):
+        striped = self.registry.counter("striped", striped=True)
+        self.assertIsInstance(striped, StripedCounter)
+        self.assertIs(self.registry.counter("striped"), striped)
+        self.assertIsInstance(self.registry.counter("plain"), Counter)
+
+        striped.inc(3)
+        dump = self.registry.dump_metrics()
+        self.assertEqual(dump[1], {"type": "int", "name": "striped_count",
+                                   "value": 3})
+
+    def test_sample_factories(self):
+        histogram = self.registry.histogram("histogram", sample=HdrSample)
+        timer = self.registry.timer("timer", sample=HdrSample)
+        self.assertIsInstance(histogram.sample, HdrSample)
+        self.assertIsInstance(timer.histogram.sample, HdrSample)
+        self.assertIsNot(histogram.sample, timer.histogram.sample)
+
+    def test_striped_histograms(self):
+        histogram = self.registry.histogram("histogram", sample=HdrSample,
+                                            striped=True)
+        timer = self.registry.timer("timer", striped=True)
+        self.assertIsInstance(histogram, StripedHistogram)
+        self.assertIsInstance(timer.histogram, StripedHistogram)
+        self.assertIs(histogram.sample_factory, HdrSample)
+
+        timer.update(5)
+        self.assertIsInstance(timer.histogram.shards()[0].sample,
+                              ExponentiallyDecayingSample)
+        self.assertEqual(timer.get_count(), 1)
+        self.assertEqual(timer.get_max(), 5)
+
+    def test_time_windows(self):
+        histogram = self.registry.histogram("histogram", window=10)
+        timer = self.registry.timer("timer", window=10)
+        for sample in histogram.sample, timer.histogram.sample:
+            self.assertIsInstance(sample, SlidingTimeWindowSample)
+            self.assertEqual(sample.window, 10)
+            self.assertIs(sample.clock, self.registry._clock)
+
+        histogram.update(1)
+        self.twisted_clock.advance(10)
+        self.assertEqual(histogram.get_snapshot().size(), 0)
+
+    def test_concurrent_creation_loses_no_updates(self):
+        threads, keys = 8, 500
+        start = Event()
+        timers = []
+
+        def hammer():
+            seen = []
+            start.wait()
+            for i in xrange(keys):
+                self.registry.counter("counter_%d" % i, striped=True).inc()
+                seen.append(self.registry.timer("timer_%d" % i))
+            timers.append(seen)
+
+        switch_interval = getattr(sys, "getswitchinterval", None)
+        if switch_interval is not None:
+            old_interval = switch_interval()
+            sys.setswitchinterval(1e-6)
+        try:
+            workers = [Thread(target=hammer) for i in xrange(threads)]
+            for worker in workers:
+                worker.start()
+            start.set()
+            for worker in workers:
+                worker.join()
+        finally:
+            if switch_interval is not None:
+                sys.setswitchinterval(old_interval)
+
+        for i in xrange(keys):
+            self.assertEqual(
+                self.registry.counter("counter_%d" % i).get_count(), threads)
+        for seen in timers:
+            for timer, registered in zip(seen, timers[0]):
+                self.assertIs(timer, registered)
+        self.assertEqual(len(self.registry.dump_metrics()), keys * 13)
+
     def test_count_calls_decorator(self):
         @count_calls
         def test():
@@ -51,17 +202,16 @@ class MetricsRegistryTests(TestCase):
             test()
         self.assertEqual(counter("test_calls").get_count(), 10)
 
-    @mock.patch("yunomi.core.meter.time")
-    def test_meter_calls_decorator(self, time_mock):
-        time_mock.return_value = 0
-        @meter_calls
+    def test_meter_calls_decorator(self):
+        @self.registry.meter_calls
         def test():
             pass
 
         for i in xrange(10):
             test()
-        time_mock.return_value = 10
-        self.assertAlmostEqual(meter("test_calls").get_mean_rate(), 1.0)
+        self.twisted_clock.advance(10)
+        self.assertAlmostEqual(
+            self.registry.meter("test_calls").get_mean_rate(), 1.0)
 
 
     def test_hist_calls_decorator(self):
@@ -84,25 +234,33 @@ class MetricsRegistryTests(TestCase):
         self.assertAlmostEqual(snapshot.get_99th_percentile(), 10.0)
         self.assertAlmostEqual(snapshot.get_999th_percentile(), 10.0)
 
-    @mock.patch("yunomi.core.metrics_registry.time")
-    def test_time_calls_decorator(self, time_mock):
-        time_mock.return_value = 0.0
-        @time_calls
+    def test_time_calls_decorator(self):
+        @self.registry.time_calls
         def test():
-            time_mock.return_value += 1.0
+            self.twisted_clock.advance(1.0)
 
         for i in xrange(10):
             test()
-        _timer = timer("test_calls")
+        _timer = self.registry.timer("test_calls")
         snapshot = _timer.get_snapshot()
         self.assertEqual(_timer.get_count(), 10)
-        self.assertEqual(_timer.get_max(), 1)
-        self.assertEqual(_timer.get_min(), 1)
+        self.assertEqual(_timer.get_max(), 1000000000)
+        self.assertEqual(_timer.get_min(), 1000000000)
         self.assertAlmostEqual(_timer.get_std_dev(), 0)
-        self.assertAlmostEqual(snapshot.get_75th_percentile(), 1.0)
-        self.assertAlmostEqual(snapshot.get_98th_percentile(), 1.0)
-        self.assertAlmostEqual(snapshot.get_99th_percentile(), 1.0)
-        self.assertAlmostEqual(snapshot.get_999th_percentile(), 1.0)
+        self.assertAlmostEqual(snapshot.get_75th_percentile(), 1000000000)
+        self.assertAlmostEqual(snapshot.get_98th_percentile(), 1000000000)
+        self.assertAlmostEqual(snapshot.get_99th_percentile(), 1000000000)
+        self.assertAlmostEqual(snapshot.get_999th_percentile(), 1000000000)
+
+    def test_registry_passes_the_clock_down(self):
+        self.twisted_clock.advance(7200)
+        clocks = [self.registry.meter("meter").clock,
+                  self.registry.meter("meter")._m1_rate.clock,
+                  self.registry.timer("timer").clock,
+                  self.registry.timer("timer").histogram.sample.clock,
+                  self.registry.histogram("biased", biased=True).sample.clock]
+        for clock in clocks:
+            self.assertEqual(clock.nanoseconds(), 7200000000000)
 
     def test_count_calls_decorator_returns_original_return_value(self):
         @count_calls
@@ -175,3 +333,196 @@ class MetricsRegistryTests(TestCase):
         def test():
             raise Exception('what')
         self.assertRaises(Exception, test)
+
+    def test_decorators_pass_keyword_arguments(self):
+        for decorator in (count_calls, meter_calls, hist_calls, time_calls):
+            @decorator
+            def add(a, b=1):
+                return a + b
+            self.assertEqual(add(1, b=2), 3)
+
+    def test_decorators_with_a_name_on_a_registry(self):
+        @self.registry.count_calls(name="counted")
+        @self.registry.meter_calls(name="metered")
+        @self.registry.hist_calls(name="histogrammed")
+        @self.registry.time_calls(name="timed")
+        def test():
+            return 3
+
+        for i in xrange(4):
+            test()
+        self.assertEqual(self.registry.counter("counted").get_count(), 4)
+        self.assertEqual(self.registry.meter("metered").get_count(), 4)
+        self.assertEqual(self.registry.histogram("histogrammed").get_sum(), 12)
+        self.assertEqual(self.registry.timer("timed").get_count(), 4)
+        self.assertEqual(test.__name__, "test")
+
+    def test_decorators_look_up_their_metric_once(self):
+        @self.registry.count_calls
+        def test():
+            pass
+
+        with mock.patch.object(self.registry, "counter") as counter_mock:
+            test()
+            test()
+        self.assertFalse(counter_mock.called)
+        self.assertEqual(self.registry.counter("test_calls").get_count(), 2)
+
+
+class CardinalityTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.registry = MetricsRegistry(
+            clock=self.clock, max_metrics={"timer": 3, "counter": 2},
+            idle_timeout=60)
+
+    def keys(self):
+        return [(key, kind, labels)
+                for key, kind, _, labels in self.registry.metrics()]
+
+    def dropped(self, kind, reason):
+        return self.registry.counter("yunomi_dropped_metrics", labels=(
+            ("kind", kind), ("reason", reason))).get_count()
+
+    def test_metrics_over_the_limit_overflow(self):
+        timers = [self.registry.timer("user.%d" % i) for i in xrange(5)]
+        overflow = self.registry.timer("yunomi_overflow_timer")
+        self.assertEqual(len(set(timers)), 4)
+        self.assertIs(timers[3], overflow)
+        self.assertIs(timers[4], overflow)
+        self.assertIs(self.registry.timer("user.1"), timers[1])
+        self.assertEqual(self.dropped("timer", "overflow"), 2)
+
+        for i in xrange(5):
+            self.registry.meter("meter.%d" % i)
+        self.assertEqual(len(self.registry._meters), 5)
+
+    def test_family_children_overflow_uncached(self):
+        family = self.registry.family("timer", "http", ("user",))
+        for i in xrange(5):
+            family.labels(i).update(1)
+        self.assertEqual(sorted(family._children), [(0,), (1,), (2,)])
+        self.assertEqual(
+            self.registry.timer("yunomi_overflow_timer").get_count(), 2)
+
+        self.registry.timer("full", labels=(("user", "a"),))
+        self.assertNotIn("full", self.registry._families["timer"])
+
+    def test_the_dropped_counters_are_not_limited(self):
+        for i in xrange(3):
+            self.registry.counter("c.%d" % i)
+        self.assertEqual(self.dropped("counter", "overflow"), 1)
+
+    def test_evicts_the_metrics_which_stopped_counting(self):
+        active = self.registry.timer("active")
+        self.registry.timer("idle").update(1)
+        self.registry.meter("requests", labels=(("status", 500),)).mark()
+        self.assertEqual(self.registry.evict_idle(), 0)
+
+        self.clock.advance(30)
+        active.update(1)
+        self.assertEqual(self.registry.evict_idle(), 0)
+        self.clock.advance(30)
+        self.assertEqual(self.registry.evict_idle(), 2)
+        self.assertEqual(self.keys(), [
+            ("active", "timer", ()),
+            ("yunomi_dropped_metrics", "counter",
+             (("kind", "meter"), ("reason", "idle"))),
+            ("yunomi_dropped_metrics", "counter",
+             (("kind", "timer"), ("reason", "idle"))),
+        ])
+        self.assertEqual(self.dropped("timer", "idle"), 1)
+        self.assertNotIn("requests", self.registry._families["meter"])
+
+        self.clock.advance(30)
+        self.assertEqual(self.registry.evict_idle(), 1)
+        self.assertIs(self.registry.timer("active"), active)
+        gc.collect()
+        self.assertEqual(list(self.registry._evicted), [])
+
+    def test_eviction_frees_room_under_the_limit(self):
+        for i in xrange(3):
+            self.registry.timer("t.%d" % i)
+        self.registry.evict_idle()
+        self.clock.advance(60)
+        self.registry.evict_idle()
+        self.assertIsNot(self.registry.timer("new"),
+                         self.registry.timer("yunomi_overflow_timer"))
+
+    def test_evicted_children_leave_their_family(self):
+        family = self.registry.family("counter", "jobs", ("queue",))
+        child = family.labels("a")
+        family.labels("b")
+        self.registry.evict_idle()
+        family.labels("b").inc()
+        self.clock.advance(60)
+        self.assertEqual(self.registry.evict_idle(), 1)
+        self.assertEqual(list(family._children), [("b",)])
+
+        self.assertIs(family.labels("a"), child)
+        self.assertIs(self.registry.counter("jobs", labels={"queue": "a"}),
+                      child)
+        self.assertNotIn("yunomi_overflow_counter", self.registry._counters)
+
+    def test_held_metrics_come_back_when_updated(self):
+        @self.registry.count_calls
+        def f():
+            pass
+        child = self.registry.family("timer", "http", ("status",)).labels(200)
+        self.registry.evict_idle()
+        self.clock.advance(60)
+        self.assertEqual(self.registry.evict_idle(), 2)
+
+        f()
+        f()
+        child.update(5)
+        self.assertEqual(self.registry.evict_idle(), 0)
+        self.assertIn({"name": "f_calls_count", "value": 2, "type": "int"},
+                      self.registry.dump_metrics())
+        self.assertIs(self.registry.timer("http", labels={"status": 200}),
+                      child)
+        self.assertEqual(child.get_count(), 1)
+
+    def test_updates_which_leave_the_count_are_activity(self):
+        in_flight = self.registry.counter("in_flight")
+        interval = self.registry.counter("interval")
+        striped = self.registry.counter("striped", striped=True)
+        self.registry.evict_idle()
+        for _ in xrange(3):
+            self.clock.advance(30)
+            in_flight.inc()
+            in_flight.dec()
+            striped.inc()
+            striped.dec()
+            interval.inc()
+            interval.get_snapshot_and_reset()
+            self.assertEqual(self.registry.evict_idle(), 0)
+
+    def test_gauges_are_idle_when_they_are_not_set(self):
+        self.registry.gauge("depth").set(1)
+        self.registry.gauge("size")
+        self.registry.gauge("pool", callback=lambda: 1)
+        self.registry.evict_idle()
+        for _ in xrange(2):
+            self.clock.advance(30)
+            self.registry.gauge("size").set(10)
+            self.registry.evict_idle()
+        self.assertEqual([key for key, _, _ in self.keys()[:2]],
+                         ["pool", "size"])
+
+    def test_metrics_leaves_out_those_evicted_meanwhile(self):
+        self.registry.counter("kept")
+        self.registry.counter("gone")
+        # As if evicted between copying the index and reading the metric.
+        del self.registry._counters["gone"]
+        self.assertEqual([key for key, _, _, _ in self.registry.metrics()],
+                         ["kept"])
+
+    def test_no_eviction_without_an_idle_timeout(self):
+        registry = MetricsRegistry(clock=self.clock)
+        registry.counter("c")
+        registry.evict_idle()
+        self.clock.advance(1e6)
+        self.assertEqual(registry.evict_idle(), 0)
+        self.assertEqual(len(registry.metrics()), 1)
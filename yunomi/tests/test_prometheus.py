@@ -0,0 +1,270 @@
+from __future__ import division, absolute_import
+
+from threading import Event
+
+try:
+    from urllib.request import Request, urlopen
+    from urllib.error import HTTPError
+except ImportError:
+    from urllib2 import Request, urlopen, HTTPError
+
+from unittest2 import TestCase
+
+from yunomi.core.metrics_registry import MetricsRegistry
+from yunomi.core.prometheus import (PrometheusExporter, metric_name,
+                                    start_http_server, TEXT_CONTENT_TYPE,
+                                    OPENMETRICS_CONTENT_TYPE)
+from yunomi.tests.util import Clock
+
+
+class PrometheusExporterTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.registry = MetricsRegistry(clock=self.clock)
+        self.exporter = PrometheusExporter(self.registry)
+
+    def lines(self, openmetrics=False):
+        return self.exporter.render(openmetrics).decode("utf-8").splitlines()
+
+    def test_empty_registry(self):
+        self.assertEqual(self.exporter.render(), b"")
+        self.assertEqual(self.exporter.render(True), b"# EOF\n")
+
+    def test_metric_names(self):
+        self.assertEqual(metric_name("http.requests-2xx"),
+                         "http_requests_2xx")
+        self.assertEqual(metric_name("2xx"), "_2xx")
+        self.assertEqual(metric_name("requests", "app:"), "app:requests")
+
+    def test_counters_are_gauges(self):
+        self.registry.counter("jobs.pending").inc(3)
+        self.registry.counter("jobs.pending").dec()
+        self.assertEqual(self.lines(),
+                         ["# TYPE jobs_pending gauge", "jobs_pending 2"])
+
+    def test_gauges(self):
+        self.registry.gauge("depth").set(3)
+        self.registry.gauge("load", callback=lambda: 0.5,
+                            labels={"host": "a"})
+        self.assertEqual(self.lines(), [
+            "# TYPE depth gauge",
+            "depth 3",
+            "# TYPE load gauge",
+            'load{host="a"} 0.5',
+        ])
+
+    def test_meters(self):
+        meter = self.registry.meter("requests")
+        meter.mark(10)
+        self.clock.advance(5)
+        self.assertEqual(self.lines(), [
+            "# TYPE requests_total counter",
+            "requests_total 10",
+            "# TYPE requests_rate gauge",
+            'requests_rate{window="1m"} 2.0',
+            'requests_rate{window="5m"} 2.0',
+            'requests_rate{window="15m"} 2.0',
+        ])
+        self.assertEqual(self.lines(True)[:2],
+                         ["# TYPE requests counter", "requests_total 10"])
+
+    def test_histograms_are_summaries(self):
+        self.registry.histogram("size").update_many(range(1, 101))
+        lines = self.lines()
+        self.assertEqual(lines[0], "# TYPE size summary")
+        self.assertEqual(lines[1], 'size{quantile="0.5"} 50.5')
+        self.assertEqual(lines[5], 'size{quantile="0.99"} 99.99')
+        self.assertEqual(lines[-2:], ["size_sum 5050.0", "size_count 100"])
+
+    def test_timers_are_summaries_in_seconds(self):
+        timer = self.registry.timer("db")
+        timer.update(1500000000)
+        timer.update(500000000)
+        lines = self.lines()
+        self.assertEqual(lines[0], "# TYPE db_seconds summary")
+        self.assertEqual(lines[-2:], ["db_seconds_sum 2.0",
+                                      "db_seconds_count 2"])
+
+    def test_special_values(self):
+        histogram = self.registry.histogram("h")
+        histogram.update(float("inf"))
+        self.assertIn('h{quantile="0.5"} +Inf', self.lines())
+
+    def test_ordered_by_key_and_ends_with_eof(self):
+        self.registry.counter("b")
+        self.registry.counter("a")
+        lines = self.lines(True)
+        self.assertEqual(lines, ["# TYPE a gauge", "a 0",
+                                 "# TYPE b gauge", "b 0", "# EOF"])
+
+    def test_renders_new_values_with_cached_names(self):
+        counter = self.registry.counter("c")
+        self.assertEqual(self.lines()[-1], "c 0")
+        counter.inc()
+        self.assertEqual(self.lines()[-1], "c 1")
+        self.assertEqual(len(self.exporter._families[False]), 1)
+
+    def test_prefix(self):
+        self.registry.counter("c")
+        exporter = PrometheusExporter(self.registry, prefix="app_")
+        self.assertEqual(exporter.render(), b"# TYPE app_c gauge\napp_c 0\n")
+
+    def test_children_of_a_family_share_its_metadata(self):
+        self.registry.counter("jobs", labels=(("queue", "b"),)).inc(2)
+        self.registry.counter("jobs", labels=(("queue", 'a"\n'),)).inc()
+        self.registry.counter("jobs").inc(5)
+        self.assertEqual(self.lines(), [
+            "# TYPE jobs gauge",
+            "jobs 5",
+            'jobs{queue="a\\"\\n"} 1',
+            'jobs{queue="b"} 2',
+        ])
+
+    def test_meter_families_keep_their_totals_and_rates_together(self):
+        self.registry.meter("requests", labels=(("status", 200),)).mark(10)
+        self.registry.meter("requests", labels=(("status", 500),)).mark(5)
+        self.clock.advance(5)
+        self.assertEqual(self.lines(), [
+            "# TYPE requests_total counter",
+            'requests_total{status="200"} 10',
+            'requests_total{status="500"} 5',
+            "# TYPE requests_rate gauge",
+            'requests_rate{status="200",window="1m"} 2.0',
+            'requests_rate{status="200",window="5m"} 2.0',
+            'requests_rate{status="200",window="15m"} 2.0',
+            'requests_rate{status="500",window="1m"} 1.0',
+            'requests_rate{status="500",window="5m"} 1.0',
+            'requests_rate{status="500",window="15m"} 1.0',
+        ])
+
+    def test_labeled_summaries(self):
+        self.registry.timer("http", labels=(
+            ("endpoint", "/"), ("status", 200))).update(1000000000)
+        lines = self.lines()
+        self.assertEqual(lines[0], "# TYPE http_seconds summary")
+        self.assertEqual(lines[1],
+                         'http_seconds{endpoint="/",status="200",'
+                         'quantile="0.5"} 1.0')
+        self.assertEqual(lines[-1],
+                         'http_seconds_count{endpoint="/",status="200"} 1')
+
+    def test_skips_and_counts_the_metrics_whose_names_collide(self):
+        self.registry.counter("a.b").inc()
+        self.registry.counter("a_b").inc(2)
+        self.registry.meter("x").mark()
+        self.registry.counter("x_total").inc(3)
+        expected = [
+            "# TYPE a_b gauge",
+            "a_b 1",
+            "# TYPE x_total counter",
+            "x_total 1",
+        ]
+        self.assertEqual(self.lines()[:4], expected)
+        self.assertEqual(self.lines()[:4], expected)
+        self.assertEqual(self.lines()[-2:], [
+            "# TYPE yunomi_dropped_metrics gauge",
+            'yunomi_dropped_metrics{kind="counter",reason="collision"} 2',
+        ])
+
+    def test_skips_and_counts_gauges_which_are_not_numbers(self):
+        values = {"a": None, "b": 2}
+        for pool in "a", "b":
+            self.registry.gauge("pool.%s" % pool,
+                                callback=lambda pool=pool: values[pool])
+        self.registry.gauge("pool.name", callback=lambda: "main")
+        self.assertEqual(self.lines(), ["# TYPE pool_b gauge", "pool_b 2"])
+        values["a"] = 1
+        self.assertEqual(self.lines(), [
+            "# TYPE pool_a gauge",
+            "pool_a 1",
+            "# TYPE pool_b gauge",
+            "pool_b 2",
+            "# TYPE yunomi_dropped_metrics gauge",
+            'yunomi_dropped_metrics{kind="gauge",reason="error"} 2',
+        ])
+        self.assertEqual(self.registry.counter("yunomi_dropped_metrics",
+            labels=(("kind", "gauge"), ("reason", "error"))).get_count(), 3)
+
+    def test_evicts_idle_metrics_and_forgets_their_lines(self):
+        registry = MetricsRegistry(self.clock, idle_timeout=60)
+        exporter = PrometheusExporter(registry)
+        registry.counter("jobs", labels=(("queue", "a"),)).inc()
+        exporter.render()
+        exporter._evicting.join()
+        self.clock.advance(60)
+        exporter.render()
+        exporter._evicting.join()
+        self.assertEqual(exporter.render().decode("utf-8").splitlines(), [
+            "# TYPE yunomi_dropped_metrics gauge",
+            'yunomi_dropped_metrics{kind="counter",reason="idle"} 1',
+        ])
+        self.assertEqual(list(exporter._families[False]), [
+            ("yunomi_dropped_metrics", "counter",
+             (("kind", "counter"), ("reason", "idle")))])
+
+    def test_evicts_once_an_interval_without_holding_up_scrapes(self):
+        evicting, evicted = Event(), Event()
+        calls = []
+
+        def evict_idle():
+            calls.append(self.clock.seconds())
+            evicting.wait()
+            evicted.set()
+        self.registry.evict_idle = evict_idle
+        exporter = PrometheusExporter(self.registry, evict_interval=30)
+        exporter.render()
+        self.clock.advance(30)
+        exporter.render()
+        self.assertFalse(evicted.is_set())
+        evicting.set()
+        exporter._evicting.join()
+
+        exporter.render()
+        self.clock.advance(29)
+        exporter.render()
+        exporter._evicting.join()
+        self.assertEqual(calls, [0, 30])
+
+    def test_never_evicts_without_an_interval(self):
+        registry = MetricsRegistry(self.clock, idle_timeout=60)
+        exporter = PrometheusExporter(registry, evict_interval=None)
+        registry.counter("c")
+        for _ in range(3):
+            exporter.render()
+            self.clock.advance(60)
+        self.assertIsNone(exporter._evicting)
+        self.assertEqual(len(registry.metrics()), 1)
+
+
+class HTTPServerTests(TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.registry.counter("requests").inc(7)
+        self.server = start_http_server(PrometheusExporter(self.registry))
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_serves_the_text_format(self):
+        response = urlopen(self.url + "/metrics")
+        self.assertEqual(response.getcode(), 200)
+        self.assertEqual(response.info()["Content-Type"], TEXT_CONTENT_TYPE)
+        self.assertEqual(response.read(),
+                         b"# TYPE requests gauge\nrequests 7\n")
+
+    def test_serves_openmetrics_when_accepted(self):
+        request = Request(self.url + "/metrics", headers={
+            "Accept": "application/openmetrics-text; version=1.0.0"})
+        response = urlopen(request)
+        self.assertEqual(response.info()["Content-Type"],
+                         OPENMETRICS_CONTENT_TYPE)
+        self.assertTrue(response.read().endswith(b"# EOF\n"))
+
+    def test_other_paths_are_not_found(self):
+        with self.assertRaises(HTTPError) as context:
+            urlopen(self.url + "/")
+        self.assertEqual(context.exception.code, 404)
@@ -0,0 +1,197 @@
+from __future__ import division, absolute_import
+
+from unittest2 import TestCase
+
+from yunomi.compat import xrange
+from yunomi.core.columnar_meter import ColumnarMeterStore
+from yunomi.core.gauge import Gauge
+from yunomi.core.histogram import Histogram
+from yunomi.core.metrics_registry import MetricsRegistry
+from yunomi.core.meter import Meter
+from yunomi.core.serialization import deserialize, serialize
+from yunomi.core.timer import Timer
+from yunomi.stats.ddsketch import DDSketch
+from yunomi.stats.exp_decay_sample import ExponentiallyDecayingSample
+from yunomi.stats.hdr_sample import HdrSample
+from yunomi.stats.sliding_time_window_sample import SlidingTimeWindowSample
+from yunomi.stats.sliding_window_sample import SlidingWindowSample
+from yunomi.stats.uniform_sample import UniformSample
+from yunomi.tests.util import Clock
+
+
+class SerializationTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.advance(1000)
+        self.registry = MetricsRegistry(clock=self.clock)
+        # The receiving host's clock is elsewhere entirely.
+        self.other_clock = Clock()
+        self.other_clock.advance(5)
+
+    def round_trip(self):
+        return MetricsRegistry.deserialize(self.registry.serialize(),
+                                           self.other_clock)
+
+    def assertSameMetrics(self, registry):
+        self.assertEqual(registry.dump_metrics(),
+                         self.registry.dump_metrics())
+
+    def test_empty_registry(self):
+        self.assertEqual(self.round_trip().dump_metrics(), [])
+
+    def test_counters(self):
+        self.registry.counter("up").inc(300)
+        self.registry.counter("down").dec(7)
+        self.registry.counter("striped", striped=True).inc(2)
+        self.assertSameMetrics(self.round_trip())
+
+    def test_gauges(self):
+        self.registry.gauge("depth").set(-3)
+        self.registry.gauge("load", callback=lambda: 0.25)
+        registry = self.round_trip()
+        self.assertSameMetrics(registry)
+        self.assertIsInstance(registry.gauge("load"), Gauge)
+
+    def test_skips_and_counts_gauges_which_are_not_numbers(self):
+        self.registry.gauge("none", callback=lambda: None)
+        self.registry.gauge("name", labels=(("pool", "a"),),
+                            callback=lambda: "a")
+        self.registry.gauge("load", callback=lambda: 0.25)
+        registry = self.round_trip()
+        self.assertEqual([(key, kind) for key, kind, _, _
+                          in registry.metrics()], [("load", "gauge")])
+        self.assertEqual(self.registry.counter("yunomi_dropped_metrics",
+            labels=(("kind", "gauge"), ("reason", "error"))).get_count(), 2)
+
+    def test_meters_keep_their_rates_and_age(self):
+        meter = self.registry.meter("requests")
+        meter.mark(10)
+        self.clock.advance(5)
+        meter.get_one_minute_rate()
+        meter.mark(3)
+        self.clock.advance(1)
+
+        registry = self.round_trip()
+        decoded = registry.meter("requests")
+        self.assertIsInstance(decoded, Meter)
+        self.assertIs(decoded.clock, registry._clock)
+        self.assertEqual(decoded.start_time,
+                         self.other_clock.nanoseconds() - 6000000000)
+        self.assertSameMetrics(self.round_trip())
+
+        self.clock.advance(4)
+        self.other_clock.advance(4)
+        self.assertAlmostEqual(decoded.get_one_minute_rate(),
+                               meter.get_one_minute_rate())
+        self.assertAlmostEqual(decoded.get_mean_rate(), meter.get_mean_rate())
+
+    def test_columnar_meters(self):
+        registry = MetricsRegistry(clock=self.clock,
+                                   meter_store=ColumnarMeterStore(self.clock))
+        registry.meter("requests").mark(10)
+        registry.timer("db").update(5)
+        self.clock.advance(5)
+        decoded = MetricsRegistry.deserialize(registry.serialize(),
+                                              self.clock)
+        self.assertIsInstance(decoded.meter("requests"), Meter)
+        self.assertEqual(decoded.dump_metrics(), registry.dump_metrics())
+
+    def test_samples(self):
+        samples = [
+            UniformSample(100),
+            SlidingWindowSample(100),
+            ExponentiallyDecayingSample(100, 0.015, self.clock),
+            HdrSample(),
+            DDSketch(),
+        ]
+        for i, sample in enumerate(samples):
+            histogram = self.registry.histogram("h%d" % i,
+                                                sample=lambda: sample)
+            histogram.update_many(xrange(-50, 1000))
+            histogram.update(0)
+
+        decoded = self.round_trip()
+        for i, sample in enumerate(samples):
+            histogram = decoded.histogram("h%d" % i)
+            self.assertIs(type(histogram.sample), type(sample))
+            self.assertEqual(histogram.get_count(), 1051)
+            self.assertEqual(histogram.sample.count, sample.count)
+            self.assertEqual(histogram.get_snapshot().get_values(),
+                             sample.get_snapshot().get_values())
+        self.assertSameMetrics(decoded)
+
+    def test_sliding_window_keeps_its_order(self):
+        histogram = self.registry.histogram(
+            "h", sample=lambda: SlidingWindowSample(10))
+        histogram.update_many(xrange(25))
+        decoded = self.round_trip().histogram("h")
+        decoded.update(100)
+        histogram.update(100)
+        self.assertEqual(decoded.get_snapshot().get_values(),
+                         list(xrange(16, 25)) + [100])
+
+    def test_time_windows_keep_the_age_of_their_values(self):
+        histogram = self.registry.histogram("h", window=10)
+        for i in xrange(40):
+            histogram.update(i)
+            self.clock.advance(0.5)
+
+        decoded = self.round_trip().histogram("h")
+        self.assertIsInstance(decoded.sample, SlidingTimeWindowSample)
+        self.assertEqual(decoded.get_snapshot().get_values(),
+                         list(xrange(21, 40)))
+        self.other_clock.advance(5)
+        self.assertEqual(decoded.get_snapshot().get_values(),
+                         list(xrange(31, 40)))
+        decoded.update(1000)
+        self.assertEqual(decoded.sample.size(), 10)
+
+    def test_timers(self):
+        timer = self.registry.timer("db", sample=HdrSample)
+        timer.update_many([1000, 2000, 3000])
+        timer = self.registry.timer("cache")
+        timer.update_many([5, 7])
+        self.clock.advance(5)
+
+        decoded = self.round_trip()
+        self.assertIsInstance(decoded.timer("db"), Timer)
+        self.assertIsInstance(decoded.timer("db").histogram.sample, HdrSample)
+        self.assertEqual(decoded.timer("db").get_event_type(), "calls")
+        self.assertSameMetrics(decoded)
+
+    def test_striped_histograms_are_merged(self):
+        histogram = self.registry.histogram("h", striped=True)
+        histogram.update_many(xrange(100))
+        decoded = self.round_trip().histogram("h")
+        self.assertIsInstance(decoded, Histogram)
+        self.assertEqual(decoded.get_count(), 100)
+        self.assertAlmostEqual(decoded.get_std_dev(), histogram.get_std_dev())
+        self.assertEqual(decoded.get_snapshot().get_values(),
+                         list(xrange(100)))
+
+    def test_names_are_in_a_table(self):
+        for i in xrange(10):
+            self.registry.timer("timer.%d" % i)
+        data = self.registry.serialize()
+        self.assertEqual(data.count(b"calls"), 1)
+        self.assertEqual(data.count(b"timer.3"), 1)
+
+    def test_decodes_memoryviews_and_bytearrays(self):
+        self.registry.histogram("h").update_many(xrange(10))
+        data = self.registry.serialize()
+        for buffer in memoryview(data), bytearray(data):
+            metrics = list(deserialize(buffer, self.clock))
+            self.assertEqual(metrics[0][:2], ("h", "histogram"))
+            self.assertEqual(metrics[0][2].get_sum(), 45)
+
+    def test_unicode_names(self):
+        self.registry.counter(u"caf\xe9").inc()
+        self.assertEqual(self.round_trip().counter(u"caf\xe9").get_count(), 1)
+
+    def test_rejects_other_data(self):
+        self.assertRaises(ValueError, MetricsRegistry.deserialize,
+                          b"not a registry")
+        data = bytearray(serialize([]))
+        data[4] = 99
+        self.assertRaises(ValueError, MetricsRegistry.deserialize, data)
@@ -0,0 +1,180 @@
+from __future__ import division, absolute_import
+
+import os
+import shutil
+import tempfile
+
+from unittest2 import TestCase, skipUnless
+
+from yunomi.compat import xrange
+from yunomi.core.prometheus import PrometheusExporter
+from yunomi.core.shared import (SharedCounter, SharedMemoryStore,
+                                SharedMeter, SharedMetricsCollector,
+                                SharedMetricsRegistry)
+from yunomi.tests.util import Clock
+
+
+class SharedMetricsTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "metrics")
+        self.clock = Clock()
+        self.store = SharedMemoryStore.create(self.path, 3, 16, self.clock)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_workers_claim_their_own_slots(self):
+        workers = [SharedMetricsRegistry(self.store) for i in xrange(3)]
+        self.assertEqual([worker.worker for worker in workers], [0, 1, 2])
+        self.assertRaises(ValueError, SharedMetricsRegistry, self.store)
+
+    def test_collector_sums_the_workers(self):
+        first = SharedMetricsRegistry(self.store, self.clock)
+        second = SharedMetricsRegistry(self.store, self.clock)
+        first.counter("requests").inc(3)
+        second.counter("requests").inc(4)
+        second.counter("errors").dec()
+        first.meter("hits").mark(2)
+        second.meter("hits").mark(8)
+
+        self.assertEqual(first.counter("requests").get_count(), 3)
+        collector = SharedMetricsCollector(
+            SharedMemoryStore(self.path, self.clock), self.clock)
+        self.assertEqual(collector.counter("requests").get_count(), 7)
+        self.assertEqual(collector.counter("errors").get_count(), -1)
+        self.assertEqual(collector.meter("hits").get_count(), 10)
+        self.clock.advance(5)
+        self.assertAlmostEqual(collector.meter("hits").get_mean_rate(), 2.0)
+        collector.store.close()
+
+    def test_metrics_created_again_keep_their_counts(self):
+        worker = SharedMetricsRegistry(self.store, self.clock)
+        worker.counter("requests").inc(3)
+        worker.meter("hits").mark(4)
+        self.clock.advance(2)
+
+        counter = SharedCounter(self.store, worker._cell("counter",
+                                                         "requests"))
+        meter = SharedMeter(self.store, worker._cell("meter", "hits"),
+                            clock=self.clock)
+        self.assertEqual(counter.get_count(), 3)
+        self.assertEqual(meter.get_count(), 4)
+        self.assertAlmostEqual(meter.get_mean_rate(), 2.0)
+        self.assertEqual(worker.counter("requests").get_count(), 3)
+
+    def test_summed_counters_count_into_the_exited_row(self):
+        worker = SharedMetricsRegistry(self.store, self.clock)
+        collector = SharedMetricsCollector(self.store, self.clock)
+        requests = collector.counter("requests")
+        worker.counter("requests").inc(3)
+
+        requests.inc(2)
+        requests.dec()
+        requests.merge(worker.counter("requests"))
+        self.assertEqual(requests.get_count(), 7)
+        self.assertEqual(requests.get_snapshot_and_reset(), 7)
+        self.assertEqual(requests.get_count(), 0)
+        worker.counter("requests").inc(4)
+        self.assertEqual(requests.get_count(), 4)
+        requests.clear()
+        self.assertEqual(requests.get_count(), 0)
+        self.assertEqual(worker.counter("requests").get_count(), 7)
+
+    def test_labels_overflow_eviction_and_collisions(self):
+        worker = SharedMetricsRegistry(self.store, self.clock,
+                                       max_metrics={"meter": 1},
+                                       idle_timeout=60)
+        worker.counter("jobs", labels=(("queue", "a"),)).inc(2)
+        worker.counter("a.b").inc()
+        worker.counter("a_b").inc(2)
+        worker.meter("hits", labels={"status": 200}).mark(3)
+        worker.meter("misses").mark()
+        worker.evict_idle()
+        self.clock.advance(60)
+        worker.counter("a.b").inc()
+        self.assertEqual(worker.evict_idle(), 4)
+        self.assertEqual(worker.counter("a_b").get_count(), 2)
+
+        collector = SharedMetricsCollector(
+            SharedMemoryStore(self.path, self.clock), self.clock)
+        exporter = PrometheusExporter(collector)
+        exporter.render()
+        lines = exporter.render().decode("utf-8").splitlines()
+        self.assertEqual(lines[:4], [
+            "# TYPE a_b gauge",
+            "a_b 2",
+            "# TYPE hits_total counter",
+            'hits_total{status="200"} 3',
+        ])
+        self.assertIn('jobs{queue="a"} 2', lines)
+        self.assertIn("yunomi_overflow_meter_total 1", lines)
+        dropped = [line for line in lines
+                   if line.startswith("yunomi_dropped_metrics{")]
+        self.assertEqual(dropped, [
+            'yunomi_dropped_metrics{kind="counter",reason="collision"} 1',
+            'yunomi_dropped_metrics{kind="counter",reason="idle"} 2',
+            'yunomi_dropped_metrics{kind="meter",reason="idle"} 2',
+            'yunomi_dropped_metrics{kind="meter",reason="overflow"} 1',
+        ])
+        collector.store.close()
+
+    def test_collector_rates_follow_the_counts(self):
+        worker = SharedMetricsRegistry(self.store, self.clock)
+        collector = SharedMetricsCollector(self.store, self.clock)
+        hits = collector.meter("hits")
+        self.assertEqual(hits.get_one_minute_rate(), 0.0)
+
+        worker.meter("hits").mark(15)
+        self.clock.advance(5)
+        self.assertAlmostEqual(hits.get_one_minute_rate(), 3.0)
+
+    def test_dump_metrics_finds_metrics_named_by_workers(self):
+        worker = SharedMetricsRegistry(self.store)
+        collector = SharedMetricsCollector(self.store)
+        self.assertEqual(collector.dump_metrics(), [])
+
+        worker.counter("requests").inc(2)
+        worker.meter("hits").mark()
+        metrics = collector.dump_metrics()
+        self.assertEqual(len(metrics), 5)
+        self.assertIn({"type": "int", "name": "requests_count", "value": 2},
+                      metrics)
+
+    def test_names_are_checked(self):
+        worker = SharedMetricsRegistry(self.store)
+        self.assertRaises(ValueError, worker.counter, "x" * 127)
+        for i in xrange(16):
+            worker.counter("counter%d" % i)
+        self.assertRaises(ValueError, worker.meter, "one too many")
+
+    def test_opening_another_file_fails(self):
+        other = os.path.join(self.directory, "other")
+        with open(other, "wb") as f:
+            f.write(b"\0" * 64)
+        self.assertRaises(ValueError, SharedMemoryStore, other)
+
+    @skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_forked_workers(self):
+        for i in xrange(2):
+            pid = os.fork()
+            if not pid:
+                try:
+                    registry = SharedMetricsRegistry(
+                        SharedMemoryStore(self.path))
+                    registry.counter("requests").inc(5)
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+
+        collector = SharedMetricsCollector(self.store)
+        self.assertEqual(collector.counter("requests").get_count(), 10)
+
+        # The slots of the exited workers are free again, and their counts
+        # are kept.
+        replacement = SharedMetricsRegistry(self.store)
+        self.assertEqual(replacement.worker, 0)
+        replacement.counter("requests").inc()
+        self.assertEqual(collector.counter("requests").get_count(), 11)
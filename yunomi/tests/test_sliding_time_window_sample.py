@@ -0,0 +1,111 @@
+from __future__ import division, absolute_import
+
+from unittest2 import TestCase, skipIf
+
+from yunomi.compat import xrange, numpy
+from yunomi.core.histogram import Histogram
+from yunomi.stats.sliding_time_window_sample import SlidingTimeWindowSample
+from yunomi.tests.util import Clock
+
+
+class SlidingTimeWindowSampleTests(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.sample = SlidingTimeWindowSample(10, self.clock)
+
+    def test_keeps_the_values_of_the_window(self):
+        for i in xrange(20):
+            self.sample.update(i)
+            self.clock.advance(1)
+        self.assertEqual(self.sample.count, 20)
+        self.assertEqual(self.sample.size(), 9)
+        self.assertEqual(self.sample.get_snapshot().get_values(),
+                         list(xrange(11, 20)))
+
+    def test_everything_is_evicted_after_the_window(self):
+        self.sample.update_many(xrange(100))
+        self.clock.advance(9.5)
+        self.assertEqual(self.sample.size(), 100)
+        self.clock.advance(0.5)
+        self.assertEqual(self.sample.size(), 0)
+        self.assertEqual(self.sample.get_snapshot().size(), 0)
+
+    def test_grows_and_shrinks(self):
+        self.sample.update_many(xrange(1000))
+        capacity = len(self.sample.values)
+        self.assertTrue(capacity >= 1000)
+        self.clock.advance(10)
+        self.sample.update(1)
+        self.assertTrue(len(self.sample.values) < capacity)
+        self.assertEqual(self.sample.get_snapshot().get_values(), [1])
+
+    def test_wraps_around(self):
+        capacity = SlidingTimeWindowSample.MIN_CAPACITY
+        expected = []
+        for i in xrange(5 * capacity):
+            self.sample.update(i)
+            expected.append(i)
+            if i % 4 == 3:
+                self.clock.advance(10)
+                expected = []
+            self.assertEqual(self.sample.get_snapshot().get_values(),
+                             expected)
+        self.assertEqual(len(self.sample.values), capacity)
+
+    def test_update_many_across_the_end_of_the_ring(self):
+        capacity = SlidingTimeWindowSample.MIN_CAPACITY
+        self.sample.update_many(xrange(capacity - 2))
+        self.clock.advance(5)
+        self.sample.update_many(xrange(100, 102))
+        self.clock.advance(5)
+        self.sample.update_many(xrange(200, 210))
+        self.assertEqual(len(self.sample.values), capacity)
+        self.assertEqual(self.sample.get_snapshot().get_values(),
+                         [100, 101] + list(xrange(200, 210)))
+
+    @skipIf(numpy is None, "NumPy is not installed")
+    def test_update_many_with_a_numpy_array(self):
+        self.sample.update_many(numpy.arange(50))
+        self.assertEqual(self.sample.get_snapshot().get_values(),
+                         list(xrange(50)))
+
+    def test_snapshots_are_reused_until_a_value_is_added_or_evicted(self):
+        self.sample.update(1)
+        snapshot = self.sample.get_snapshot()
+        self.assertIs(self.sample.get_snapshot(), snapshot)
+
+        self.clock.advance(5)
+        self.sample.update(2)
+        snapshot = self.sample.get_snapshot()
+        self.assertEqual(snapshot.get_values(), [1, 2])
+
+        self.clock.advance(5)
+        self.assertIsNot(self.sample.get_snapshot(), snapshot)
+        self.assertEqual(self.sample.get_snapshot().get_values(), [2])
+
+        self.sample.clear()
+        self.assertEqual(self.sample.count, 0)
+        self.assertEqual(self.sample.get_snapshot().size(), 0)
+
+    def test_merge_interleaves_the_values_by_time(self):
+        other = SlidingTimeWindowSample(10, self.clock)
+        for i in xrange(12):
+            (self.sample if i % 2 else other).update(i)
+            self.clock.advance(1)
+        self.sample.merge(other)
+
+        self.assertEqual(self.sample.count, 12)
+        self.assertEqual(self.sample.get_snapshot().get_values(),
+                         list(xrange(3, 12)))
+        self.sample.update(12)
+        self.assertEqual(self.sample.get_snapshot().get_values()[-1], 12)
+
+    def test_histogram(self):
+        histogram = Histogram.get_sliding_time_window(10, self.clock)
+        histogram.update(3)
+        self.clock.advance(10)
+        histogram.update(5)
+        self.assertIsInstance(histogram.sample, SlidingTimeWindowSample)
+        self.assertEqual(histogram.get_count(), 2)
+        self.assertEqual(histogram.get_snapshot().get_values(), [5])
@@ -0,0 +1,84 @@
+from __future__ import division, absolute_import
+
+from unittest2 import TestCase, skipIf
+
+from yunomi.compat import xrange, numpy
+from yunomi.core.histogram import Histogram
+from yunomi.stats.sliding_window_sample import SlidingWindowSample
+
+
+class SlidingWindowSampleTests(TestCase):
+
+    def test_keeps_everything_until_it_is_full(self):
+        sample = SlidingWindowSample(100)
+        for i in xrange(10):
+            sample.update(i)
+        self.assertEqual(sample.size(), 10)
+        self.assertEqual(sample.get_snapshot().get_values(), list(xrange(10)))
+
+    def test_keeps_the_last_n_values(self):
+        sample = SlidingWindowSample(100)
+        for i in xrange(1000):
+            sample.update(i)
+        self.assertEqual(sample.count, 1000)
+        self.assertEqual(sample.size(), 100)
+        self.assertEqual(sample.get_snapshot().get_values(),
+                         list(xrange(900, 1000)))
+
+    def test_update_many_is_update_in_a_loop(self):
+        for batches in ([7, 93, 1, 250, 3, 99], [1000], [50, 60, 70]):
+            looped, batched = SlidingWindowSample(100), SlidingWindowSample(100)
+            start = 0
+            for n in batches:
+                values = list(xrange(start, start + n))
+                start += n
+                for value in values:
+                    looped.update(value)
+                batched.update_many(values)
+                self.assertEqual(batched.count, looped.count)
+                self.assertEqual(batched.get_snapshot().get_values(),
+                                 looped.get_snapshot().get_values())
+
+    @skipIf(numpy is None, "NumPy is not installed")
+    def test_update_many_with_a_numpy_array(self):
+        sample = SlidingWindowSample(100)
+        sample.update_many(numpy.arange(30))
+        sample.update_many(numpy.arange(30, 1000))
+        self.assertEqual(sample.get_snapshot().get_values(),
+                         list(xrange(900, 1000)))
+
+    def test_snapshots_are_reused_until_the_next_update(self):
+        sample = SlidingWindowSample(2)
+        sample.update(1)
+        snapshot = sample.get_snapshot()
+        self.assertIs(sample.get_snapshot(), snapshot)
+
+        sample.update(2)
+        sample.update(3)
+        self.assertIsNot(sample.get_snapshot(), snapshot)
+        self.assertEqual(sample.get_snapshot().get_values(), [2, 3])
+
+        sample.clear()
+        self.assertEqual(sample.count, 0)
+        self.assertEqual(sample.get_snapshot().size(), 0)
+
+    def test_merge_keeps_the_most_recent_values_of_each(self):
+        sample, other = SlidingWindowSample(10), SlidingWindowSample(10)
+        sample.update_many(xrange(25))
+        other.update_many(xrange(100, 125))
+        sample.merge(other)
+
+        self.assertEqual(sample.count, 50)
+        self.assertEqual(sample.get_snapshot().get_values(),
+                         [20, 21, 22, 23, 24, 120, 121, 122, 123, 124])
+        sample.update(7)
+        self.assertEqual(sample.get_snapshot().get_values(),
+                         [7, 21, 22, 23, 24, 120, 121, 122, 123, 124])
+
+    def test_histogram(self):
+        histogram = Histogram.get_sliding_window(10)
+        histogram.update_many(xrange(100))
+        self.assertIsInstance(histogram.sample, SlidingWindowSample)
+        self.assertEqual(histogram.get_count(), 100)
+        self.assertEqual(histogram.get_snapshot().get_values(),
+                         list(xrange(90, 100)))
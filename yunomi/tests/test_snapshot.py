@@ -1,8 +1,11 @@
 from __future__ import division, absolute_import
 
+from random import Random
+
 from unittest2 import TestCase
 
-from yunomi.stats.snapshot import Snapshot
+from yunomi.compat import xrange
+from yunomi.stats.snapshot import BucketSnapshot, Snapshot
 
 
 class SnapshotTests(TestCase):
@@ -32,3 +35,51 @@ class SnapshotTests(TestCase):
 
     def test_has_a_size(self):
         self.assertEquals(self.snapshot.size(), 5)
+
+    def test_a_single_high_quantile_does_not_sort(self):
+        random = Random(42)
+        values = [random.random() for i in xrange(1028)]
+        expected = Snapshot(values)
+        expected.get_values()
+
+        for quantile in (0.0, 0.01, 0.98, 0.99, 0.999, 1.0):
+            snapshot = Snapshot(values)
+            self.assertEqual(snapshot.get_value(quantile),
+                             expected.get_value(quantile))
+            self.assertFalse(snapshot._sorted)
+
+    def test_several_quantiles_sort_once(self):
+        values = [5, 1, 2, 3, 4] * 20
+        snapshot = Snapshot(values)
+        self.assertAlmostEqual(snapshot.get_99th_percentile(), 5)
+        self.assertFalse(snapshot._sorted)
+        self.assertAlmostEqual(snapshot.get_median(), 3)
+        self.assertTrue(snapshot._sorted)
+        self.assertAlmostEqual(snapshot.get_99th_percentile(), 5)
+
+    def test_does_not_change_the_given_values(self):
+        values = [5, 1, 2, 3, 4]
+        Snapshot(values).get_values()
+        self.assertEqual(values, [5, 1, 2, 3, 4])
+
+
+class BucketSnapshotTests(TestCase):
+    def setUp(self):
+        self.snapshot = BucketSnapshot([(1, 1), (2, 0), (3, 2), (4, 1), (5, 1)])
+        self.sorted_snapshot = Snapshot([1, 3, 3, 4, 5])
+
+    def test_quantiles_match_a_snapshot_of_the_same_values(self):
+        for quantile in (0.0, 0.1, 0.3, 0.5, 0.75, 0.98, 1.0):
+            self.assertAlmostEqual(self.snapshot.get_value(quantile),
+                                   self.sorted_snapshot.get_value(quantile))
+
+    def test_has_values(self):
+        self.assertEqual(self.snapshot.get_values(), [1, 3, 3, 4, 5])
+
+    def test_has_a_size(self):
+        self.assertEqual(self.snapshot.size(), 5)
+
+    def test_an_empty_snapshot(self):
+        snapshot = BucketSnapshot([])
+        self.assertEqual(snapshot.size(), 0)
+        self.assertAlmostEqual(snapshot.get_median(), 0.0)
@@ -0,0 +1,82 @@
+from __future__ import division, absolute_import
+
+from threading import Event
+
+import mock
+from unittest2 import TestCase
+
+from yunomi.core.meter import Meter
+from yunomi.core.metrics_registry import MetricsRegistry
+from yunomi.stats.ewma import EWMA
+from yunomi.stats.tick_scheduler import TickScheduler
+from yunomi.tests.util import Clock
+
+
+class TickSchedulerTests(TestCase):
+
+    def setUp(self):
+        self.twisted_clock = Clock()
+        self.scheduler = TickScheduler(clock=self.twisted_clock)
+
+    def test_ticks_all_registered_EWMAs(self):
+        ewma_clock = mock.Mock(wraps=self.twisted_clock)
+        ewmas = [EWMA.one_minute_EWMA(ewma_clock),
+                 EWMA.five_minute_EWMA(ewma_clock)]
+        for ewma in ewmas:
+            self.scheduler.register(ewma)
+            ewma.update(3)
+        ewma_clock.reset_mock()
+
+        self.twisted_clock.advance(5)
+        self.scheduler.tick()
+
+        for ewma in ewmas:
+            self.assertAlmostEqual(ewma.get_rate(), 0.6)
+        self.assertFalse(ewma_clock.nanoseconds.called)
+
+    def test_scheduled_EWMAs_do_not_tick_when_read(self):
+        ewma = EWMA.one_minute_EWMA(self.twisted_clock)
+        self.scheduler.register(ewma)
+        ewma.update(3)
+        self.twisted_clock.advance(60)
+
+        self.assertAlmostEqual(ewma.get_rate(), 0.0)
+
+    def test_unregistered_EWMAs_tick_when_read(self):
+        ewma = EWMA.one_minute_EWMA(self.twisted_clock)
+        self.scheduler.register(ewma)
+        self.scheduler.unregister(ewma)
+        ewma.update(3)
+
+        self.twisted_clock.advance(5)
+        self.scheduler.tick()
+
+        self.assertAlmostEqual(ewma.get_rate(), 0.6)
+
+    def test_meters_register_their_rates(self):
+        meter = Meter("test", self.scheduler)
+        rates = (meter._m1_rate, meter._m5_rate, meter._m15_rate)
+        for rate in rates:
+            self.assertTrue(rate.scheduled)
+
+        meter.clear()
+        for rate in (meter._m1_rate, meter._m5_rate, meter._m15_rate):
+            self.assertTrue(rate.scheduled)
+            self.assertNotIn(rate, rates)
+
+    def test_registry_passes_the_scheduler_down(self):
+        registry = MetricsRegistry(scheduler=self.scheduler)
+        self.assertIs(registry.meter("meter").scheduler, self.scheduler)
+        self.assertIs(registry.timer("timer").meter.scheduler, self.scheduler)
+
+    def test_start_ticks_from_a_thread(self):
+        ticked = Event()
+        scheduler = TickScheduler(interval=0.01)
+        scheduler.tick = ticked.set
+        scheduler.start()
+        try:
+            ticked.wait(5)
+            self.assertTrue(ticked.is_set())
+        finally:
+            scheduler.stop()
+        self.assertIsNone(scheduler._thread)
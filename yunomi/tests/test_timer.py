@@ -3,12 +3,14 @@ from __future__ import division, absolute_import
 from unittest2 import TestCase
 
 from yunomi.core.timer import Timer
+from yunomi.tests.util import Clock
 
 
 class TimerTests(TestCase):
 
     def setUp(self):
-        self.timer = Timer()
+        self.clock = Clock()
+        self.timer = Timer(clock=self.clock)
 
     def test_blank_timer(self):
         self.assertEqual(self.timer.get_count(), 0)
@@ -54,3 +56,46 @@ class TimerTests(TestCase):
         self.timer.update(9223372036854775807)
         self.timer.update(0)
         self.assertAlmostEqual(self.timer.get_std_dev(), 6521908912666392000)
+
+    def test_update_many(self):
+        self.timer.update_many([10, 20, -5, 20, 30, 40])
+
+        self.assertEqual(self.timer.get_count(), 5)
+        self.assertEqual(self.timer.meter.get_count(), 5)
+        self.assertAlmostEqual(self.timer.get_mean(), 24.0)
+        self.assertAlmostEqual(self.timer.get_std_dev(), 11.401, places=2)
+        self.assertEqual(self.timer.get_snapshot().get_values(),
+                         [10.0, 20.0, 20.0, 30.0, 40.0])
+
+    def test_timing_a_block(self):
+        with self.timer.time():
+            self.clock.advance(1.5)
+
+        self.assertEqual(self.timer.get_count(), 1)
+        self.assertEqual(self.timer.get_max(), 1500000000)
+
+    def test_timing_a_block_which_raises(self):
+        def fail():
+            with self.timer.time():
+                self.clock.advance(1.0)
+                raise ValueError()
+
+        self.assertRaises(ValueError, fail)
+        self.assertEqual(self.timer.get_max(), 1000000000)
+
+    def test_get_snapshot_and_reset(self):
+        self.timer.update(10)
+        self.timer.update(30)
+        self.clock.advance(1)
+        interval = self.timer.get_snapshot_and_reset()
+
+        self.assertEqual(interval.get_count(), 2)
+        self.assertEqual(interval.get_mean(), 20)
+        self.assertEqual(interval.get_snapshot().get_values(), [10, 30])
+        self.assertEqual(self.timer.get_count(), 0)
+        self.assertEqual(self.timer.get_snapshot().size(), 0)
+        self.assertEqual(self.timer.meter.get_count(), 0)
+
+        self.timer.update(5)
+        self.assertEqual(self.timer.get_max(), 5)
+        self.assertEqual(interval.get_max(), 30)
@@ -1,9 +1,9 @@
 from __future__ import division, absolute_import
 
-from unittest2 import TestCase
+from unittest2 import TestCase, skipIf
 
-from yunomi.compat import xrange
-from yunomi.stats.uniform_sample import UniformSample
+from yunomi.compat import xrange, numpy
+from yunomi.stats.uniform_sample import UniformSample, merge_shares
 
 
 class UniformSampleTests(TestCase):
@@ -19,3 +19,74 @@ class UniformSampleTests(TestCase):
 
         for i in snapshot.get_values():
             self.assertTrue(i < 1000 and i >= 0)
+
+    def test_update_many_of_100_out_of_1000_elements(self):
+        sample = UniformSample(100)
+        sample.update_many(xrange(50))
+        sample.update_many(xrange(50, 1000))
+
+        self.assertEqual(sample.count, 1000)
+        self.assertEqual(sample.size(), 100)
+        values = sample.get_snapshot().get_values()
+        self.assertEqual(len(values), 100)
+        for i in values:
+            self.assertTrue(i < 1000 and i >= 0)
+
+    def test_update_many_keeps_everything_until_the_reservoir_is_full(self):
+        sample = UniformSample(100)
+        sample.update_many(xrange(10))
+        sample.update_many(xrange(10, 20))
+        self.assertEqual(sample.get_snapshot().get_values(), list(xrange(20)))
+
+    @skipIf(numpy is None, "NumPy is not installed")
+    def test_update_many_with_a_numpy_array(self):
+        sample = UniformSample(100)
+        sample.update_many(numpy.arange(1000))
+
+        self.assertEqual(sample.size(), 100)
+        for i in sample.get_snapshot().get_values():
+            self.assertIsInstance(i, float)
+            self.assertTrue(i < 1000 and i >= 0)
+
+    def test_snapshots_are_reused_until_the_next_update(self):
+        sample = UniformSample(100)
+        sample.update(1)
+        snapshot = sample.get_snapshot()
+        self.assertIs(sample.get_snapshot(), snapshot)
+
+        sample.update(2)
+        self.assertIsNot(sample.get_snapshot(), snapshot)
+        self.assertEqual(sample.get_snapshot().get_values(), [1, 2])
+
+        sample.clear()
+        self.assertEqual(sample.get_snapshot().size(), 0)
+
+    def test_merge_keeps_everything_when_it_fits(self):
+        sample, other = UniformSample(100), UniformSample(100)
+        sample.update_many(xrange(30))
+        other.update_many(xrange(30, 70))
+        sample.merge(other)
+
+        self.assertEqual(sample.count, 70)
+        self.assertEqual(sorted(sample.get_snapshot().get_values()),
+                         list(xrange(70)))
+        self.assertEqual(other.count, 40)
+
+    def test_merge_takes_a_share_of_each_reservoir_by_count(self):
+        sample, other = UniformSample(100), UniformSample(100)
+        sample.update_many(xrange(100))
+        other.update_many(xrange(1000, 1900))
+        sample.merge(other)
+
+        values = sample.get_snapshot().get_values()
+        self.assertEqual(sample.count, 1000)
+        self.assertEqual(len(values), 100)
+        self.assertEqual(len([value for value in values if value < 1000]), 10)
+
+    def test_merge_shares(self):
+        self.assertEqual(merge_shares(100, 100, 100, 100, 900), (10, 90))
+        self.assertEqual(merge_shares(100, 20, 20, 30, 30), (20, 30))
+        # A reservoir of 10 values standing for 1000 can only make up 10% of
+        # the merged reservoir, so it shrinks.
+        self.assertEqual(merge_shares(100, 10, 1000, 100, 100), (10, 1))
+        self.assertEqual(merge_shares(100, 0, 0, 0, 0), (0, 0))
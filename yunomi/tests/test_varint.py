@@ -0,0 +1,42 @@
+from __future__ import division, absolute_import
+
+from unittest2 import TestCase
+
+from yunomi.stats.varint import (decode_varint, decode_varints,
+                                 encode_varint, unzigzag, zigzag)
+
+
+class VarintTests(TestCase):
+
+    def test_round_trip(self):
+        buf = bytearray()
+        numbers = [0, 1, 127, 128, 300, 2 ** 32, 2 ** 70]
+        for n in numbers:
+            encode_varint(buf, n)
+
+        offset = 0
+        for n in numbers:
+            decoded, offset = decode_varint(buf, offset)
+            self.assertEqual(decoded, n)
+        self.assertEqual(offset, len(buf))
+
+    def test_decode_a_run(self):
+        buf = bytearray(b"x")
+        numbers = [5, 0, 300, 2 ** 40, 127, 128]
+        for n in numbers:
+            encode_varint(buf, n)
+        encode_varint(buf, 9)
+
+        self.assertEqual(decode_varints(buf, 1, len(numbers)),
+                         (numbers, len(buf) - 1))
+        self.assertEqual(decode_varints(buf, 1, 0), ([], 1))
+
+    def test_small_numbers_take_one_byte(self):
+        buf = bytearray()
+        encode_varint(buf, 127)
+        self.assertEqual(buf, bytearray([127]))
+
+    def test_zigzag(self):
+        for n, expected in ((0, 0), (-1, 1), (1, 2), (-2, 3), (2, 4)):
+            self.assertEqual(zigzag(n), expected)
+            self.assertEqual(unzigzag(expected), n)
@@ -16,6 +16,15 @@ class Clock(object):
         """
         return self.rightNow
 
+    def nanoseconds(self):
+        """
+        Pretend to be a L{yunomi.clock.MonotonicClock}.
+
+        @rtype: C{int}
+        @return: The current time in nanoseconds.
+        """
+        return int(round(self.rightNow * 1000000000))
+
     def advance(self, amount):
         """
         Move time on this clock forward by the given amount.